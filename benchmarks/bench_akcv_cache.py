@@ -0,0 +1,64 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Rotated exciton coefficients needed by exciton_phonon_matelem for nQ exciton
+momenta and all the Q+q points, computed at each call (previous implementation,
+with the Lin database re-read for every Q) and with an AkcvCache.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_akcv_cache.py [nQ] [nexcitons]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from yambopy.dbs.wfdb import YamboWFDB
+from yambopy.dbs.excitondb import YamboExcitonQDBs
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+from yambopy.dbs.tests.excitondb_synthetic import write_bs_diago
+from yambopy.exciton_phonon.excph_matrix_elements import rotate_Akcv_Q, AkcvCache
+
+def sweep(wfdb, exdbs, Dmats, nQ, lin, cache=None):
+    for Q_in in wfdb.kBZ[:nQ]:
+        rotate_Akcv_Q(wfdb, exdbs, Q_in, Dmats, folder=lin, cache=cache)
+        for q in wfdb.kBZ:
+            rotate_Akcv_Q(wfdb, exdbs, Q_in + q, Dmats, cache=cache)
+
+def main(nQ=4, nexcitons=20):
+    tmp_path = tempfile.mkdtemp()
+    try:
+        make_synthetic_save(os.path.join(tmp_path,'SAVE'),nbands=8)
+        wfdb = YamboWFDB(path=tmp_path,bands_range=[2,8])
+        k,v,c = np.meshgrid(np.arange(1,wfdb.nkBZ+1),[3,4,5],[6,7,8],indexing='ij')
+        table = np.stack([k.ravel(),v.ravel(),c.ravel(),np.ones(k.size),np.ones(k.size)],axis=1)
+        rng = np.random.default_rng(0)
+        for folder in ['bse','lin']:
+            os.makedirs(os.path.join(tmp_path,folder))
+            for iq in range(wfdb.nkpoints):
+                eivecs = rng.normal(size=(nexcitons,len(table)))+0j
+                write_bs_diago(os.path.join(tmp_path,folder,'ndb.BS_diago_Q%d'%(iq+1)),table,eivecs,np.linspace(1,2,nexcitons))
+        exdbs = YamboExcitonQDBs.from_folder(wfdb.ydb,folder=os.path.join(tmp_path,'bse'))
+        Dmats = wfdb.Dmat()
+        lin = os.path.join(tmp_path,'lin')
+        print(f"{nQ} Q-points x {wfdb.nkBZ} q-points, {nexcitons} excitons")
+
+        start = time.perf_counter()
+        sweep(wfdb, exdbs, Dmats, nQ, lin)
+        print(f"no cache : {time.perf_counter()-start:8.3f} s")
+        for maxsize in [wfdb.nkBZ//2, wfdb.nkBZ+1]:
+            cache = AkcvCache(maxsize=maxsize)
+            start = time.perf_counter()
+            sweep(wfdb, exdbs, Dmats, nQ, lin, cache=cache)
+            print(f"maxsize {maxsize:3d}: {time.perf_counter()-start:8.3f} s  {cache}")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,63 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Time and peak memory (numpy allocations, via tracemalloc) of reading a synthetic
+ndb.BS_diago file and building Akcv: full read + get_Akcv (previous behaviour),
+full read + get_Akcv(inplace=True), and a subset of excitons read lazily.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_exciton_partial_read.py [nkpoints] [nexcitons]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import numpy as np
+from yambopy.dbs.excitondb import YamboExcitonDB
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.tests.excitondb_synthetic import write_bs_diago
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = func()
+    elapsed = time.perf_counter()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, res
+
+def main(nkpoints=2000, nexcitons=200, nv=4, nc=4):
+    lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'bse','SAVE','ns.db1'),cache=False)
+    rng = np.random.default_rng(0)
+    k,v,c = np.meshgrid(np.arange(1,nkpoints+1),np.arange(1,nv+1),np.arange(nv+1,nv+nc+1),indexing='ij')
+    table = np.stack([k.ravel(),v.ravel(),c.ravel(),np.ones(k.size),np.ones(k.size)],axis=1).astype(int)[rng.permutation(k.size)]
+    eivecs = rng.normal(size=(nexcitons,len(table)))+1j*rng.normal(size=(nexcitons,len(table)))
+    selected = list(range(1,nexcitons+1,10))
+
+    tmp_path = tempfile.mkdtemp()
+    try:
+        write_bs_diago(os.path.join(tmp_path,'ndb.BS_diago_Q1'),table,eivecs,np.linspace(1,2,nexcitons))
+        print(f"{len(table)} transitions, {nexcitons} excitons ({eivecs.nbytes/1024**2:.0f} MB), {len(selected)} selected")
+        tests = [('full + get_Akcv',          lambda: YamboExcitonDB.from_db_file(lat,folder=tmp_path).get_Akcv()),
+                 ('full + get_Akcv(inplace)', lambda: YamboExcitonDB.from_db_file(lat,folder=tmp_path).get_Akcv(inplace=True)),
+                 ('selected, lazy + get_Akcv',lambda: YamboExcitonDB.from_db_file(lat,folder=tmp_path,excitons=selected,lazy=True).get_Akcv())]
+        ref = None
+        for label, func in tests:
+            elapsed, peak, Akcv = measure(func)
+            if ref is None: ref = Akcv
+            assert np.array_equal(Akcv,ref[np.array(selected)-1] if len(Akcv) < len(ref) else ref)
+            print(f"{label:>26s}: {elapsed:8.3f} s, peak {peak/1024**2:8.1f} MB")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
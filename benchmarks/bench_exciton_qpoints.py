@@ -0,0 +1,56 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the serial reading of the ndb.BS_diago_Q* databases with YamboExcitonDB.from_db_file
+(previous implementation of ExcitonDispersion and exciton_phonon_matelem) with
+YamboExcitonQDBs.from_folder (concurrent, lazy eigenvectors), on synthetic databases.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_exciton_qpoints.py [nqpoints] [ntransitions]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.excitondb import YamboExcitonDB, YamboExcitonQDBs
+from yambopy.dbs.tests.excitondb_synthetic import write_bs_diago
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def main(nqpoints=16, ntransitions=1000):
+    lattice = YamboLatticeDB.from_db_file(os.path.join(refs_path,'bse','SAVE','ns.db1'))
+    rng = np.random.default_rng(0)
+    table = np.ones((ntransitions,5),dtype=int)
+    table[:,0] = np.arange(ntransitions)+1
+    eivecs = rng.normal(size=(ntransitions,ntransitions))+0j
+    tmp_path = tempfile.mkdtemp()
+    try:
+        for iq in range(nqpoints):
+            write_bs_diago(os.path.join(tmp_path,'ndb.BS_diago_Q%d'%(iq+1)),table,eivecs,np.sort(rng.uniform(1,3,ntransitions)))
+        print(f"{nqpoints} Q-points, {ntransitions} transitions ({eivecs.nbytes/1024**2:.0f} MB of eigenvectors per Q)")
+
+        start = time.perf_counter()
+        ref = np.array([YamboExcitonDB.from_db_file(lattice,filename='ndb.BS_diago_Q%d'%(iq+1),folder=tmp_path).eigenvalues
+                        for iq in range(nqpoints)])
+        print(f"serial from_db_file      : {time.perf_counter()-start:8.3f} s")
+        for label, kwargs in [('serial, lazy',          dict(workers=1)),
+                              ('4 threads, lazy',       dict(workers=4,executor='thread')),
+                              ('4 processes, lazy',     dict(workers=4,executor='process')),
+                              ('4 threads, eigenvectors',dict(workers=4,executor='thread',lazy=False))]:
+            start = time.perf_counter()
+            excdbs = YamboExcitonQDBs.from_folder(lattice,folder=tmp_path,**kwargs)
+            print(f"{label:>25s}: {time.perf_counter()-start:8.3f} s")
+            assert np.array_equal(ref,excdbs.eigenvalues)
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
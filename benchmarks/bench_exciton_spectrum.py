@@ -0,0 +1,52 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the dense (nexcitons x nenergies) sum of the excitonic Green's functions
+of get_chi (previous implementation) with the chunked and FFT paths of
+exciton_spectrum, for three broadenings.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_exciton_spectrum.py [nexcitons] [nenergies]
+"""
+import sys
+import time
+import numpy as np
+from yambopy.bse.exciton_spectrum import exciton_spectrum
+
+def dense_spectrum(w,energies,strengths,broad):
+    """ previous implementation of get_chi """
+    es = energies[:,None]
+    broad = broad[:,None]
+    G1 = -1/( w - es + broad*1j)
+    G2 = -1/(-w - es - broad*1j)
+    return np.einsum('s,sn->n',strengths,G1+G2)
+
+def main(nexcitons=20000, nenergies=2000):
+    rng = np.random.default_rng(0)
+    energies = rng.uniform(0.5,30,nexcitons)
+    strengths = rng.normal(size=nexcitons)+1j*rng.normal(size=nexcitons)
+    w = np.linspace(0,10,nenergies,endpoint=False)
+    broads = np.repeat([[0.05],[0.1],[0.2]],nexcitons,axis=1)
+    print(f"{nexcitons} excitons, {nenergies} energies, {len(broads)} broadenings")
+
+    start = time.perf_counter()
+    ref = np.array([dense_spectrum(w,energies,strengths,broad) for broad in broads])
+    t_dense = time.perf_counter()-start
+    start = time.perf_counter()
+    direct = exciton_spectrum(w,energies,strengths,broads)
+    t_direct = time.perf_counter()-start
+    start = time.perf_counter()
+    fft = exciton_spectrum(w,energies,strengths,broads,method='fft')
+    t_fft = time.perf_counter()-start
+
+    print(f"dense   : {t_dense:8.3f} s ({nexcitons*nenergies*16/1024**2:.0f} MB per Green's function)")
+    print(f"chunked : {t_direct:8.3f} s  max rel. error {np.abs(direct-ref).max()/np.abs(ref).max():.1e}")
+    print(f"fft     : {t_fft:8.3f} s  max rel. error {np.abs(fft-ref).max()/np.abs(ref).max():.1e}")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
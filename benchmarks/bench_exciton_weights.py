@@ -0,0 +1,62 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the exciton weights on the (k, band) grid computed with the previous
+loop over the rows of BS_TABLE and with YamboExcitonDB.get_exciton_projection,
+on a synthetic BSE table.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_exciton_weights.py [nkpoints] [nexcitons]
+"""
+import os
+import sys
+import time
+import numpy as np
+from yambopy.tools.funcs import abs2
+from yambopy.dbs.excitondb import YamboExcitonDB
+from yambopy.dbs.latticedb import YamboLatticeDB
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def weights_loop(exc, excitons):
+    """ previous get_exciton_weights """
+    weights = np.zeros([exc.nkpoints,exc.mband])
+    for exciton in excitons:
+        eivec = exc.eigenvectors[exciton-1]
+        for t,kcv in enumerate(exc.table):
+            k,c,v = kcv[0:3]-1
+            this_weight = abs2(eivec[t])
+            weights[k,c] += this_weight
+            weights[k,v] += this_weight
+    return weights
+
+def main(nkpoints=3000, nexcitons=10, nv=4, nc=4):
+    lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'bse','SAVE','ns.db1'),cache=False)
+    rng = np.random.default_rng(0)
+    k,v,c = np.meshgrid(np.arange(1,nkpoints+1),np.arange(1,nv+1),np.arange(nv+1,nv+nc+1),indexing='ij')
+    table = np.stack([k.ravel(),v.ravel(),c.ravel(),np.ones(k.size,dtype=int),np.ones(k.size,dtype=int)],axis=1)
+    eivecs = (rng.normal(size=(nexcitons,len(table)))+1j*rng.normal(size=(nexcitons,len(table)))).astype(np.complex64)
+    eivecs /= np.linalg.norm(eivecs,axis=1)[:,None]
+    exc = YamboExcitonDB(lat,'1',np.arange(nexcitons)+0j,None,None,table=table,eigenvectors=eivecs)
+    excitons = list(range(1,nexcitons+1))
+    print(f"{len(table)} transitions, {nexcitons} excitons")
+
+    start = time.perf_counter()
+    ref = weights_loop(exc,excitons)
+    t_loop = time.perf_counter()-start
+
+    start = time.perf_counter()
+    weights = exc.get_exciton_weights(excitons)
+    t_kernel = time.perf_counter()-start
+    assert np.allclose(weights,ref,atol=1e-6)
+
+    print(f"loop over BS_TABLE     : {t_loop:8.3f} s")
+    print(f"get_exciton_projection : {t_kernel:8.3f} s")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
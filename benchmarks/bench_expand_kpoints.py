@@ -0,0 +1,79 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the Brillouin zone expansion of kpoints.expand_kpoints with the previous
+loop over (kpoint, symmetry) pairs, and check that both give the same results.
+
+Meshes: 96x96x1 (hexagonal 2D lattice) and 24x24x24 (fcc lattice). The IBZ is taken from spglib.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_expand_kpoints.py
+"""
+import time
+import numpy as np
+import spglib
+from yambopy.lattice import car_red, vec_in_list, rec_lat
+from yambopy.kpoints import expand_kpoints
+
+def expand_kpoints_loop(car_kpoints,sym_car,rlat,atol=1.e-6):
+    """ previous kpoints.expand_kpoints """
+    kpoints_indexes  = []
+    kpoints_full     = []
+    symmetry_indexes = []
+    kpoints_full_i = {}
+    for nk,k in enumerate(car_kpoints):
+        if nk not in kpoints_full_i:
+            kpoints_full_i[nk] = []
+        for ns,sym in enumerate(sym_car):
+            new_k = np.dot(sym,k)
+            k_red = car_red([new_k],rlat)[0]
+            k_red[np.abs(k_red) < atol] = 0.
+            k_bz = (k_red+atol)%1
+            if not vec_in_list(k_bz,kpoints_full_i[nk],atol=atol):
+                kpoints_full_i[nk].append(k_bz)
+                kpoints_full.append(new_k)
+                kpoints_indexes.append(nk)
+                symmetry_indexes.append(ns)
+    nkpoints_full = len(kpoints_full)
+    weights = np.zeros([nkpoints_full])
+    for nk in kpoints_full_i:
+        weights[nk] = float(len(kpoints_full_i[nk]))/nkpoints_full
+    return np.array(weights), np.array(kpoints_indexes), np.array(symmetry_indexes), np.array(kpoints_full)
+
+def ibz_mesh(lat, positions, numbers, mesh):
+    """ IBZ kpoints (Cartesian), symmetries (Cartesian) and reciprocal lattice from spglib """
+    cell = (lat, positions, numbers)
+    rotations = spglib.get_symmetry(cell)['rotations']
+    sym_car = np.array([lat.T @ rot @ np.linalg.inv(lat.T) for rot in rotations])
+    mapping, grid = spglib.get_ir_reciprocal_mesh(mesh, cell, is_shift=[0,0,0], is_time_reversal=False)
+    rlat = rec_lat(lat)
+    k_red = grid[np.unique(mapping)]/np.array(mesh)
+    return k_red @ rlat, sym_car, rlat
+
+def main():
+    hexagonal = np.array([[1.0,0.0,0.0],[-0.5,np.sqrt(3)/2,0.0],[0.0,0.0,8.0]])
+    fcc = 0.5*np.array([[0.0,1.0,1.0],[1.0,0.0,1.0],[1.0,1.0,0.0]])
+    systems = [('96x96x1  hexagonal', hexagonal, [[1/3,2/3,0.5],[2/3,1/3,0.5]], [6,6], [96,96,1]),
+               ('24x24x24 fcc      ', fcc, [[0,0,0],[0.25,0.25,0.25]], [14,14], [24,24,24])]
+    for label, lat, positions, numbers, mesh in systems:
+        car_kpoints, sym_car, rlat = ibz_mesh(lat, positions, numbers, mesh)
+
+        start = time.perf_counter()
+        ref = expand_kpoints_loop(car_kpoints, sym_car, rlat)
+        t_loop = time.perf_counter() - start
+        start = time.perf_counter()
+        res = expand_kpoints(car_kpoints, sym_car, rlat)
+        t_vec = time.perf_counter() - start
+
+        for a, b in zip(ref[:3], res[:3]): assert np.array_equal(a, b)
+        assert np.allclose(ref[3], res[3])
+        print(f"{label}: {len(car_kpoints):6d} -> {len(res[3]):6d} kpoints, {len(sym_car):2d} symmetries | "
+              f"loop {t_loop:8.3f} s | vectorised {t_vec:8.4f} s | x{t_loop/t_vec:.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare time and peak memory of kpoints.find_kpatch with the previous
+implementation (dense nk x 343 array of differences), for one centre and
+for a batch of centres.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_find_kpatch.py [nk] [ncentres]
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from yambopy.kpoints import find_kpatch
+
+def find_kpatch_dense(kpts, kcentre, kdist, lat_vecs):
+    """ previous find_kpatch """
+    blat = 2*np.pi*np.linalg.inv(lat_vecs)
+    kdiff = kpts-kcentre[None,:]
+    kdiff = kdiff-np.floor(kdiff)
+    tmp_arr = np.array([-3, -2, -1, 0, 1, 2, 3])
+    nG0 = len(tmp_arr)
+    G0 = np.zeros((nG0,nG0,nG0,3))
+    G0[...,0], G0[...,1], G0[...,2] = np.meshgrid(tmp_arr, tmp_arr, tmp_arr, indexing='ij')
+    G0 = G0.reshape(-1,3)
+    kdiff = kdiff[:,None,:]-G0[None,:,:]
+    kdiff = kdiff.reshape(-1,3)@blat
+    kdiff = np.linalg.norm(kdiff,axis=-1).reshape(len(kpts),-1)
+    kdiff = np.min(kdiff,axis=-1)
+    return np.where(kdiff <= kdist)[0]
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = func()
+    elapsed = time.perf_counter()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, res
+
+def main(nk=100000, ncentres=10):
+    rng = np.random.default_rng(0)
+    lat_vecs = np.array([[1.,-0.5,0.],[0.,np.sqrt(3)/2,0.],[0.,0.,4.]]).T*6
+    kpts = rng.random((nk,3))
+    centres = rng.random((ncentres,3))
+    kdist = 0.2
+    print(f"{nk} kpoints, {ncentres} centres, kdist = {kdist} 1/bohr")
+
+    t_dense, m_dense, ref = measure(lambda: [find_kpatch_dense(kpts,c,kdist,lat_vecs) for c in centres])
+    t_single, m_single, res1 = measure(lambda: [find_kpatch(kpts,c,kdist,lat_vecs) for c in centres])
+    t_batch, m_batch, res2 = measure(lambda: find_kpatch(kpts,centres,kdist,lat_vecs))
+    for a,b,c in zip(ref,res1,res2): assert np.array_equal(a,b) and np.array_equal(a,c)
+
+    print(f"dense              : {t_dense:8.3f} s {m_dense/1e6:10.1f} MB")
+    print(f"tree (per centre)  : {t_single:8.3f} s {m_single/1e6:10.1f} MB")
+    print(f"tree (batch)       : {t_batch:8.3f} s {m_batch/1e6:10.1f} MB")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,64 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare kpoints.get_path with the previous (kpoint, image) loop on a dense
+hexagonal mesh, and check that both give the same kpoints along the path.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_get_path.py [nk]
+"""
+import sys
+import time
+import numpy as np
+from itertools import product
+from qepy.lattice import Path
+from yambopy.lattice import red_car, isbetween
+from yambopy.kpoints import get_path, regular_grid
+
+def get_path_loop(car_kpoints,rlat,path):
+    """ previous get_path (kpoints already expanded) """
+    kpts_path_car = red_car(path.kpoints, rlat)
+    bands_kpoints, bands_indexes = [], []
+    for k in range(len(path.kpoints)-1):
+        kpoints_in_path = {}
+        start_kpt, end_kpt = kpts_path_car[k], kpts_path_car[k+1]
+        for x,y,z in product(list(range(-1,2)),list(range(-1,2)),list(range(1))):
+            shift = red_car([np.array([x,y,z])],rlat)[0]
+            for index, kpt in enumerate(car_kpoints):
+                kpt_shift = kpt+shift
+                if isbetween(start_kpt,end_kpt,kpt_shift):
+                    key = tuple([round(kpt,4) for kpt in kpt_shift])
+                    kpoints_in_path[key] = [ index, np.linalg.norm(start_kpt-kpt_shift), kpt_shift ]
+        for index, disp, kpt in sorted(list(kpoints_in_path.values()),key=lambda i: i[1]):
+            bands_kpoints.append( kpt )
+            bands_indexes.append( index )
+    return bands_kpoints, bands_indexes
+
+def main(nk=60):
+    rlat = np.array([[1.,1/np.sqrt(3),0.],[0.,2/np.sqrt(3),0.],[0.,0.,0.2]])
+    car_kpoints = red_car(regular_grid(nk,nk,1),rlat)
+    path = Path([ [[0.0,0.0,0.0],'G'],
+                  [[0.5,0.0,0.0],'M'],
+                  [[1/3,1/3,0.0],'K'],
+                  [[0.0,0.0,0.0],'G']], [20,20,20])
+    print(f"{nk}x{nk}x1 mesh, {len(car_kpoints)} kpoints")
+
+    start = time.perf_counter()
+    ref = get_path_loop(car_kpoints,rlat,path)
+    t_loop = time.perf_counter()-start
+
+    start = time.perf_counter()
+    res = get_path(car_kpoints,rlat,None,path)
+    t_vec = time.perf_counter()-start
+
+    assert ref[1] == res[1] and np.allclose(ref[0],res[0])
+    print(f"loop       : {t_loop:8.3f} s")
+    print(f"vectorised : {t_vec:8.3f} s")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,53 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the G-vector matching of wfc_inner_product with a KDTree built at
+every call (previous implementation) and with the cached GvecIndex.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_gvec_index.py [nbands]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from yambopy.dbs.wfdb import YamboWFDB, GvecIndex, wfc_inner_product, KDTree
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+
+def timeit(func, nrepeat=20):
+    start = time.perf_counter()
+    for i in range(nrepeat): res = func()
+    return (time.perf_counter()-start)/nrepeat, res
+
+def main(nbands=8):
+    tmp_path = tempfile.mkdtemp()
+    try:
+        make_synthetic_save(os.path.join(tmp_path,'SAVE'),nbands=nbands)
+        wfdb = YamboWFDB(path=tmp_path)
+
+        # bra: stored BZ wavefunction, ket: rotated wavefunction (as in Dmat)
+        kbra, wbra, gbra = wfdb.rotate_wfc(1,3)
+        kket, wket, gket = wfdb.apply_symm(kbra,wbra,gbra,False,np.eye(3))
+        print(f"{len(gbra)} G-vectors, {nbands} bands, KDTree from {KDTree.__module__}")
+
+        t_tree, ref = timeit(lambda: wfc_inner_product(kbra,wbra,gbra,kket,wket,gket,ket_Gtree=KDTree(gket)))
+        t_index, res1 = timeit(lambda: wfc_inner_product(kbra,wbra,gbra,kket,wket,gket))
+        bra_index = GvecIndex(gbra)
+        t_cached, res2 = timeit(lambda: wfc_inner_product(kbra,wbra,gbra,kket,wket,gket,bra_Gindex=bra_index))
+        assert np.allclose(ref,res1) and np.allclose(ref,res2)
+
+        print(f"KDTree per call    : {1e3*t_tree:8.3f} ms")
+        print(f"GvecIndex per call : {1e3*t_index:8.3f} ms")
+        print(f"cached GvecIndex   : {1e3*t_cached:8.3f} ms")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the IBZ reduction of kpoints.generate_kpoint_grid with the previous
+sequential search (QE kpoint_grid port), and check that both give the same xk/wk.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_kpoint_grid.py [nk]
+"""
+import sys
+import time
+import numpy as np
+import spglib
+from yambopy.kpoints import generate_kpoint_grid, regular_grid
+
+def kpoint_grid_loop(nk1,nk2,nk3,sym_and_trev,eps=1.0e-5):
+    """ previous generate_kpoint_grid (IBZ=True) """
+    Nk = nk1*nk2*nk3
+    wkk = np.ones(Nk)
+    equiv = np.arange(Nk)
+    sym_red, is_trev, is_sym_trev = sym_and_trev
+    xkg = regular_grid(nk1,nk2,nk3)
+    for ik in range(Nk):
+        if equiv[ik] != ik: continue
+        for i_s in range(len(sym_red)):
+            xkr = np.dot(sym_red[i_s,:,:], xkg[ik,:])
+            xkr -= np.round(xkr)
+            if is_sym_trev[i_s]: xkr = -xkr
+            for sign in ([1,-1] if is_trev else [1]):
+                xx, yy, zz = sign*xkr*[nk1,nk2,nk3]
+                if all( abs(v-round(v)) <= eps for v in [xx, yy, zz]):
+                    i,j,k = [(round(sign*xkr[dim]*nki + 2*nki) % nki) + 1 for dim, nki in enumerate([nk1, nk2, nk3])]
+                    n = (k-1) + (j-1)*nk3 + (i-1)*nk2*nk3
+                    if n > ik and equiv[n] == n:
+                        equiv[n] = ik
+                        wkk[ik] += 1.0
+                    elif equiv[n] != ik or n < ik:
+                        raise ValueError("Error in the checking algorithm")
+    unique_kpoints = (equiv == np.arange(Nk))
+    xk = xkg[unique_kpoints,:] - np.round(xkg[unique_kpoints,:])
+    wk = wkk[unique_kpoints] / np.sum(wkk[unique_kpoints])
+    return len(xk), xk, wk
+
+def main(nk=100):
+    lat = np.array([[1.0,0.0,0.0],[-0.5,np.sqrt(3)/2,0.0],[0.0,0.0,8.0]])
+    cell = (lat, [[1/3,2/3,0.5],[2/3,1/3,0.5]], [6,6])
+    rotations = spglib.get_symmetry(cell)['rotations']
+    # action on kpoints in crystal coordinates
+    sym_red = np.array([np.linalg.inv(rot).T for rot in rotations])
+    sym_and_trev = (sym_red, True, np.zeros(len(sym_red),dtype=bool))
+
+    start = time.perf_counter()
+    ref = kpoint_grid_loop(nk,nk,1,sym_and_trev)
+    t_loop = time.perf_counter() - start
+    start = time.perf_counter()
+    res = generate_kpoint_grid(nk,nk,1,sym_and_trev)
+    t_vec = time.perf_counter() - start
+    assert np.array_equal(ref[1],res[1]) and np.array_equal(ref[2],res[2])
+    print(f"{nk}x{nk}x1, {len(sym_red)} symmetries + time reversal: {res[0]} kpoints in the IBZ")
+    print(f"sequential : {t_loop:8.3f} s")
+    print(f"vectorised : {t_vec:8.4f} s")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Micro-benchmark of the derived properties of YamboLatticeDB (k_grid, sym_red,
+sym_rec_red, sym_rec, time_rev_list, car_kpoints, red_kpoints): previous per-element loops
+against the batched versions, on a dense mesh built from a reference database.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_latticedb_properties.py [nk]
+"""
+import os
+import sys
+import time
+import numpy as np
+from yambopy.kpoints import make_kpositive, regular_grid
+from yambopy.dbs.latticedb import YamboLatticeDB
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def car_red_loop(car,lat):
+    """ previous car_red """
+    return np.array([np.linalg.solve(np.array(lat).T,coord) for coord in car])
+
+def properties_loop(ydb):
+    """ previous implementation of the properties (no caching) """
+    nsym = len(ydb.sym_car)
+    car_kpoints = np.array([ k/ydb.alat for k in ydb.iku_kpoints ])
+    sym_red = np.zeros([nsym,3,3],dtype=int)
+    for n,s in enumerate(ydb.sym_car):
+        sym_red[n] = np.round(np.dot(np.dot(ydb.lat,s.T),np.linalg.inv(ydb.lat)))
+    sym_rec_red = np.zeros([nsym,3,3],dtype=int)
+    for n,s in enumerate(sym_red):
+        sym_rec_red[n] = np.linalg.inv(s).T
+    sym_rec = np.zeros([nsym,3,3])
+    for n,s in enumerate(ydb.sym_car):
+        sym_rec[n] = np.linalg.inv(s).T
+    time_rev_list = [False]*nsym
+    for i in range(nsym):
+        time_rev_list[i] = ( i >= nsym/(ydb.time_rev+1) )
+    red_kpoints = car_red_loop(car_kpoints,ydb.rlat)
+    kgrid = np.zeros(3,dtype=int)
+    small_q = np.full(3,1e4,dtype=float)
+    for idx in range(3):
+        for kpt in red_kpoints:
+            val = abs(kpt[idx])
+            if 1e-6 < val < small_q[idx]: small_q[idx] = val
+    kpos = make_kpositive(red_kpoints)
+    for idx in range(3):
+        for kpt in kpos:
+            n_grid = np.rint(kpt[idx]/small_q[idx])+1
+            if kgrid[idx] < n_grid: kgrid[idx] = n_grid
+    return kgrid, sym_red, sym_rec_red, sym_rec, time_rev_list, car_kpoints, red_kpoints
+
+def properties(ydb):
+    return ydb.k_grid, ydb.sym_red, ydb.sym_rec_red, ydb.sym_rec, ydb.time_rev_list, ydb.car_kpoints, ydb.red_kpoints
+
+def main(nk=60, nrepeat=1000):
+    ref = YamboLatticeDB.from_db_file(os.path.join(refs_path,'ip','SAVE','ns.db1'),Expand=False,cache=False)
+    iku_kpoints = (regular_grid(nk,nk,1) @ ref.rlat)*ref.alat
+    new_ydb = lambda: YamboLatticeDB(ref.lat,ref.alat,ref.sym_car,iku_kpoints,ref.car_atomic_positions,
+                                     ref.atomic_numbers,ref.time_rev)
+    print(f"{nk}x{nk}x1 mesh, {len(iku_kpoints)} kpoints, {len(ref.sym_car)} symmetries")
+
+    ydb = new_ydb()
+    start = time.perf_counter()
+    res_loop = properties_loop(ydb)
+    t_loop = time.perf_counter()-start
+
+    ydb = new_ydb()
+    start = time.perf_counter()
+    res = properties(ydb)
+    t_first = time.perf_counter()-start
+
+    start = time.perf_counter()
+    for i in range(nrepeat): properties(ydb)
+    t_cached = (time.perf_counter()-start)/nrepeat
+
+    for a,b in zip(res_loop,res): assert np.array_equal(a,b)
+    print(f"loop (every access) : {1e3*t_loop:10.3f} ms")
+    print(f"batched (first)     : {1e3*t_first:10.3f} ms")
+    print(f"cached access       : {1e3*t_cached:10.5f} ms")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,117 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Time the construction of SkwInterpolator on the IBZ of a dense hexagonal mesh,
+and compare each stage (R-stars, star functions, H matrix, coefficients) with
+the previous per-element loops.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_skw_fit.py [nk] [nband]
+"""
+import os
+import io
+import sys
+import time
+import itertools
+import contextlib
+import numpy as np
+from yambopy.tools.skw import SkwInterpolator, extract_point_group
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.kpoints import generate_kpoint_grid
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def rstars_loop(skw, rmax):
+    """ previous search of the R-points generating the stars (returns the generators) """
+    msize = (2 * rmax + 1).prod()
+    rtmp = np.empty((msize, 3), dtype=int)
+    r2tmp = np.empty(msize)
+    for cnt, l in enumerate(itertools.product(*[range(-r, r + 1) for r in rmax])):
+        rtmp[cnt] = l
+        r2tmp[cnt] = np.dot(l, np.matmul(skw.rmet, l))
+    iperm = np.argsort(r2tmp)
+    r2tmp, rtmp = r2tmp[iperm], rtmp[iperm]
+    rgen, rs, r2_prev = [], set([tuple(rtmp[0])]), 0.0
+    for ir in range(1, msize):
+        if abs(r2tmp[ir] - r2_prev) > r2tmp[ir] * 1e-8:
+            r2_prev = r2tmp[ir]
+            rgen.extend(rs)
+            rs = set([tuple(rtmp[ir])])
+        elif all(tuple(np.matmul(rot, rtmp[ir])) not in rs for rot in skw.ptg_symrel):
+            rs.add(tuple(rtmp[ir]))
+    rgen.extend(rs)
+    return np.array(rgen)
+
+def fit_loop(skw, kpts, eigens, inv_rhor):
+    """ previous star functions, H matrix and coefficients """
+    nsppol, nkpt, nband = eigens.shape
+    nr = skw.nr
+    skr = np.empty((nkpt, nr), dtype=complex)
+    for ik, kpt in enumerate(kpts):
+        skr[ik] = 0
+        for omat in skw.ptg_symrel:
+            skr[ik] += np.exp(1.j * np.matmul(skw.rpts, 2.0 * np.pi * np.matmul(omat.T, kpt)))
+        skr[ik] /= skw.ptg_nsym
+    hmat = np.empty((nkpt-1, nkpt-1), dtype=complex)
+    for jk in range(nkpt-1):
+        v_jkr = skr[jk, 1:] - skr[nkpt-1, 1:]
+        for ik in range(nkpt-1):
+            v_ikr = inv_rhor[1:] * (skr[ik, 1:] - skr[nkpt-1, 1:])
+            hmat[ik, jk] = np.vdot(v_jkr, v_ikr)
+    de_kbs = np.empty((nkpt-1, nband, nsppol), dtype=complex)
+    for spin in range(nsppol):
+        for ib in range(nband):
+            de_kbs[:, ib, spin] = eigens[spin, 0:nkpt-1, ib] - eigens[spin, nkpt-1, ib]
+    lmb_kbs = np.linalg.solve(hmat, de_kbs.reshape(nkpt-1, -1)).reshape(-1, nband, nsppol)
+    coefs = np.empty((nsppol, nband, nr), dtype=complex)
+    for spin in range(nsppol):
+        for ib in range(nband):
+            for ir in range(1, nr):
+                coefs[spin, ib, ir] = inv_rhor[ir] * np.vdot(skr[:nkpt-1, ir] - skr[nkpt-1, ir], lmb_kbs[:nkpt-1, ib, spin])
+            coefs[spin, ib, 0] = eigens[spin, nkpt-1, ib] - np.dot(coefs[spin, ib, 1:nr], skr[nkpt-1, 1:nr])
+    return coefs
+
+def main(nk=60, nband=8, lpratio=5):
+    lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'ip','SAVE','ns.db1'),Expand=False,cache=False)
+    symrel = np.array([sym for sym,trev in zip(lat.sym_rec_red,lat.time_rev_list) if not trev])
+    # the star functions are invariant under k -> S^T k
+    ops = np.transpose(symrel,(0,2,1))
+    _, kpts, _ = generate_kpoint_grid(nk,nk,1,(ops,lat.time_rev,np.zeros(len(ops),dtype=bool)))
+    kpts = np.array(kpts)
+    # smooth bands with the symmetry of the lattice
+    rng = np.random.default_rng(0)
+    eigens = np.zeros((1,len(kpts),nband))
+    for ib in range(nband):
+        for rvec in rng.integers(-3,4,(3,3))*[1,1,0]:
+            eigens[0,:,ib] += np.mean(np.cos(2*np.pi*np.einsum('sij,kj,i->ks',ops,kpts,rvec)),axis=1)
+    cell = (lat.lat,lat.red_atomic_positions,lat.atomic_numbers)
+    print(f"{nk}x{nk}x1 mesh, {len(kpts)} IBZ kpoints, {nband} bands, lpratio {lpratio}")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        skw = SkwInterpolator(lpratio,kpts,eigens,0,0,cell,symrel,lat.time_rev,verbose=0)
+    t_new = time.perf_counter()-start
+    print(f"SkwInterpolator      : {t_new:8.3f} s ({skw.nr} star functions, MAE {skw.mae:.2e} meV)")
+
+    fact = 1/2 if extract_point_group(np.array(symrel),lat.time_rev)[2] else 1
+    rmax = int((1.0 + (lpratio * len(kpts) * skw.ptg_nsym * fact) / 2.0) ** (1/3.)) * np.ones(3, dtype=int)
+    start = time.perf_counter()
+    rgen = rstars_loop(skw, rmax)
+    t_stars = time.perf_counter()-start
+    assert np.array_equal(rgen[:skw.nr], skw.rpts)
+
+    r2vals = np.einsum('ri,ij,rj->r', skw.rpts, skw.rmet, skw.rpts)
+    inv_rhor = 1.0 / ((1.0 - 0.25 * r2vals / r2vals[1]) ** 2 + 0.25 * (r2vals / r2vals[1]) ** 3)
+    start = time.perf_counter()
+    coefs = fit_loop(skw, kpts, eigens, inv_rhor)
+    t_fit = time.perf_counter()-start
+    assert np.allclose(coefs, skw.coefs, atol=1e-8*np.abs(coefs).max())
+    print(f"previous loops       : {t_stars+t_fit:8.3f} s (R-stars {t_stars:.3f} s, fit {t_fit:.3f} s)")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
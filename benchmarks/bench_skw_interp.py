@@ -0,0 +1,85 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Time SkwInterpolator.interp_kpts (energies and gradients) on a dense path of
+k-points, compared with the previous per-k evaluation with the per-R loop of
+the star-function derivatives.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_skw_interp.py [nk] [nkpath] [nband]
+"""
+import os
+import io
+import sys
+import time
+import contextlib
+import numpy as np
+from yambopy.tools.skw import SkwInterpolator
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.kpoints import generate_kpoint_grid
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def interp_loop(skw, kpts):
+    """ previous interp_kpts(kpts, dk1=True): one k-point at a time """
+    eigens = np.empty((skw.nsppol, len(kpts), skw.nband))
+    dedk = np.empty((skw.nsppol, len(kpts), skw.nband, 3))
+    for spin in range(skw.nsppol):
+        for ik, kpt in enumerate(kpts):
+            skr = np.zeros(skw.nr, dtype=complex)
+            skr_dk1 = np.zeros((3, skw.nr), dtype=complex)
+            for omat in skw.ptg_symrel:
+                exp_skr = np.exp(1.j * np.matmul(skw.rpts, 2.0 * np.pi * np.matmul(omat.T, kpt)))
+                skr += exp_skr
+                for ir, rr in enumerate(skw.rpts):
+                    skr_dk1[:, ir] += exp_skr[ir] * np.matmul(omat, rr)
+            skr /= skw.ptg_nsym
+            skr_dk1 *= 1.j / skw.ptg_nsym
+            eigens[spin, ik] = np.matmul(skw.coefs[spin], skr).real
+            for ii in range(3):
+                dedk[spin, ik, :, ii] = np.matmul(skw.coefs[spin], skr_dk1[ii]).real
+    return eigens, dedk
+
+def main(nk=24, nkpath=2000, nband=8, lpratio=5):
+    lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'ip','SAVE','ns.db1'),Expand=False,cache=False)
+    symrel = np.array([sym for sym,trev in zip(lat.sym_rec_red,lat.time_rev_list) if not trev])
+    # the star functions are invariant under k -> S^T k
+    ops = np.transpose(symrel,(0,2,1))
+    _, kpts, _ = generate_kpoint_grid(nk,nk,1,(ops,lat.time_rev,np.zeros(len(ops),dtype=bool)))
+    kpts = np.array(kpts)
+    rng = np.random.default_rng(0)
+    eigens = np.zeros((1,len(kpts),nband))
+    for ib in range(nband):
+        for rvec in rng.integers(-3,4,(3,3))*[1,1,0]:
+            eigens[0,:,ib] += np.mean(np.cos(2*np.pi*np.einsum('sij,kj,i->ks',ops,kpts,rvec)),axis=1)
+    cell = (lat.lat,lat.red_atomic_positions,lat.atomic_numbers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        skw = SkwInterpolator(lpratio,kpts,eigens,0,0,cell,symrel,lat.time_rev,verbose=0)
+
+    # G-M-K-G path
+    nodes = np.array([[0,0,0],[0.5,0,0],[1/3,1/3,0],[0,0,0]])
+    path = np.concatenate([np.linspace(a,b,nkpath//3,endpoint=False) for a,b in zip(nodes[:-1],nodes[1:])])
+    print(f"{len(kpts)} IBZ kpoints, {skw.nr} star functions, {nband} bands, {len(path)} path kpoints")
+
+    start = time.perf_counter()
+    ref_eigens, ref_dedk = interp_loop(skw, path)
+    t_loop = time.perf_counter()-start
+
+    for label, kwargs in [('interp_kpts',          dict()),
+                          ('interp_kpts dk1',      dict(dk1=True)),
+                          ('interp_kpts dk1 dk2',  dict(dk1=True,dk2=True))]:
+        start = time.perf_counter()
+        res = skw.interp_kpts(path,**kwargs)
+        elapsed = time.perf_counter()-start
+        assert np.allclose(res.eigens,ref_eigens,atol=1e-10)
+        if res.dedk is not None: assert np.allclose(res.dedk,ref_dedk,atol=1e-10)
+        print(f"{label:>20s}: {elapsed:8.3f} s")
+    print(f"{'previous dk1':>20s}: {t_loop:8.3f} s")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,75 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Time the interpolation of several band-like quantities on the same k-points
+(e.g. exciton energies, weights and spin projections) with one SkwInterpolator
+per quantity (previous behaviour) and with a shared SkwModel, built, reused
+from memory and read from disk.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_skw_model.py [nk] [nquantities]
+"""
+import os
+import io
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+from yambopy.tools import skw as skw_module
+from yambopy.tools.skw import SkwInterpolator, get_skw_model
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.kpoints import generate_kpoint_grid
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs')
+
+def main(nk=36, nquantities=3, nband=8, lpratio=5):
+    lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'ip','SAVE','ns.db1'),Expand=False,cache=False)
+    symrel = np.array([sym for sym,trev in zip(lat.sym_rec_red,lat.time_rev_list) if not trev])
+    # the star functions are invariant under k -> S^T k
+    ops = np.transpose(symrel,(0,2,1))
+    _, kpts, _ = generate_kpoint_grid(nk,nk,1,(ops,lat.time_rev,np.zeros(len(ops),dtype=bool)))
+    kpts = np.array(kpts)
+    rng = np.random.default_rng(0)
+    quantities = []
+    for iq in range(nquantities):
+        values = np.zeros((1,len(kpts),nband))
+        for ib in range(nband):
+            for rvec in rng.integers(-3,4,(3,3))*[1,1,0]:
+                values[0,:,ib] += np.mean(np.cos(2*np.pi*np.einsum('sij,kj,i->ks',ops,kpts,rvec)),axis=1)
+        quantities.append(values)
+    cell = (lat.lat,lat.red_atomic_positions,lat.atomic_numbers)
+    kpath = np.linspace([0,0,0],[0.5,0,0],200)
+    print(f"{len(kpts)} IBZ kpoints, {nquantities} quantities x {nband} bands")
+
+    tmp_path = tempfile.mkdtemp()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            ref = [SkwInterpolator(lpratio,kpts,values,0,0,cell,symrel,lat.time_rev,verbose=0).interp_kpts(kpath).eigens
+                   for values in quantities]
+            t_separate = time.perf_counter()-start
+
+            timings = []
+            for label in ['build + save', 'in memory', 'from disk']:
+                if label == 'from disk': skw_module._skw_models.clear()
+                start = time.perf_counter()
+                model = get_skw_model(lpratio,kpts,cell,symrel,lat.time_rev,cache_dir=tmp_path,verbose=0)
+                res = model.interpolate(kpath,*quantities)
+                timings.append((label,time.perf_counter()-start))
+                assert all(np.allclose(a,b,atol=1e-10) for a,b in zip(ref,res))
+
+        print(f"{'separate interpolators':>24s}: {t_separate:8.3f} s")
+        for label, elapsed in timings:
+            print(f"{'model '+label:>24s}: {elapsed:8.3f} s")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare the real-space conversion of the wavefunctions with one scatter + ifftn
+per k-point (previous implementation) and with the batched FFT engine (WfcFFT).
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_wfc_fft.py [nbands]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import scipy.fft
+from yambopy.dbs.wfdb import YamboWFDB
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+
+def to_real_space_loop(wfdb, ik, grid):
+    """ previous YamboWFDB.to_real_space """
+    wfc_tmp, gvec_tmp = wfdb.get_iBZ_wf(ik)
+    wfc_tmp = wfc_tmp.reshape(-1, wfdb.nspinor, wfdb.ngvecs[ik])
+    tmp_wfc = np.zeros((len(wfc_tmp), wfdb.nspinor, grid[0], grid[1], grid[2]), dtype=wfc_tmp.dtype)
+    Nx = np.where(gvec_tmp[:, 0] >= 0, gvec_tmp[:, 0], gvec_tmp[:, 0] + grid[0])
+    Ny = np.where(gvec_tmp[:, 1] >= 0, gvec_tmp[:, 1], gvec_tmp[:, 1] + grid[1])
+    Nz = np.where(gvec_tmp[:, 2] >= 0, gvec_tmp[:, 2], gvec_tmp[:, 2] + grid[2])
+    tmp_wfc[:, :, Nx, Ny, Nz] = wfc_tmp
+    return scipy.fft.ifftn(tmp_wfc, norm="forward", axes=(2, 3, 4))
+
+def timeit(func, nrepeat=3):
+    timings = []
+    for i in range(nrepeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main(nbands=16):
+    tmp_path = tempfile.mkdtemp()
+    try:
+        make_synthetic_save(os.path.join(tmp_path, 'SAVE'), nbands=nbands)
+        wfdb = YamboWFDB(path=tmp_path)
+        grid = 2 * wfdb.fft_box
+        iks = range(wfdb.nkpoints)
+        print(f"{wfdb.nkpoints} k-points, {nbands} bands, grid {grid}")
+
+        t_loop = timeit(lambda: [to_real_space_loop(wfdb, ik, grid) for ik in iks])
+        fft = wfdb.get_fft_engine(grid)
+        t_engine = timeit(lambda: [fft.transform(*wfdb.get_iBZ_wf(ik), key=ik, reuse=True) for ik in iks])
+        t_batch = timeit(lambda: wfdb.wfcG2r_kpoints(iks, grid=grid))
+        t_single = timeit(lambda: wfdb.wfcG2r_kpoints(iks, grid=grid, dtype=np.complex64))
+
+        print(f"per k-point, new boxes     : {t_loop:8.3f} s")
+        print(f"engine, reused box         : {t_engine:8.3f} s")
+        print(f"engine, all k in one call  : {t_batch:8.3f} s")
+        print(f"same, complex64            : {t_single:8.3f} s")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,48 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Compare serial and parallel loading of the ns.wf fragments on a synthetic SAVE.
+
+Usage (from the root of the repository):
+    PYTHONPATH=. python benchmarks/bench_wfdb_read.py [nkpoints] [nbands]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.wfdb import YamboWFDB
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+
+def main(nkpoints=96, nbands=40, nrepeat=3):
+    tmp_path = tempfile.mkdtemp()
+    try:
+        make_synthetic_save(os.path.join(tmp_path,'SAVE'),nbands=nbands,nkpoints=nkpoints)
+        lattice = YamboLatticeDB.from_db_file(os.path.join(tmp_path,'SAVE','ns.db1'))
+
+        ref = None
+        print(f"{nkpoints} fragments, {nbands} bands")
+        for label, kwargs in [('serial',              dict(workers=1)),
+                              ('4 threads',           dict(workers=4,executor='thread')),
+                              ('4 processes',         dict(workers=4,executor='process')),
+                              ('8 processes',         dict(workers=8,executor='process'))]:
+            timings = []
+            for i in range(nrepeat):
+                start = time.perf_counter()
+                wfdb = YamboWFDB(path=tmp_path,latdb=lattice,**kwargs)
+                timings.append(time.perf_counter()-start)
+            if ref is None: ref = wfdb.wf
+            else: assert np.array_equal(ref,wfdb.wf)
+            print(f"{label:>12s}: {min(timings):8.3f} s")
+    finally:
+        shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,9 @@
+
+#modules
+module load abinit
+
+#commands
+echo 'hello world'
+
+#pos_run
+echo "done!"
\ No newline at end of file
@@ -8,7 +8,6 @@
 # This file is part of the yambopy project
 #
 import os
-from glob import glob
 from qepy.lattice import Path
 from yambopy import *
 from yambopy.units import *
@@ -26,35 +25,34 @@ class ExcitonDispersion():
 
     :: Lattice is an instance of YamboLatticeDB
     :: nexcitons is the number of excitonic states - by default it is taken from the Q=1 database
+    :: workers is the number of processes reading the databases (see YamboExcitonQDBs)
 
     NB: so far does not support spin-polarised exciton plots (should be implemented when needed!)
     NB: only supports BSEBands option in yambo bse input, not BSEEhEny
     """
 
-    def __init__(self,lattice,nexcitons=None,folder='.'):
+    def __init__(self,lattice,nexcitons=None,folder='.',workers=1):
 
         if not isinstance(lattice,YamboLatticeDB):
             raise ValueError('Invalid type for lattice argument. It must be YamboLatticeDB')
         
-        files   = glob(folder+'/ndb.BS_diago_Q*')
-        nqpoints  = len(files)
+        # Read energies and residuals of all the Q-points (eigenvectors are read below, only for nexcitons)
+        excdbs    = YamboExcitonQDBs.from_folder(lattice,folder=folder,lazy=True,workers=workers)
+        nqpoints  = len(excdbs)
 
         # Check
-        if not nqpoints==lattice.ibz_nkpoints :
+        if not nqpoints==lattice.ibz_nkpoints or excdbs.qpoints[-1]!=nqpoints:
             raise ValueError("Incomplete list of qpoints (%d/%d)"%(nqpoints,lattice.ibz_nkpoints)) 
     
-        dbs_are_consistent, spin_is_there = self.db_check(lattice,nqpoints,folder)
+        dbs_are_consistent, spin_is_there = self.db_check(excdbs)
         if nexcitons is None: nexcitons = self.ntransitions
 
         # Read
-        car_qpoints         = np.zeros((nqpoints,3))
+        car_qpoints         = excdbs.car_qpoints
         exc_energies        = np.zeros((nqpoints,nexcitons))
         exc_eigenvectors    = np.zeros((nqpoints,nexcitons,self.ntransitions),dtype=complex)
         exc_tables          = np.zeros((nqpoints,self.ntransitions,5),dtype=int)
-        for iQ in range(nqpoints):
-            exc_obj = YamboExcitonDB.from_db_file(lattice,filename=folder+'/ndb.BS_diago_Q%d'%(iQ+1))
-            if iQ==0: car_qpoints[iQ] = np.array([0.,0.,0.])
-            else:     car_qpoints[iQ] = exc_obj.car_qpoint
+        for iQ,exc_obj in enumerate(excdbs):
             exc_energies[iQ,:]        = exc_obj.eigenvalues[:nexcitons].real
             exc_eigenvectors[iQ,:]    = exc_obj.eigenvectors[:nexcitons]    
             exc_tables[iQ,:]          = exc_obj.table
@@ -76,15 +74,12 @@ class ExcitonDispersion():
         self.alat = lattice.alat
         self.rlat = lattice.rlat
 
-    def db_check(self,lattice,nqpoints,folder):
+    def db_check(self,excdbs):
         """
-        Check nexcitons and ntransitions in each database
+        Check nexcitons and ntransitions in each database (excdbs is a YamboExcitonQDBs)
         """
-        nexcitons_each_Q    = np.zeros(nqpoints,dtype=int)
-        for iQ in range(nqpoints):
-            exc_obj = YamboExcitonDB.from_db_file(lattice,filename=folder+'/ndb.BS_diago_Q%d'%(iQ+1))
-            nexcitons_each_Q[iQ] = exc_obj.nexcitons
-            if iQ==0: tbl = exc_obj.table
+        nexcitons_each_Q    = np.array([exc_obj.nexcitons for exc_obj in excdbs],dtype=int)
+        tbl = excdbs[0].table
 
         is_spin_pol = len(np.unique(tbl[:,3]))>1 or len(np.unique(tbl[:,4]))>1
         is_consistent = np.all(nexcitons_each_Q==nexcitons_each_Q[0])
@@ -6,6 +6,7 @@ import numpy as np
 from yambopy.dbs.excitondb import YamboExcitonDB
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.wfdb import YamboWFDB
+from yambopy.tools.dmat_cache import DmatCache
 from yambopy.bse.rotate_excitonwf import rotate_exc_wf
 from yambopy.tools.degeneracy_finder import find_degeneracy_evs
 from yambopy.symmetries.point_group_ops import get_pg_info, decompose_rep2irrep
@@ -77,8 +78,9 @@ def compute_exc_rep(path='.', bse_dir='SAVE', iqpt=1, nstates=-1, degen_tol = 1e
     -----------------------------
     ``BS_left_ev_Cache.npy`` :
         Left eigenvectors of the BSE Hamiltonian in case of non-TDA.
-    ``Dmat_elec_Cache_spglib.npy`` :
-        Electronic representation matrices from spglib symmetry operations.
+    ``Dmat_elec_Cache/`` :
+        Electronic representation matrices (see yambopy.tools.dmat_cache), one
+        entry per SAVE, band range and symmetry set (spglib or SAVE symmetries).
 
     Note :
     Currently projective representations are not implemented and left for future.
@@ -200,17 +202,14 @@ def compute_exc_rep(path='.', bse_dir='SAVE', iqpt=1, nstates=-1, degen_tol = 1e
     # Note yambo always orders time rev symmeties in second half, even for magnetic systems.
     nsym_spatial = len(Rotation_matrices_symm)//trev_fac
     #
-    Dmat_path = os.path.join(bse_dir, 'Dmat_elec_Cache_spglib.npy')
-    if use_save_symmetries: Dmat_path = os.path.join(bse_dir, 'Dmat_elec_Cache_SAVE.npy')
-    #
-    if os.path.exists(Dmat_path):
-        print("Dmats found. Loading ....")
-        dmats = np.load(Dmat_path)
-    else:
-        print("Dmats not found. Computing ....")
-        dmats = wfdb.Dmat(symm_mat=Rotation_matrices_symm[:nsym_spatial],
-                          frac_vec=frac_trans_symm[:nsym_spatial], time_rev=False)
-        np.save(Dmat_path,dmats)
+    # Dmats are cached in bse_dir, keyed by the SAVE, the bands and the symmetries
+    dmat_cache = DmatCache(os.path.join(bse_dir, 'Dmat_elec_Cache'))
+    dmat_key = wfdb.Dmat_cache_key(symm_mat=Rotation_matrices_symm[:nsym_spatial],
+                                   frac_vec=frac_trans_symm[:nsym_spatial], time_rev=False)
+    if dmat_key in dmat_cache: print("Dmats found. Loading ....")
+    else: print("Dmats not found. Computing ....")
+    dmats = wfdb.Dmat(symm_mat=Rotation_matrices_symm[:nsym_spatial],
+                      frac_vec=frac_trans_symm[:nsym_spatial], time_rev=False, cache=dmat_cache)
     #
     ## print some data about the degeneracies
     print('=' * 40)
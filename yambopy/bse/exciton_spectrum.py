@@ -0,0 +1,162 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# Authors: MN
+#
+# This file is part of the yambopy project
+#
+"""
+Sums over excitonic states of resonant and antiresonant Green's functions
+
+    S(w) = sum_s r_s [ -1/(w - E_s + i g_s) - 1/(-w - E_s - i g_s) ]
+
+used to build absorption (r_s = residuals) and PL (r_s = residuals * Boltzmann
+weights) spectra. The excitons are streamed in blocks, so that the memory never
+scales as nexcitons*nenergies, and several broadenings are computed in one pass.
+"""
+import numpy as np
+from scipy import fft as sp_fft
+from yambopy.units import I
+from yambopy.tools.funcs import gaussian, lorentzian
+
+def get_broadenings(broad, energies, energy_min=None):
+    """
+    Broadening of each exciton from the `broad` argument of get_chi and get_pl
+
+    :: broad -> one of
+          float                       : same broadening for all the excitons
+          tuple (b0,b1)               : b0 + (E_s-energy_min)*(b1-b0), linearly varying
+          'gaussian: x eV' or
+          'lorentzian: x eV'          : 0.1 * density of excitonic states smeared by x
+          array [nexcitons]           : broadening of each exciton
+          list of the above           : several broadenings, one spectrum each
+    :: energies -> real exciton energies [nexcitons]
+    :: energy_min -> reference of the linearly varying broadening (default min(energies))
+
+    Returns the broadenings [nbroad, nexcitons] and True if a list was given
+    """
+    energies = np.asarray(energies,dtype=np.float64)
+    nexcitons = len(energies)
+    several = isinstance(broad,list)
+    if not several: broad = [broad]
+    if energy_min is None: energy_min = np.min(energies)
+
+    broads = np.zeros([len(broad),nexcitons])
+    for ib,b in enumerate(broad):
+        if isinstance(b,tuple):
+            broads[ib] = b[0] + (energies-energy_min)*(b[1]-b[0])
+        elif isinstance(b,str):
+            i = b.find(":")
+            if i == -1 or not ("gaussian" in b or "lorentzian" in b):
+                raise ValueError('Unknown broadening %s'%b)
+            value, eunit = b[i+1:].split()
+            if eunit == "eV": sigma = float(value)
+            else: raise ValueError('Unknown unit %s'%eunit)
+            f = gaussian if "gaussian" in b else lorentzian
+            dos = np.zeros(nexcitons)
+            chunk = max(1,(1<<22)//max(nexcitons,1))
+            for start in range(0,nexcitons,chunk):
+                dos += f(energies[:,None],energies[None,start:start+chunk],sigma).sum(axis=1)
+            broads[ib] = 0.1*dos/nexcitons
+        else:
+            broads[ib] = b
+    return broads, several
+
+def exciton_spectrum(w, energies, strengths, broads, method='direct', chunk=None, oversample=4, groups=None):
+    """
+    Sum of the resonant and antiresonant Green's functions of the excitons
+
+        S(w) = sum_s r_s [ -1/(w - E_s + i g_s) - 1/(-w - E_s - i g_s) ]
+
+    for several sets of broadenings g at once.
+
+    :: w -> energies of the spectrum [nw]
+    :: energies -> exciton energies E_s [nexcitons] (complex energies are allowed)
+    :: strengths -> r_s [nexcitons], e.g. l_residual*r_residual
+    :: broads -> broadenings [nbroad, nexcitons] (or [nexcitons]), see get_broadenings
+    :: method -> 'direct': exact sum over blocks of `chunk` excitons (memory ~ chunk*nw)
+                 'fft'   : the strengths are binned (linear interpolation) on a grid `oversample`
+                           times finer than w and convolved with the Lorentzian by FFT. It requires
+                           a uniform w grid, real energies and the same broadening for all the excitons
+                           of a spectrum; otherwise the direct sum is used.
+                           The cost is independent of the number of excitons, the error ~ (dw/g)^2.
+    :: groups -> index of the spectrum of each exciton [nexcitons] (e.g. its Q-point), to compute
+                 separate spectra of several sets of excitons in one pass
+
+    Returns the spectra [nbroad, nw] (complex), or [ngroups, nbroad, nw] if groups is given
+    """
+    w = np.asarray(w,dtype=np.float64)
+    energies = np.asarray(energies)
+    strengths = np.asarray(strengths)
+    broads = np.atleast_2d(np.asarray(broads,dtype=np.float64))
+    if broads.shape[1] != len(energies):
+        broads = np.broadcast_to(broads,(len(broads),len(energies)))
+    if groups is None: group_idx = np.zeros(len(energies),dtype=np.int64)
+    else:              group_idx = np.asarray(groups,dtype=np.int64)
+    ngroups = int(group_idx.max())+1 if len(group_idx) else 1
+
+    spectra = None
+    if method == 'fft':
+        spectra = _exciton_spectrum_fft(w, energies, strengths, broads, oversample, group_idx, ngroups)
+    elif method != 'direct':
+        raise ValueError("Unknown method %s, use 'direct' or 'fft'"%method)
+
+    if spectra is None:
+        nw = len(w)
+        if chunk is None: chunk = max(1,(1<<22)//max(nw,1))
+        spectra = np.zeros([ngroups,len(broads),nw],dtype=np.complex128)
+        for start in range(0,len(energies),chunk):
+            es = energies[start:start+chunk,None]
+            # strengths of the block scattered on the groups [ngroups, chunk]
+            r = np.zeros([ngroups,len(es)],dtype=np.result_type(strengths,np.float64))
+            r[group_idx[start:start+chunk],np.arange(len(es))] = strengths[start:start+chunk]
+            for ib,broad in enumerate(broads):
+                gs = broad[start:start+chunk,None]*I
+                # G1 + G2 = -1/(w-E+ig) + 1/(w+E+ig)
+                spectra[:,ib] += r @ (1/(w+es+gs) - 1/(w-es+gs))
+    if groups is None: return spectra[0]
+    return spectra
+
+def _exciton_spectrum_fft(w, energies, strengths, broads, oversample, group_idx, ngroups, max_size=1<<24):
+    """ FFT path of exciton_spectrum, returns None if it cannot be used """
+    nw = len(w)
+    if nw < 2 or len(energies) == 0: return None
+    step = w[1]-w[0]
+    if step <= 0 or not np.allclose(np.diff(w),step,rtol=1e-4,atol=0): return None
+    if np.iscomplexobj(energies):
+        if np.any(np.abs(energies.imag) > 1e-6*step): return None
+        energies = energies.real
+    if not np.all(broads == broads[:,:1]): return None
+
+    # grid x_n = x0 + n*dx aligned with w, covering w, E_s (resonant) and -E_s (antiresonant)
+    dx = step/oversample
+    lo = min(w[0],energies.min(),-energies.max())
+    hi = max(w[-1],energies.max(),-energies.min())
+    nlo = int(np.ceil((w[0]-lo)/dx))+1
+    x0 = w[0]-nlo*dx
+    npoints = int(np.ceil((hi-x0)/dx))+2
+    if 3*npoints*ngroups > max_size: return None
+
+    # S(w) = sum_s r_s [ K(w+E_s) - K(w-E_s) ] with K(x) = 1/(x+ig): bin +r_s at -E_s and -r_s at E_s
+    positions = np.concatenate([-energies,energies])
+    weights = np.concatenate([strengths,-strengths]).astype(np.complex128)
+    offsets = np.tile(group_idx,2)*npoints
+    p = (positions-x0)/dx
+    n = np.floor(p).astype(np.int64)
+    frac = p-n
+    bins = np.zeros(ngroups*npoints,dtype=np.complex128)
+    for idx,wgt in [(n,weights*(1-frac)),(n+1,weights*frac)]:
+        bins += np.bincount(idx+offsets,wgt.real,ngroups*npoints) + I*np.bincount(idx+offsets,wgt.imag,ngroups*npoints)
+
+    # linear convolution with the kernel sampled at -(npoints-1)..(npoints-1)
+    nfft = sp_fft.next_fast_len(3*npoints-2)
+    bins_fft = sp_fft.fft(bins.reshape(ngroups,npoints),nfft,axis=-1)
+    x = np.arange(-(npoints-1),npoints)*dx
+    iw = nlo + oversample*np.arange(nw)
+    spectra = np.zeros([ngroups,len(broads),nw],dtype=np.complex128)
+    for ib,broad in enumerate(broads[:,0]):
+        conv = sp_fft.ifft(bins_fft*sp_fft.fft(1/(x+broad*I),nfft),axis=-1)
+        spectra[:,ib] = conv[:,npoints-1+iw]
+    return spectra
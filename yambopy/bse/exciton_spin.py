@@ -3,7 +3,7 @@
 #
 import os
 import numpy as np
-from yambopy.dbs.excitondb import YamboExcitonDB
+from yambopy.dbs.excitondb import YamboExcitonQDBs
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.wfdb import YamboWFDB
 from .exciton_matrix_elements import exciton_X_matelem
@@ -78,7 +78,7 @@ def compute_exciton_spin(lattice, excdb, wfdb, elec_sz, contribution='b',diagona
 def compute_exc_spin_iqpt(path='.', bse_dir='SAVE', iqpt=1,
                           nstates=-1, contribution='b', degen_tol = 1e-2,
                           sz=0.5 * np.array([[1, 0], [0, -1]]),
-                          return_dbs_and_spin=True):
+                          return_dbs_and_spin=True, workers=1):
     """
     
     
@@ -109,6 +109,8 @@ def compute_exc_spin_iqpt(path='.', bse_dir='SAVE', iqpt=1,
         S_z operator matrix representation. Default: 0.5 * np.array([[1, 0], [0, -1]])
     return_dbs_and_spin : bool, optional
         If True, returns both spin values and database objects. Default: True
+    workers : int, optional
+        Number of processes reading the exciton databases. Default: 1 (serial)
 
     Returns
     -------
@@ -139,13 +141,10 @@ def compute_exc_spin_iqpt(path='.', bse_dir='SAVE', iqpt=1,
     else : iqpt = list(iqpt)
     # Load the lattice database
     lattice = YamboLatticeDB.from_db_file(os.path.join(path, 'SAVE', 'ns.db1'))
-    ## load exbds
-    excdb = []
-    for iq in iqpt:
-        filename = 'ndb.BS_diago_Q%d' % (iq)
-        excdb.append(YamboExcitonDB.from_db_file(lattice, filename=filename,
-                                                 folder=os.path.join(path, bse_dir),
-                                                 Load_WF=True, neigs=nstates))
+    ## load exbds (the eigenvectors are read by get_Akcv)
+    excdb = list(YamboExcitonQDBs.from_folder(lattice, folder=os.path.join(path, bse_dir),
+                                              qpoints=iqpt, Load_WF=True, lazy=True,
+                                              neigs=nstates, workers=workers))
     # Load the wavefunction database
     wfdb = YamboWFDB(path=path, latdb=lattice,
                       bands_range=[np.min(excdb[0].table[:, 1]) - 1,
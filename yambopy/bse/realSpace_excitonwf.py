@@ -193,18 +193,19 @@ def ex_wf2Real_kernel(Akcv, Qpt, wfcdb, bse_bnds, fixed_position,
     fft_box = np.zeros(3,dtype=int)
     #
     
-    for ik in range(len(wfcdb.gvecs)):
+    for ik in range(wfcdb.nkpoints):
+        gvecs_ik = wfcdb.get_iBZ_gvecs(ik)
         idx_gvecs_tmp = np.arange(wfcdb.ngvecs[ik],dtype=int)
         if wfcCutoffRy > 0:
-            tmp_gvecs = 2*np.pi*np.linalg.norm((wfcdb.gvecs[ik, :wfcdb.ngvecs[ik], :] 
+            tmp_gvecs = 2*np.pi*np.linalg.norm((gvecs_ik 
                                         + wfcdb.kpts_iBZ[ik][None,:])@blat,axis=-1)
             idx_tmp = tmp_gvecs < np.sqrt(wfcCutoffRy)
             idx_gvecs_tmp = idx_gvecs_tmp[idx_tmp].copy()
         #
         gvecs_iBZ_idx.append(idx_gvecs_tmp)
         ## Get the fft box 
-        min_fft_idx = np.min(wfcdb.gvecs[ik, :wfcdb.ngvecs[ik], :][idx_gvecs_tmp] , axis=0)
-        max_fft_idx = np.max(wfcdb.gvecs[ik, :wfcdb.ngvecs[ik], :][idx_gvecs_tmp] , axis=0)
+        min_fft_idx = np.min(gvecs_ik[idx_gvecs_tmp] , axis=0)
+        max_fft_idx = np.max(gvecs_ik[idx_gvecs_tmp] , axis=0)
         assert np.min(max_fft_idx) >= 0 and np.max(min_fft_idx) < 0, "Invalid G-vectors"
         for i in range(3):
             fft_box[i] = max([fft_box[i], max_fft_idx[i] - min_fft_idx[i] + 3])
@@ -266,6 +267,10 @@ def ex_wf2Real_kernel(Akcv, Qpt, wfcdb, bse_bnds, fixed_position,
     exp_tmp_kL = np.zeros((min(nk,block_size) ,supercell[0],
                            supercell[1],supercell[2]),dtype=np.complex64)
 
+    fft_engine = wfcdb.get_fft_engine(fft_box, dtype=np.complex64)
+    # everything below is single precision: cast the coefficients once (no copy if already complex64)
+    Akcv = Akcv.astype(np.complex64, copy=False)
+    #
     nblks = nk//block_size 
     nrem = nk%block_size
     if nrem > 0: nblks = nblks+1
@@ -277,19 +282,11 @@ def ex_wf2Real_kernel(Akcv, Qpt, wfcdb, bse_bnds, fixed_position,
         ikstop = min(ikstart + block_size,nk)
         for ik in range(ikstart,ikstop):
             ## First get the electronic wfcs
+            # (from the full BZ storage if expanded, in memory or memmap, otherwise rotated on the fly)
             ik_ibz = kpt_idx[ik]
-            isym = sym_idx[ik]
-            wfc_tmp, gvecs_tmp = wfcdb.get_iBZ_wf(ik_ibz)
-            wfc_tmp = wfc_tmp[:,elec_bnds[0]:elec_bnds[1],:,gvecs_iBZ_idx[ik_ibz]]
+            kvec, wfc_tmp, gvecs_tmp = wfcdb.get_BZ_kwfc(ik, bands=elec_bnds)
+            wfc_tmp = wfc_tmp[...,gvecs_iBZ_idx[ik_ibz]]
             gvecs_tmp = gvecs_tmp[gvecs_iBZ_idx[ik_ibz]]
-            kvec = wfcdb.get_iBZ_kpt(ik_ibz)
-            # get the rotated wf
-            if isym != 0:
-                sym_mat = wfcdb.ydb.sym_car[isym]
-                time_rev = (isym >= len(wfcdb.ydb.sym_car
-                                        ) / (1 + int(np.rint(wfcdb.ydb.time_rev))))
-                kvec, wfc_tmp, gvecs_tmp = wfcdb.apply_symm(
-                    kvec, wfc_tmp, gvecs_tmp, time_rev, sym_mat)
 
             kelec = kvec
             wfc_elec = wfc_tmp
@@ -298,16 +295,9 @@ def ex_wf2Real_kernel(Akcv, Qpt, wfcdb, bse_bnds, fixed_position,
             ## Do the same and get hole wfc
             ikhole = find_kpt(ktree, kelec-Qpt)
             ik_ibz = kpt_idx[ikhole]
-            isym = sym_idx[ikhole]
-            wfc_tmp, gvecs_tmp = wfcdb.get_iBZ_wf(ik_ibz)
-            wfc_tmp = wfc_tmp[:,hole_bnds[0]:hole_bnds[1],:,gvecs_iBZ_idx[ik_ibz]]
+            kvec, wfc_tmp, gvecs_tmp = wfcdb.get_BZ_kwfc(ikhole, bands=hole_bnds)
+            wfc_tmp = wfc_tmp[...,gvecs_iBZ_idx[ik_ibz]]
             gvecs_tmp = gvecs_tmp[gvecs_iBZ_idx[ik_ibz]]
-            kvec = wfcdb.get_iBZ_kpt(ik_ibz)
-            # get the rotated wf
-            if isym != 0:
-                sym_mat = wfcdb.ydb.sym_car[isym]
-                time_rev = (isym >= len(wfcdb.ydb.sym_car) / (1 + int(np.rint(wfcdb.ydb.time_rev))))
-                kvec, wfc_tmp, gvecs_tmp = wfcdb.apply_symm(kvec, wfc_tmp, gvecs_tmp, time_rev, sym_mat)
             #
             khole = -kvec
             wfc_hole = wfc_tmp.conj()
@@ -336,19 +326,18 @@ def ex_wf2Real_kernel(Akcv, Qpt, wfcdb, bse_bnds, fixed_position,
             fx_wfc = np.sum(fx_wfc,axis=-1) #(spin,bnd,spinor)
             ns1, nbndc, nspinorr, ng = ft_wfc.shape
             #if ft_ikpt not in prev_ikpts:
-            ft_wfcr = wfcdb.to_real_space(ft_wfc.reshape(-1,nspinorr,ng),ft_gvec, grid=fft_box)
-            ft_wfcr = ft_wfcr.reshape(ns1,nbndc,nspinorr,fft_box[0],fft_box[1],fft_box[2])
+            # all bands in one single precision FFT, in a reused box
+            ft_wfcr = fft_engine.transform(ft_wfc, ft_gvec, reuse=True)
             exp_kx_r = np.exp(2*np.pi*1j*FFFboxs.reshape(-1,3)@ft_kvec).reshape(FFFboxs.shape[:3])
             ft_wfcr *= exp_kx_r[None,None,None,...]
             #
-            fx_wfc = fx_wfc.astype(np.complex64)
-            ft_wfcr = ft_wfcr.astype(np.complex64)
+            fx_wfc = fx_wfc.astype(np.complex64, copy=False)
             #
             if fix_particle == 'h':
-                np.einsum('nscv,svy,scxijk->nsxyijk',Akcv[:,:,ik,...].astype(np.complex64),fx_wfc,ft_wfcr,
+                np.einsum('nscv,svy,scxijk->nsxyijk',Akcv[:,:,ik,...],fx_wfc,ft_wfcr,
                           optimize=True,out=exe_tmp_wf[:,:,:,:,ik-ikstart])
             else :
-                np.einsum('nscv,scx,svyijk->nsxyijk',Akcv[:,:,ik,...].astype(np.complex64),fx_wfc,ft_wfcr,
+                np.einsum('nscv,scx,svyijk->nsxyijk',Akcv[:,:,ik,...],fx_wfc,ft_wfcr,
                           optimize=True,out=exe_tmp_wf[:,:,:,:,ik-ikstart])
             #
             #exe_tmp_wf[:,:,:,ik-ikstart] *= exp_kx_r[...].reshape(FFFboxs.shape[:3])[None,None,None]
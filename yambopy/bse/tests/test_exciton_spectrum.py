@@ -0,0 +1,63 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+import unittest
+import numpy as np
+from yambopy.bse.exciton_spectrum import get_broadenings, exciton_spectrum
+
+def dense_spectrum(w,energies,strengths,broad):
+    """ previous implementation: dense (nexcitons, nenergies) Green's functions """
+    es = energies[:,None]
+    broad = broad[:,None]
+    G1 = -1/( w - es + broad*1j)
+    G2 = -1/(-w - es - broad*1j)
+    return np.einsum('s,sn->n',strengths,G1+G2)
+
+class TestExcitonSpectrum(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.energies = rng.uniform(0.5,12,500)
+        self.strengths = rng.normal(size=500)+1j*rng.normal(size=500)
+        self.w = np.arange(0,10,0.01,dtype=np.float32)
+
+    def test_direct(self):
+        """ chunked sum with several broadenings against the dense sum """
+        broads, several = get_broadenings([0.1,(0.05,0.2)],self.energies)
+        self.assertTrue(several)
+        spectra = exciton_spectrum(self.w,self.energies,self.strengths,broads,chunk=7)
+        self.assertEqual(spectra.shape,(2,len(self.w)))
+        for spectrum,broad in zip(spectra,broads):
+            np.testing.assert_allclose(spectrum,dense_spectrum(self.w,self.energies,self.strengths,broad),rtol=1e-10,atol=1e-10)
+
+    def test_fft(self):
+        """ binning + FFT convolution for uniform broadenings """
+        broads, several = get_broadenings(0.1,self.energies)
+        self.assertFalse(several)
+        spectrum = exciton_spectrum(self.w,self.energies,self.strengths,broads,method='fft')[0]
+        reference = dense_spectrum(self.w,self.energies,self.strengths,broads[0])
+        self.assertLess(np.abs(spectrum-reference).max(),1e-3*np.abs(reference).max())
+
+        # non uniform broadenings fall back to the direct sum
+        broads, several = get_broadenings((0.05,0.2),self.energies)
+        spectrum = exciton_spectrum(self.w,self.energies,self.strengths,broads,method='fft')[0]
+        np.testing.assert_allclose(spectrum,dense_spectrum(self.w,self.energies,self.strengths,broads[0]),rtol=1e-10,atol=1e-10)
+
+    def test_groups(self):
+        """ separate spectra of several sets of excitons in one pass """
+        groups = np.arange(500)%3
+        broads, several = get_broadenings([0.1,0.2],self.energies)
+        for method in ['direct','fft']:
+            spectra = exciton_spectrum(self.w,self.energies,self.strengths,broads,method=method,chunk=7,groups=groups)
+            self.assertEqual(spectra.shape,(3,2,len(self.w)))
+            for ig in range(3):
+                mask = groups == ig
+                reference = exciton_spectrum(self.w,self.energies[mask],self.strengths[mask],broads[:,mask],method=method)
+                np.testing.assert_allclose(spectra[ig],reference,rtol=1e-8,atol=1e-8)
+
+if __name__ == '__main__':
+    unittest.main()
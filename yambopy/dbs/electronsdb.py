@@ -12,7 +12,8 @@ import numpy as np
 from netCDF4 import Dataset
 from yambopy.tools.string import marquee
 from yambopy.tools.funcs import fermi, fermi_array
-from yambopy.lattice import car_red, rec_lat, vol_lat
+from yambopy.lattice import car_red, rec_lat, vol_lat, readonly
+from yambopy.lattice import sym_car_red, sym_red_rec, sym_car_rec, time_rev_symmetries
 from yambopy.kpoints import expand_kpoints, get_path
 from yambopy.plot.spectra import get_spectra
 from yambopy.units import ha2ev
@@ -108,10 +109,22 @@ class YamboElectronsDB():
     def max_eival(self):
         return np.max(self.eigenvalues)
 
+    @property
+    def iku_kpoints(self):
+        return self._iku_kpoints
+
+    @iku_kpoints.setter
+    def iku_kpoints(self,value):
+        if hasattr(self,"_red_kpoints"): delattr(self,"_red_kpoints")
+        if hasattr(self,"_car_kpoints"): delattr(self,"_car_kpoints")
+        self._iku_kpoints = value
+
     @property
     def car_kpoints(self):
         """convert form internal yambo units to cartesian lattice units"""
-        return np.array([ k/self.alat for k in self.iku_kpoints ])
+        if not hasattr(self,"_car_kpoints"):
+            self._car_kpoints = readonly(np.array(self.iku_kpoints)/self.alat)
+        return self._car_kpoints
 
     @property
     def red_kpoints(self):
@@ -173,19 +186,12 @@ class YamboElectronsDB():
     @property
     def time_rev_list(self):
         """get a list of symmetries with time reversal"""
-        time_rev_list = [False]*self.nsym
-        for i in range(self.nsym):
-            time_rev_list[i] = ( i >= self.nsym/(self.time_rev+1) )
-        return time_rev_list
+        return time_rev_symmetries(self.nsym,self.time_rev).tolist()
 
     @property
     def sym_rlu(self):
         """convert cartesian transformations to reduced transformations """
-        sym_rlu = np.zeros([self.nsym,3,3])
-        for n,s in enumerate(self.sym_car):
-            a = np.dot(s.T,np.linalg.inv(self.rlat))
-            sym_rlu[n] = np.dot(np.linalg.inv(self.lat.T),a)
-        return sym_rlu
+        return (np.linalg.inv(self.lat.T) @ (np.transpose(self.sym_car,(0,2,1)) @ np.linalg.inv(self.rlat))).astype(float)
 
     @property
     def nsym(self):
@@ -195,29 +201,22 @@ class YamboElectronsDB():
     def sym_red(self):
         """Convert cartesian transformations to reduced transformations"""
         if not hasattr(self,"_sym_red"):
-            sym_red = np.zeros([self.nsym,3,3],dtype=int)
-            for n,s in enumerate(self.sym_car):
-                sym_red[n] = np.round(np.dot(np.dot(self.lat,s.T),np.linalg.inv(self.lat)))
-            self._sym_red = sym_red
+            self._sym_red = readonly(sym_car_red(self.sym_car,self.lat))
         return self._sym_red
 
     @property
     def sym_rec_red(self):
         """Convert reduced transformations to reduced reciprocal transformations"""
         if not hasattr(self,"_sym_rec_red"):
-            sym_rec_red = np.zeros([self.nsym,3,3],dtype=int)
-            for n,s in enumerate(self.sym_red):
-                sym_rec_red[n] = np.linalg.inv(s).T
-            self._sym_rec_red = sym_rec_red
+            self._sym_rec_red = readonly(sym_red_rec(self.sym_red))
         return self._sym_rec_red
 
     @property
     def sym_rec(self):
         """Convert cartesian transformations to reciprocal transformations"""
-        sym_rec = np.zeros([self.nsym,3,3])
-        for n,s in enumerate(self.sym_car):
-            sym_rec[n] = np.linalg.inv(s).T
-        return sym_rec
+        if not hasattr(self,"_sym_rec"):
+            self._sym_rec = readonly(sym_car_rec(self.sym_car))
+        return self._sym_rec
 
     @property
     def efermi(self):
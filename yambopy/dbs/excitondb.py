@@ -8,25 +8,34 @@
 # This file is part of the yambopy project
 #
 import os
+import re
+import threading
 import numpy as np
 import matplotlib.pyplot as plt
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from netCDF4 import Dataset
 from itertools import product
 from yambopy.units import ha2ev, I
 from yambopy.plot.plotting import add_fig_kwargs,BZ_Wigner_Seitz
 from yambopy.lattice import replicate_red_kmesh, calculate_distances, car_red, red_car
 from yambopy.kpoints import get_path, get_path_car
-from yambopy.tools.funcs import gaussian, lorentzian, boltzman_f, abs2
+from yambopy.tools.funcs import boltzman_f, abs2
 from yambopy.tools.string import marquee
 from yambopy.tools.types import CmplxType
 from yambopy.plot.bandstructure import YambopyBandStructure
-from yambopy.tools.skw import SkwInterpolator
+from yambopy.tools.skw import get_skw_model
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
 from yambopy.dbs.qpdb import YamboQPDB
 from yambopy.io.cubetools import write_cube
 from yambopy.bse.realSpace_excitonwf import ex_wf2Real
 from yambopy.bse.rotate_excitonwf import rotate_exc_wf
+from yambopy.bse.exciton_spectrum import get_broadenings, exciton_spectrum
+
+# netCDF-C is not thread-safe: serialize the file access among threads
+# (reentrant, since BSEigenstates are created while a database is open)
+_netcdf_lock = threading.RLock()
 
 class ExcitonList():
     """
@@ -64,13 +73,96 @@ class Exciton():
     def __str__(self):
         return self.get_string()
 
+class BSEigenstates():
+    """
+    Lazy view of (a subset of) the BS_EIGENSTATES variable of a ndb.BS_diago file.
+
+    Only the selected excitons (rows) and transitions (columns) are read, in blocks,
+    when the view is indexed, so that the full variable is never in memory.
+    Indexing returns complex numpy arrays, as YamboExcitonDB.eigenvectors.
+
+    Example usage:
+
+        eivs = BSEigenstates('ndb.BS_diago_Q1',excitons=[0,3,4])
+        A = eivs[1]       ## third exciton of the file, all the transitions
+        A = eivs.read()   ## all the selected excitons
+
+    Attributes:
+        filename (str): ndb.BS_diago file.
+        excitons (array): rows of the file (starting from 0) of the excitons in this view.
+        columns (array): columns of the file (starting from 0) in this view. None means all.
+        shape (tuple): (number of excitons, number of columns).
+        dtype: complex dtype of the eigenvectors.
+    """
+    ## maximum size in bytes of the blocks read from the file
+    block_size = 1 << 24
+
+    def __init__(self,filename,excitons=None,columns=None):
+        self.filename = filename
+        with _netcdf_lock, Dataset(filename) as database:
+            nexcitons, ncolumns = database['BS_EIGENSTATES'].shape[:2]
+            self.dtype = np.dtype(CmplxType(database['BS_EIGENSTATES']))
+        self.excitons = np.arange(nexcitons) if excitons is None else np.array(excitons,dtype=int).reshape(-1)
+        self.columns = None if columns is None else np.array(columns,dtype=int).reshape(-1)
+        self.shape = (len(self.excitons), ncolumns if columns is None else len(self.columns))
+
+    @property
+    def ndim(self): return 2
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self,dtype=None,copy=None):
+        data = self.read()
+        return data if dtype is None else data.astype(dtype)
+
+    def __getitem__(self,key):
+        if not isinstance(key,tuple): key = (key,)
+        rows, rest = key[0], key[1:]
+        if rows is Ellipsis: rows = slice(None)
+        data = self.read(np.arange(len(self))[rows])
+        if rest: data = data[rest] if data.ndim == 1 else data[(slice(None),)+rest]
+        return data
+
+    def read(self,rows=None,database=None):
+        """
+        Read the excitons rows (indexes in this view, default all) as a complex array [..., ncolumns].
+        An open netCDF4 Dataset of filename can be passed to avoid reopening it.
+        """
+        if database is None:
+            with _netcdf_lock, Dataset(self.filename) as database: return self.read(rows,database)
+        if rows is None: rows = np.arange(len(self))
+        file_rows = self.excitons[rows]
+        if np.ndim(file_rows) == 0: return self.read([rows],database)[0]
+
+        var = database['BS_EIGENSTATES']
+        uniq, inverse = np.unique(file_rows,return_inverse=True)
+        if len(uniq) < len(file_rows): return self._read_sorted(var,uniq)[inverse]
+        data = np.empty((len(file_rows),self.shape[1]),dtype=self.dtype)
+        order = np.argsort(file_rows)
+        block = max(1,self.block_size//max(1,var.shape[1]*self.dtype.itemsize))
+        for b0 in range(0,len(order),block):
+            data[order[b0:b0+block]] = self._read_sorted(var,file_rows[order[b0:b0+block]])
+        return data
+
+    def _read_sorted(self,var,file_rows):
+        """ Read the (increasing) rows of the file, keeping the selected columns """
+        if len(file_rows) and file_rows[-1]-file_rows[0] == len(file_rows)-1:
+            eiv = var[file_rows[0]:file_rows[-1]+1,...].data
+        else:
+            eiv = var[file_rows,...].data
+        eiv = np.ascontiguousarray(eiv).view(dtype=self.dtype).reshape(eiv.shape[:-1])
+        if self.columns is not None: eiv = eiv[:,self.columns]
+        return eiv
+
 class YamboExcitonDB(object):
     """ Read the excitonic states database from yambo
 
         Exciton eigenvectors are arranged as eigenvectors[i_exc, i_kvc]
         Transitions are unpacked in table[ i_k, i_v, i_c, i_s_c, i_s_v ] (last two are spin indices)
     """
-    def __init__(self,lattice,Qpt,eigenvalues,l_residual,r_residual,spin_pol='no',car_qpoint=None,q_cutoff=None,Lkind=None,table=None,eigenvectors=None):
+    def __init__(self,lattice,Qpt,eigenvalues,l_residual,r_residual,spin_pol='no',car_qpoint=None,q_cutoff=None,Lkind=None,table=None,eigenvectors=None,
+                 exciton_indexes=None,transition_indexes=None,table_grid=None):
         if not isinstance(lattice,YamboLatticeDB):
             raise ValueError('Invalid type for lattice argument. It must be YamboLatticeDB')
 
@@ -88,15 +180,30 @@ class YamboExcitonDB(object):
             self.bs_bands = np.array([np.min(self.table[:,1]),np.max(self.table[:,2])]) # set range of bse bands
         self.eigenvectors = eigenvectors
         self.spin_pol = spin_pol
+        # rows of the database (starting from 1 for the excitons, from 0 for BS_TABLE) if only a subset was loaded
+        self.exciton_indexes = exciton_indexes
+        self.transition_indexes = transition_indexes
+        # (nkpoints, first valence band, nvbands, first conduction band, ncbands) of the full BS_TABLE,
+        # used by get_Akcv if only a subset of the transitions was loaded
+        self.table_grid = table_grid
 
     @classmethod
-    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q1',folder='.',Load_WF=True, neigs=-1):
+    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q1',folder='.',Load_WF=True, neigs=-1,
+                     excitons=None, transitions=None, lazy=False):
         """ 
         Initialize this class from a file
 
         Set `Read_WF=False` to avoid reading eigenvectors for faster IO and memory efficiency.
         If neigs < 0 ; all eigen values (vectors) are loaded or else first neigs are loaded 
         " In case of non-TDA, we load right eigenvectors.
+
+        Partial loading:
+            excitons    -> indexes (starting from 1) of the excitons to load, in any order (overrides neigs,
+                           also for coupling). Energies and residuals are restricted to the same excitons.
+            transitions -> boolean mask or indexes (starting from 0) of the rows of BS_TABLE to load
+                           (e.g. a k-window). The eigenvectors are restricted to the same transitions,
+                           get_Akcv puts them on the (k,c,v) grid of the full table, with zeros elsewhere.
+            lazy        -> keep the eigenvectors in the file (BSEigenstates) and read them on demand
         """
         path_filename = os.path.join(folder,filename)
         if not os.path.isfile(path_filename):
@@ -105,7 +212,7 @@ class YamboExcitonDB(object):
         # Qpoint
         Qpt = filename.split("Q",1)[1]
 
-        with Dataset(path_filename) as database:
+        with _netcdf_lock, Dataset(path_filename) as database:
             #energies
             eig =  database.variables['BS_Energies'][...].data*ha2ev
             is_coupling = database.variables['COUPLING'][...].data
@@ -119,7 +226,12 @@ class YamboExcitonDB(object):
             if neigs < 0 or neigs > neig_full or is_coupling:
                 neigs = neig_full
             #
-            eigenvalues = eigenvalues[:neigs]
+            rows = slice(0,neigs)
+            if excitons is not None:
+                rows = np.array(excitons,dtype=int).reshape(-1)-1
+                if np.any(rows < 0) or np.any(rows >= neig_full):
+                    raise ValueError("Exciton indexes must be between 1 and %d"%neig_full)
+            eigenvalues = eigenvalues[rows]
 
             # Check Lkind if present
             Lkind = None
@@ -133,19 +245,19 @@ class YamboExcitonDB(object):
                 #rer,imr = database.variables['BS_right_Residuals'][:].T
                 #l_residual = rel+iml*I
                 #r_residual = rer+imr*I
-                l_residual = database['BS_left_Residuals'][:neigs,...].data
-                r_residual = database['BS_right_Residuals'][:neigs,...].data
+                l_residual = database['BS_left_Residuals'][...].data[rows]
+                r_residual = database['BS_right_Residuals'][...].data[rows]
                 l_residual = l_residual.view(dtype=CmplxType(l_residual)).reshape(len(l_residual))
                 r_residual = r_residual.view(dtype=CmplxType(r_residual)).reshape(len(r_residual))
             if 'BS_Residuals' in list(database.variables.keys()):
                 # Compatibility with older Yambo versions
-                rel,iml,rer,imr = database['BS_Residuals'][:neigs,...].data.T
+                rel,iml,rer,imr = database['BS_Residuals'][...].data[rows].T
                 l_residual = rel+iml*I
                 r_residual = rer+imr*I
             if 'BS_L_magn_Residuals' in list(database.variables.keys()):
                 #residuals
-                rel,iml = database.variables['BS_L_magn_Residuals'][:].T
-                rer,imr = database.variables['BS_L_magn_Residuals'][:].T
+                rel,iml = database.variables['BS_L_magn_Residuals'][...].data[rows].T
+                rer,imr = database.variables['BS_L_magn_Residuals'][...].data[rows].T
                 l_residual = rel+iml*I
                 r_residual = rer+imr*I
 
@@ -158,15 +270,28 @@ class YamboExcitonDB(object):
             if Qpt=="1": car_qpoint = np.zeros(3)
 
             #eigenvectors
-            table = None
+            table = np.rint(database.variables['BS_TABLE'][:].T).astype(int)
+            columns = None
+            table_grid = None
+            if transitions is not None:
+                table_grid = (np.max(table[:,0]),np.min(table[:,1]),len(np.unique(table[:,1])),
+                              np.min(table[:,2]),len(np.unique(table[:,2])))
+                transitions = np.asarray(transitions)
+                if transitions.dtype == bool: transitions = np.flatnonzero(transitions)
+                columns = transitions
+                # coupling: the eigenvectors have the resonant and the anti-resonant parts
+                if 'BS_EIGENSTATES' in database.variables and database['BS_EIGENSTATES'].shape[1] == 2*len(table):
+                    columns = np.concatenate([transitions,transitions+len(table)])
+                table = table[transitions]
+
             eigenvectors = None
             if Load_WF and 'BS_EIGENSTATES' in database.variables:
-                eiv = database['BS_EIGENSTATES'][:neigs,...].data
-                #eiv = eiv[:,:,0] + eiv[:,:,1]*I
-                #eigenvectors = eiv
-                eigenvectors = eiv.view(dtype=CmplxType(eiv)).reshape(eiv.shape[:-1])
+                exciton_rows = np.arange(neig_full)[rows]
+                eigenvectors = BSEigenstates(path_filename,excitons=exciton_rows,columns=columns)
+                if not lazy:
+                    #eiv = eiv[:,:,0] + eiv[:,:,1]*I
+                    eigenvectors = eigenvectors.read(database=database)
 
-            table = np.rint(database.variables['BS_TABLE'][:].T).astype(int)
             spin_vars = [int(database.variables['SPIN_VARS'][:][0]), int(database.variables['SPIN_VARS'][:][1])]
             if spin_vars[0] == 2 and spin_vars[1] == 1:
                spin_pol = 'pol'
@@ -176,12 +301,14 @@ class YamboExcitonDB(object):
         path_cutoff = os.path.join(path_filename.split('ndb',1)[0],'ndb.cutoff')  
         q_cutoff = None
         if os.path.isfile(path_cutoff):
-            with Dataset(path_cutoff) as database:
+            with _netcdf_lock, Dataset(path_cutoff) as database:
                 bare_qpg = database.variables['CUT_BARE_QPG'][:]
                 bare_qpg = bare_qpg[:,:,0]+bare_qpg[:,:,1]*I
                 q_cutoff = np.abs(bare_qpg[0,int(Qpt)-1])
 
-        return cls(lattice,Qpt,eigenvalues,l_residual,r_residual,spin_pol,q_cutoff=q_cutoff,car_qpoint=car_qpoint,Lkind=Lkind,table=table,eigenvectors=eigenvectors)
+        exciton_indexes = None if excitons is None else rows+1
+        return cls(lattice,Qpt,eigenvalues,l_residual,r_residual,spin_pol,q_cutoff=q_cutoff,car_qpoint=car_qpoint,Lkind=Lkind,table=table,eigenvectors=eigenvectors,
+                   exciton_indexes=exciton_indexes,transition_indexes=transitions,table_grid=table_grid)
 
     @property
     def unique_vbands(self):
@@ -266,10 +393,21 @@ class YamboExcitonDB(object):
         np.savetxt('%s_I.dat'%prefix, data_i, fmt='%16.8f %20.8e %10d',
                    header='    E [ev]             Strength           Index')
 
-    def get_Akcv(self):
+    def get_Akcv(self,inplace=False):
         """
         Convert eigenvectors from (neigs,BS_table) -> (neigs,nblks,nspin,k,c,v)
         nblks = 2 for coupling, else 1 for TDA
+
+        With inplace=True the eigenvectors are reordered in their own memory (a block of
+        excitons at a time) together with the rows of BS_TABLE, so that no second copy is
+        allocated: Akcv is then a view of self.eigenvectors, which stay consistent with self.table.
+        Note that this changes the order of self.table (and of the eigenvectors) seen by the other methods.
+        Lazy eigenvectors (BSEigenstates) are read into a new array which is reordered in its own
+        memory; self.eigenvectors and self.table are left unchanged unless inplace=True, in which
+        case self.eigenvectors is replaced by the reordered array.
+
+        If only a subset of the transitions was loaded (see from_db_file), Akcv is defined on the
+        (k,c,v) grid of the full BS_TABLE and is zero for the missing transitions (never in place).
         """
         nspin = 1
         if self.spin_pol == 'pol': nspin = 2
@@ -279,34 +417,59 @@ class YamboExcitonDB(object):
         #
         if self.eigenvectors is None: return None
         eig_wfcs = self.eigenvectors
+        # a freshly read array can be reordered in its own memory
+        fresh = isinstance(eig_wfcs, BSEigenstates)
+        if fresh: eig_wfcs = eig_wfcs.read()
         #
         nk = self.nkpoints
         nv = self.nvbands
         nc = self.ncbands
-        # Make sure nspin * nc * nv * nk = BS_TABLE length
-        table_len = nspin*nk*nv*nc
-        assert table_len == self.table.shape[0], "BS_TABLE length not equal to ns * nc * nv * nk"
-        #
         v_min = np.min(self.table[:,1])
         c_min = np.min(self.table[:,2])
+        # subset of the transitions: (k,c,v) grid of the full table
+        if self.table_grid is not None:
+            nk, v_min, nv, c_min, nc = self.table_grid
+        ntransitions = self.table.shape[0]
+        table_len = nspin*nk*nv*nc
+        #
         bs_table0 = self.table[:,0]-1
         bs_table1 = self.table[:,1] - v_min
         bs_table2 = self.table[:,2] - c_min
         bs_table3 = self.table[:,3]-1
-        #
-        eig_wfcs_returned = np.zeros(eig_wfcs.shape,dtype=eig_wfcs.dtype)
+        if (np.any(bs_table1 < 0) or np.any(bs_table1 >= nv) or np.any(bs_table2 < 0) or np.any(bs_table2 >= nc)
+            or np.any(bs_table3 < 0) or np.any(bs_table3 >= nspin)):
+            raise ValueError("BS_TABLE is not on a nspin*nk*nc*nv grid (non contiguous bands or spins)")
         #
         sort_idx = bs_table0*nc*nv + bs_table2*nv + bs_table1 + nk*nc*nv*bs_table3
-        #
-        eig_wfcs_returned[:,sort_idx] = eig_wfcs[...,:table_len]
         # check if this is coupling .
-        if eig_wfcs.shape[-1]//table_len == 2:
-            eig_wfcs_returned[:,sort_idx+table_len] = eig_wfcs[...,table_len:]
-            # NM : Note that here v and c are inverted i.e 
-            # psi_S = Akcv * phi_v(r_e) * phi_c^*(r_h)
-            eig_wfcs_returned = eig_wfcs_returned.reshape(-1,2,nspin,nk,nc,nv)
-        else :
-            eig_wfcs_returned = eig_wfcs_returned.reshape(-1,1,nspin,nk,nc,nv)
+        nblks = 2 if eig_wfcs.shape[-1]//ntransitions == 2 else 1
+        #
+        if ntransitions != table_len:
+            # partial table (e.g. a k-window): zeros for the transitions that were not loaded
+            eig_wfcs_returned = np.zeros((len(eig_wfcs),nblks*table_len),dtype=eig_wfcs.dtype)
+            for iblk in range(nblks):
+                eig_wfcs_returned[:,sort_idx+iblk*table_len] = eig_wfcs[:,iblk*ntransitions:(iblk+1)*ntransitions]
+        elif inplace or fresh:
+            # new[:,sort_idx[t]] = old[:,t]  <=>  new[:,j] = old[:,order[j]]
+            order = np.argsort(sort_idx)
+            if np.any(order != np.arange(table_len)):
+                columns = np.concatenate([order+iblk*table_len for iblk in range(nblks)])
+                block = max(1,(1 << 24)//max(1,eig_wfcs[:1].nbytes))
+                for e0 in range(0,len(eig_wfcs),block):
+                    eig_wfcs[e0:e0+block] = eig_wfcs[e0:e0+block][:,columns]
+                if inplace:
+                    self.table = self.table[order]
+                    if hasattr(self,'_transitions_v_to_c'): del self._transitions_v_to_c
+            if inplace: self.eigenvectors = eig_wfcs
+            eig_wfcs_returned = eig_wfcs[:,:nblks*table_len]
+        else:
+            eig_wfcs_returned = np.zeros(eig_wfcs.shape,dtype=eig_wfcs.dtype)
+            eig_wfcs_returned[:,sort_idx] = eig_wfcs[...,:table_len]
+            if nblks == 2:
+                eig_wfcs_returned[:,sort_idx+table_len] = eig_wfcs[...,table_len:]
+        # NM : Note that here v and c are inverted i.e 
+        # psi_S = Akcv * phi_v(r_e) * phi_c^*(r_h)
+        eig_wfcs_returned = eig_wfcs_returned.reshape(-1,nblks,nspin,nk,nc,nv)
         #
         self.Akcv = eig_wfcs_returned
         return self.Akcv
@@ -346,7 +509,7 @@ class YamboExcitonDB(object):
         if fix_particle == 'h': name_file = 'electron'
         else: name_file = 'hole'
 
-        if phase and wfdb.wf.shape[1] != 1 and wfdb.wf.shape[3] != 1:
+        if phase and wfdb.nspin != 1 and wfdb.nspinor != 1:
             print("phase plot only works for nspin = 1 and nspinor == 1")
             phase = False
         if phase and len(iexe_degen_states) > 1:
@@ -611,63 +774,87 @@ class YamboExcitonDB(object):
         
         return bands_kpoints, exc_energies, exc_weights, path_car 
 
+    def get_exciton_projection(self,excitons,indexes,size,func=abs2,chunk=64):
+        """
+        Project a set of excitons onto a (flattened) grid, e.g. (k,band) or (k,v,c).
+
+        For each transition t of BS_TABLE, w_t = sum_S func(A^S_t) is computed for
+        blocks of `chunk` excitons (to bound the memory) and scattered with np.bincount
+        onto grid[index[t]] for each array in `indexes`. Negative indexes are skipped.
+        func can return several values per coefficient along a last axis (e.g. A and |A|):
+        the grid then has shape [size, nvalues].
+
+        Arguments:
+            excitons -> exciton indexes (starting from 1)
+            indexes  -> list of integer arrays [ntransitions] with the position of each transition in the grid
+            size     -> size of the grid
+            func     -> function of the exciton coefficients [nexc,ntransitions] to project (default |A|^2),
+                        returning [nexc,ntransitions] or [nexc,ntransitions,nvalues]
+            chunk    -> number of excitons processed at once
+
+        Returns the grid [size] and the norms sum_t |A^S_t|^2 of the excitons
+        """
+        if self.eigenvectors is None:
+            raise ValueError('This database does not contain Excitonic states,'
+                             'please re-run the yambo BSE calculation with the WRbsWF option in the input file.')
+        excitons = np.array(excitons,dtype=int).reshape(-1)-1
+        ntransitions = self.ntransitions
+
+        weights = 0
+        norms = np.zeros(len(excitons))
+        for e0 in range(0,len(excitons),chunk):
+            eivecs = self.eigenvectors[excitons[e0:e0+chunk],:ntransitions]
+            values = func(eivecs)
+            norms[e0:e0+chunk] = np.sum(values if func is abs2 else abs2(eivecs),axis=1)
+            weights = weights + np.sum(values,axis=0,dtype=complex if np.iscomplexobj(values) else float)
+        weights = np.broadcast_to(weights,(ntransitions,)+np.shape(weights)[1:])
+
+        grid = np.zeros((size,)+weights.shape[1:],dtype=complex if np.iscomplexobj(weights) else float)
+        grid_columns = grid.reshape(size,-1)
+        weights = weights.reshape(ntransitions,-1)
+        for index in indexes:
+            index = np.asarray(index)
+            keep = index >= 0
+            for column,values in zip(grid_columns.T,weights[keep].T):
+                column.real += np.bincount(index[keep],values.real,minlength=size)
+                if np.iscomplexobj(values): column.imag += np.bincount(index[keep],values.imag,minlength=size)
+        return grid, norms
+
+    @staticmethod
+    def check_exciton_norms(norms,atol=1e-3):
+        """ Raise an error if the weights of an exciton do not sum to 1 """
+        wrong = np.abs(norms-1) > atol
+        if np.any(wrong): raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%norms[wrong][0])
+
     def get_exciton_weights(self,excitons):
         """get weight of state in each band"""
-        weights = np.zeros([self.nkpoints,self.mband])
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv[0:3]-1
-                this_weight = abs2(eivec[t])
-                weights[k,c] += this_weight
-                weights[k,v] += this_weight
-                sum_weights += this_weight
-            if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
-
-        return weights
+        k,v,c = (self.table[:,:3]-1).T
+        nkpoints, mband = self.nkpoints, self.mband
+        weights, norms = self.get_exciton_projection(excitons,[k*mband+c,k*mband+v],nkpoints*mband)
+        self.check_exciton_norms(norms)
+
+        return weights.reshape(nkpoints,mband)
     
     def get_exciton_total_weights(self,excitons):
         """get weight of state in each band"""
-        total_weights = np.zeros(self.nkpoints)
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-#                k,c,v = kcv[0:3]
-                k = kcv[0]
-                total_weights[k-1] += abs2(eivec[t])
-            if abs(sum(total_weights) - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        total_weights, norms = self.get_exciton_projection(excitons,[self.table[:,0]-1],self.nkpoints)
+        self.check_exciton_norms(norms)
  
         return total_weights
 
     def get_exciton_transitions(self,excitons):
-        """get weight of state in each band"""
-        # Double check the part of the array w_k_v_to_c
-        # We should comment more this part
-        #weights = np.zeros([self.nkpoints,self.mband])
-        w_k_v_to_c = np.zeros([self.nkpoints,self.nvbands,self.ncbands])
+        """
+        get weight of each transition w_k_v_to_c[k,v,c], summed over the excitons
+        (older versions kept the weights of the last exciton only)
+        """
+        k,v,c = (self.table[:,:3]-1).T
+        nkpoints, nvbands, ncbands = self.nkpoints, self.nvbands, self.ncbands
         v_min = self.unique_vbands[0]
         c_min = self.unique_cbands[0]
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            #sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv-1                             
-                #k,v,c = kcv-1                 # bug?? Double-check
-                this_weight = abs2(eivec[t])
-                w_k_v_to_c[k,v-v_min,c-c_min] = this_weight   # new
-            #if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        index = (k*nvbands + v-v_min)*ncbands + c-c_min
+        w_k_v_to_c, norms = self.get_exciton_projection(excitons,[index],nkpoints*nvbands*ncbands)
  
-        #return weights, w_k_v_to_c
-        return w_k_v_to_c
+        return w_k_v_to_c.reshape(nkpoints,nvbands,ncbands)
 
     def get_exciton_2D(self,excitons,f=None):
         """get data of the exciton in 2D"""
@@ -998,13 +1185,9 @@ class YamboExcitonDB(object):
         # Get dense kpoints along the path (controlled by path.intervals)
         kpoints_path =  path.get_klist()[:,:3]
         
-        #interpolate energies
-        skw = SkwInterpolator(lpratio,kpoints,eigs[na,:,:],fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-        exc_energies = skw.interp_kpts(kpoints_path).eigens
-
-        #interpolate weights
-        skw = SkwInterpolator(lpratio,kpoints,weights[na,:,:],fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-        exc_weights = skw.interp_kpts(kpoints_path).eigens
+        #interpolate energies and weights (same kpoints: one model solved for both)
+        skw = get_skw_model(lpratio,kpoints,cell,symrel,trev_for_interp,verbose=verbose)
+        exc_energies, exc_weights = skw.interpolate(kpoints_path,eigs[na,:,:],weights[na,:,:],fermie=fermie,nelect=nelect)
 
         # For the band plot (bandstructure object), we need to switch to cartesian coordinates
         path_car = get_path_car(red_car(path.kpoints,lat.rlat),path)
@@ -1059,17 +1242,11 @@ class YamboExcitonDB(object):
         else:
             raise ValueError("Energies argument must be an instance of YamboElectronsDB or YamboQPDB. Got %s"%(type(energies)))
 
-        #interpolate energies
-        na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-        kpoints_path = path.get_klist()[:,:3]
-        energies = skw.interp_kpts(kpoints_path).eigens
-     
-        #interpolate transitions
+        #interpolate energies and transitions
         na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_transitions[na,:,:],fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
+        skw = get_skw_model(lpratio,ibz_kpoints,cell,symrel,trev_for_interp,verbose=verbose)
         kpoints_path = path.get_klist()[:,:3]
-        exc_transitions = skw.interp_kpts(kpoints_path).eigens
+        energies, exc_transitions = skw.interpolate(kpoints_path,ibz_energies[na,:,:],ibz_transitions[na,:,:],fermie=fermie,nelect=nelect)
 
         #create band-structure object
         exc_bands = YambopyBandStructure(energies[0],kpoints_path,kpath=path,weights=exc_weights[0],size=size,**kwargs)
@@ -1130,23 +1307,12 @@ class YamboExcitonDB(object):
         na = np.newaxis
         print("na")
         print(na)
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_model(lpratio,ibz_kpoints,cell,symrel,time_rev,verbose=verbose)
         kpoints_path = path.get_klist()[:,:3]
-        energies = skw.interp_kpts(kpoints_path).eigens
-     
-        #interpolate weights
-        na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        kpoints_path = path.get_klist()[:,:3]
-        exc_weights = skw.interp_kpts(kpoints_path).eigens
 
-        #interpolate spin projection
-        na = np.newaxis
-        print("na")
-        print(na)
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_spin[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        kpoints_path = path.get_klist()[:,:3]
-        spin_inter   = skw.interp_kpts(kpoints_path).eigens
+        #interpolate energies, weights and spin projection
+        energies, exc_weights, spin_inter = skw.interpolate(kpoints_path,ibz_energies[na,:,:],ibz_weights[na,:,:],ibz_spin[na,:,:],
+                                                            fermie=fermie,nelect=nelect)
         print("spin_inter")
         print(spin_inter)
 
@@ -1168,18 +1334,11 @@ class YamboExcitonDB(object):
         car_kpoints = self.lattice.car_kpoints
         nkpoints = len(car_kpoints)
         print(nkpoints)
-        amplitudes = np.zeros([nkpoints])
-        phases     = np.zeros([nkpoints],dtype=np.complex64)
-        for exciton in excitons:
-            #the the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-           
-            total = 0
-            for eh,kvc in enumerate(self.table):
-                ikbz, v, c = kvc-1
-                Acvk = eivec[eh]
-                phases[ikbz]     += Acvk
-                amplitudes[ikbz] += np.abs(Acvk)
+        ikbz = self.table[:,0]-1
+        # sum of A and |A| in a single projection
+        grid, norms = self.get_exciton_projection(excitons,[ikbz],nkpoints,
+                                                  func=lambda Acvk: np.stack([Acvk,np.abs(Acvk)],axis=-1))
+        phases, amplitudes = grid[:,0], grid[:,1].real
 
         #replicate kmesh
         red_kmesh,kindx = replicate_red_kmesh(self.lattice.red_kpoints,repx=repx,repy=repy,repz=repz)
@@ -1187,9 +1346,17 @@ class YamboExcitonDB(object):
 
         return car_kpoints, amplitudes[kindx], np.angle(phases)[kindx]
 
-    def get_chi(self,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,**kwargs):
+    def get_chi(self,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,
+                method='direct',chunk=None,**kwargs):
         """
         Calculate the BSE dielectric response function
+
+        broad can be a float, a tuple (linearly varying broadening), a 'gaussian: x eV' string,
+        an array with the broadening of each exciton or a list of these. For a list, all the spectra
+        are computed in one pass and chi has shape [len(broad), nenergies].
+        The excitons are summed in blocks of chunk states; method='fft' bins the oscillator strengths
+        on the energy grid and convolves them with the Lorentzian (uniform broadenings only),
+        see yambopy.bse.exciton_spectrum.exciton_spectrum.
         """
         if nexcitons == 'all': nexcitons = self.nexcitons
 
@@ -1200,35 +1367,28 @@ class YamboExcitonDB(object):
         if verbose:
             print("energy range: %lf -> +%lf -> %lf eV"%(emin,estep,emax))
             print("energy steps: %lf"%nenergies)
-            print("broadening: %lf eV"%broad)
-
-        #initialize the susceptibility intensity
-        chi = np.zeros_like(w,dtype=np.complex64)
+            print("broadening: %s eV"%str(broad))
 
-        # Oscillator strengths (residuals)
-        EL1 = self.l_residual
-        EL2 = self.r_residual
+        # Excitonic states and oscillator strengths (residuals)
+        es = self.eigenvalues[:nexcitons]
+        EL1 = self.l_residual[:nexcitons]
+        EL2 = self.r_residual[:nexcitons]
 
         # Broadening
-        if isinstance(broad, float): # fixed broadening
-            broad = np.full(nexcitons, broad) 
-        elif isinstance(broad, tuple):  # linearly varying broadening
-            broad_slope = broad[1] - broad[0]
-            min_exciton = np.min(self.eigenvalues.real)
-            broad = broad[0] + (self.eigenvalues[:nexcitons].real - min_exciton) * broad_slope
-
-        # Excitonic states
-        es = self.eigenvalues[:nexcitons, None]  # (nexcitons, 1)
-        broad = broad[:, None]  # (nexcitons, 1)
-
-        # Resonant and antiresonant GF structure
-        G1 = -1 / (w - es + broad * I)  # (nexcitons, nenergies)
-        G2 = -1 / (-w - es - broad * I)  # (nexcitons, nenergies)
+        broads, several = get_broadenings(broad,es.real,energy_min=np.min(self.eigenvalues.real))
 
         # chi = sum_s [ |R_s|^2/(w-E+i*eta) + |R_s|^2/(-w-E-i*eta) ]
-        chi = np.einsum('s,sn->n', EL1 * EL2, G1 + G2)
+        chi = exciton_spectrum(w,es,EL1*EL2,broads,method=method,chunk=chunk)
+        if not several: chi = chi[0]
         
-        #dimensional factors
+        chi = 1. + chi*self.get_chi_cofactor(q0norm,spin_degen) #We are actually computing the epsilon, not the chi.
+
+        return w,chi
+
+    def get_chi_cofactor(self,q0norm=1e-5,spin_degen=2):
+        """
+        Dimensional factor of the excitonic sum in get_chi
+        """
         try:
             if not self.Qpt=='1': q0norm = 2*np.pi*np.linalg.norm(self.car_qpoint)
         except:
@@ -1241,15 +1401,48 @@ class YamboExcitonDB(object):
             q0norm=1
 
         d3k_factor = self.lattice.rlat_vol/self.lattice.nkpoints
-        cofactor = ha2ev*spin_degen/(2*np.pi)**3 * d3k_factor * (4*np.pi)  / q0norm**2
+        return ha2ev*spin_degen/(2*np.pi)**3 * d3k_factor * (4*np.pi)  / q0norm**2
 
-        chi = 1. + chi*cofactor #We are actually computing the epsilon, not the chi.
+    @staticmethod
+    def get_chi_qpoints(excitondbs,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5,nexcitons='all',spin_degen=2,verbose=0,
+                        method='direct',chunk=None,**kwargs):
+        """
+        Dielectric response functions of a list of YamboExcitonDB (e.g. one per Q-point)
+        on the same energy grid, with the same arguments as get_chi.
+        The excitons of all the databases are summed in one pass (one binning and FFT for method='fft').
 
-        return w,chi
+        Returns w and chi [nqpoints, nenergies] (or [nqpoints, nbroad, nenergies])
+        """
+        #energy range
+        w = np.arange(emin,emax,estep,dtype=np.float32)
+        if verbose:
+            print("energy range: %lf -> +%lf -> %lf eV"%(emin,estep,emax))
+            print("energy steps: %lf"%len(w))
+            print("broadening: %s eV"%str(broad))
+
+        # excitons of all the Q-points, with the dimensional factor of their database
+        es, strengths, broads, groups = [], [], [], []
+        for iq,excitondb in enumerate(excitondbs):
+            nexc = excitondb.nexcitons if nexcitons == 'all' else nexcitons
+            es.append(excitondb.eigenvalues[:nexc])
+            cofactor = excitondb.get_chi_cofactor(q0norm,spin_degen)
+            strengths.append(excitondb.l_residual[:nexc]*excitondb.r_residual[:nexc]*cofactor)
+            b, several = get_broadenings(broad,es[-1].real,energy_min=np.min(excitondb.eigenvalues.real))
+            broads.append(b)
+            groups.append(np.full(len(es[-1]),iq))
+
+        chi = exciton_spectrum(w,np.concatenate(es),np.concatenate(strengths),np.concatenate(broads,axis=1),
+                               method=method,chunk=chunk,groups=np.concatenate(groups))
+        if not several: chi = chi[:,0]
+
+        return w, 1. + chi
     
-    def get_pl(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,Boltz_Temp=300,**kwargs):
+    def get_pl(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,Boltz_Temp=300,
+               method='direct',chunk=None,**kwargs):
         """
         Calculate PL_0  using excitonic states
+
+        broad, method and chunk are used as in get_chi
         """
         SPEED_OF_LIGHT    =  137*0.529*27.21/(6.582119569e-16)# finestructureconst * bohr2ang*HartreetoeV/hbar in eVs
         #SPEED_OF_LIGHT = 2.99792458e8
@@ -1267,9 +1460,6 @@ class YamboExcitonDB(object):
             print("energy range: %lf -> +%lf -> %lf "%(emin,estep,emax))
             print("energy steps: %lf"%nenergies)
 
-        #initialize the susceptibility intensity
-        pl = np.zeros([len(w)],dtype=np.complex64)
-
         if dipoles is None:
             #get dipole
             EL1 = self.l_residual
@@ -1279,40 +1469,16 @@ class YamboExcitonDB(object):
             if verbose: print("calculate exciton-light coupling")
             EL1,EL2 = self.project1(dipoles.dipoles[:,dir],nexcitons) 
 
-        if isinstance(broad,float): broad = [broad]*nexcitons
-
-        if isinstance(broad,tuple): 
-            broad_slope = broad[1]-broad[0]
-            min_exciton = np.min(self.eigenvalues.real)
-            broad = [ broad[0]+(es-min_exciton)*broad_slope for es in self.eigenvalues[:nexcitons].real]
-
-        if "gaussian" in broad or "lorentzian" in broad:
-            i = broad.find(":")
-            if i != -1:
-                value, eunit = broad[i+1:].split()
-                if eunit == "eV": sigma = float(value)
-                else: raise ValueError('Unknown unit %s'%eunit)
-
-            f = gaussian if "gaussian" in broad else lorentzian
-            broad = np.zeros([nexcitons])
-            for s in range(nexcitons):
-                es = self.eigenvalues[s].real
-                broad += f(self.eigenvalues.real,es,sigma)
-            broad = 0.1*broad/nexcitons
-
-        #iterate over the excitonic states
-        for s in range(nexcitons):
-            #get exciton energy
-            es = self.eigenvalues[s]
-            es_0 = self.eigenvalues[0] # first exciton level
-            print(es_0)
-            pl_0_weight = boltzman_f(es-es_0, Boltz_Temp)
-            #calculate the green's functions
-            G1 = -1/(   w - es + broad[s]*I)
-            G2 = -1/( - w - es - broad[s]*I)
-
-            r = EL1[s]*EL2[s]*pl_0_weight#*pl_prefactor
-            pl += r*G1 + r*G2
+        # excitonic states, weighted with the Boltzmann factor of the first exciton level
+        es = self.eigenvalues[:nexcitons]
+        es_0 = self.eigenvalues[0]
+        if verbose: print("first exciton level: %s eV"%str(es_0))
+        pl_0_weight = boltzman_f(es-es_0, Boltz_Temp)
+        r = EL1[:nexcitons]*EL2[:nexcitons]*pl_0_weight#*pl_prefactor
+
+        broads, several = get_broadenings(broad,es.real,energy_min=np.min(self.eigenvalues.real))
+        pl = exciton_spectrum(w,es,r,broads,method=method,chunk=chunk)
+        if not several: pl = pl[0]
 
         #dimensional factors
         if not self.Qpt=='1': q0norm = 2*np.pi*np.linalg.norm(self.car_qpoint)
@@ -1339,13 +1505,13 @@ class YamboExcitonDB(object):
             abs_label = 'epsilon'
         #cleanup kwargs variables
         cleanup_vars = ['dipoles','dir','emin','emax','estep','broad',
-                        'q0norm','nexcitons','spin_degen','verbose']
+                        'q0norm','nexcitons','spin_degen','verbose','method','chunk']
         for var in cleanup_vars: kwargs.pop(var,None)
         if 're' in reim: 
-            ax.plot(w,chi.real,**kwargs)
+            ax.plot(w,chi.real.T,**kwargs)
             ax.set_ylabel(r'$Re(\%s(\omega))$' % abs_label)
         if 'im' in reim:
-            ax.plot(w,chi.imag,**kwargs)
+            ax.plot(w,chi.imag.T,**kwargs)
             ax.set_ylabel(r'$Im(\%s(\omega))$' % abs_label)
         ax.set_xlabel('Energy (eV)')
         #plot vertical bar on the brightest excitons
@@ -1369,7 +1535,7 @@ class YamboExcitonDB(object):
     def save_chi(self,filename,**kwargs):
         """Compute chi and dump it to file"""
         w,chi = self.get_chi(**kwargs)
-        np.savetxt(filename,np.array([w,chi.imag,chi.real]).T)
+        np.savetxt(filename,np.vstack([w,chi.imag,chi.real]).T)
 
     ##########################################
     #  SPIN DEPENDENT PART UNDER DEVELOPMENT #
@@ -1494,48 +1660,28 @@ class YamboExcitonDB(object):
     def get_exciton_weights_spin_pol(self,excitons):
     
         """get weight of state in each band for spin-polarized case"""
-        table_up, table_dw, table_updw = [] , [], []
-        for t,kcv in enumerate(self.table):
-            k,c,v,c_s,v_s = kcv-1   # We substract 1 to be consistent with python numbering of arrays
-            if c_s == 0 and v_s == 0:
-               table_up.append(np.array(kcv[0:3]))
-            if c_s == 1 and v_s == 1:
-               table_dw.append(np.array(kcv[0:3]))
-            if c_s == 1 and v_s == 0:
-               table_updw.append(np.array(kcv[0:3]))
-        table_up=np.array(table_up)
-        table_dw=np.array(table_dw)
-        table_updw=np.array(table_updw)
-
-        self.unique_vbands_up = np.unique(table_up[:,1]-1)
-        self.unique_cbands_up = np.unique(table_up[:,2]-1)
-        self.unique_vbands_dw = np.unique(table_dw[:,1]-1)
-        self.unique_cbands_dw = np.unique(table_dw[:,2]-1)
+        k,v,c,s_c,s_v = (self.table[:,:5]-1).T   # We substract 1 to be consistent with python numbering of arrays
+        up = (s_c == 0) & (s_v == 0)
+        dw = (s_c == 1) & (s_v == 1)
+
+        self.unique_vbands_up = np.unique(v[up])
+        self.unique_cbands_up = np.unique(c[up])
+        self.unique_vbands_dw = np.unique(v[dw])
+        self.unique_cbands_dw = np.unique(c[dw])
         self.mband_up = max(self.unique_cbands_up) + 1
         self.mband_dw = max(self.unique_cbands_dw) + 1
         self.start_band_up = min(self.unique_vbands_up)
         self.start_band_dw = min(self.unique_vbands_dw)
 
-        weights_up = np.zeros([self.nkpoints,self.mband_up])
-        weights_dw = np.zeros([self.nkpoints,self.mband_dw])
-        
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v,c_s,v_s = kcv-1   # We substract 1 to be consistent with python numbering of arrays
-                this_weight = abs2(eivec[t])
-                if c_s == 0 and v_s == 0:
-                   weights_up[k,c] += this_weight
-                   weights_up[k,v] += this_weight
-                elif c_s == 1 and v_s == 1: 
-                   weights_dw[k,c] += this_weight
-                   weights_dw[k,v] += this_weight
-                sum_weights += this_weight
-            if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
- 
+        # spin-up and spin-down weights are projected together: [weights_up.flat, weights_dw.flat]
+        size_up = self.nkpoints*self.mband_up
+        size_dw = self.nkpoints*self.mband_dw
+        indexes = [np.where(up, k*self.mband_up+band, np.where(dw, size_up+k*self.mband_dw+band, -1)) for band in (c,v)]
+        weights, norms = self.get_exciton_projection(excitons,indexes,size_up+size_dw)
+        self.check_exciton_norms(norms)
+
+        weights_up = weights[:size_up].reshape(self.nkpoints,self.mband_up)
+        weights_dw = weights[size_up:].reshape(self.nkpoints,self.mband_dw)
         return weights_up, weights_dw
 
     def interpolate_spin_pol(self,energies,path,excitons,lpratio=5,f=None,size_up=1.0,size_dw=1.0,verbose=True,**kwargs):
@@ -1613,19 +1759,14 @@ class YamboExcitonDB(object):
         #interpolate energies
         na = np.newaxis
 
-        skw_up = SkwInterpolator(lpratio,ibz_kpoints_qp,ibz_energies_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        skw_dw = SkwInterpolator(lpratio,ibz_kpoints_qp,ibz_energies_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_model(lpratio,ibz_kpoints_qp,cell,symrel,time_rev,verbose=verbose)
         kpoints_path = path.get_klist()[:,:3]
-        energies_up = skw_up.interp_kpts(kpoints_path).eigens
-        energies_dw = skw_dw.interp_kpts(kpoints_path).eigens
+        energies_up, energies_dw = skw.interpolate(kpoints_path,ibz_energies_up[na,:,:],ibz_energies_dw[na,:,:],fermie=fermie,nelect=nelect)
      
         #interpolate weights
         na = np.newaxis
-        skw_up = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        skw_dw = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        kpoints_path = path.get_klist()[:,:3]
-        exc_weights_up = skw_up.interp_kpts(kpoints_path).eigens
-        exc_weights_dw = skw_dw.interp_kpts(kpoints_path).eigens
+        skw = get_skw_model(lpratio,ibz_kpoints,cell,symrel,time_rev,verbose=verbose)
+        exc_weights_up, exc_weights_dw = skw.interpolate(kpoints_path,ibz_weights_up[na,:,:],ibz_weights_dw[na,:,:],fermie=fermie,nelect=nelect)
 
         # Find and set the up-dw Fermi energy to zero
         self.nvbands_up = len(self.unique_vbands_up)
@@ -1697,3 +1838,111 @@ class YamboExcitonDB(object):
     
     def __str__(self):
         return self.get_string()
+
+def _read_exciton_db(lattice,filename,folder,kwargs):
+    """ Worker of YamboExcitonQDBs.from_folder """
+    return YamboExcitonDB.from_db_file(lattice,filename=filename,folder=folder,**kwargs)
+
+class YamboExcitonQDBs():
+    """
+    Excitonic states at several momenta Q, read from the ndb.BS_diago_Q* files of a folder.
+
+    The databases are read concurrently and the energies and residuals are stacked
+    in [nqpoints, nexcitons] arrays. By default the eigenvectors are kept in the files
+    (lazy BSEigenstates) and only read when needed, e.g. by get_Akcv.
+
+    Example usage:
+
+        excdbs = YamboExcitonQDBs.from_folder(lattice,folder='bse',neigs=10,workers=8)  ## 8 processes
+        excdbs.eigenvalues      ## [nqpoints, 10] energies
+        excdbs.get_Akcv(2)      ## eigenvectors of ndb.BS_diago_Q3 (read now)
+        exc = excdbs[0]         ## YamboExcitonDB of ndb.BS_diago_Q1
+
+    Attributes:
+        lattice (YamboLatticeDB): Lattice of the BSE calculation.
+        qpoints (array): Indexes (starting from 1) of the Q-points, as in ndb.BS_diago_Q{n}.
+        excitondbs (list): YamboExcitonDB of each Q-point.
+        nexcitons (int): Number of excitons stacked in eigenvalues and residuals
+                         (the minimum over the Q-points).
+        eigenvalues (array): Exciton energies [nqpoints, nexcitons].
+        l_residual, r_residual (array): Residuals [nqpoints, nexcitons].
+        car_qpoints (array): Cartesian Q-points [nqpoints, 3].
+    """
+    def __init__(self,lattice,qpoints,excitondbs):
+        self.lattice = lattice
+        self.qpoints = np.array(qpoints,dtype=int)
+        self.excitondbs = list(excitondbs)
+        self.nexcitons = min(excdb.nexcitons for excdb in self.excitondbs)
+        nexc = self.nexcitons
+        self.eigenvalues = np.array([excdb.eigenvalues[:nexc] for excdb in self.excitondbs])
+        self.l_residual = np.array([excdb.l_residual[:nexc] for excdb in self.excitondbs])
+        self.r_residual = np.array([excdb.r_residual[:nexc] for excdb in self.excitondbs])
+        self.car_qpoints = np.array([np.zeros(3) if excdb.car_qpoint is None else excdb.car_qpoint
+                                     for excdb in self.excitondbs])
+
+    @classmethod
+    def from_folder(cls,lattice,folder='.',qpoints=None,neigs=-1,Load_WF=True,lazy=True,
+                    workers=1,executor='process'):
+        """
+        Read the ndb.BS_diago_Q* databases of folder
+
+        :: qpoints  -> indexes (starting from 1) of the Q-points to read. Default: all the files found
+        :: neigs    -> number of excitons read at each Q (-1: all)
+        :: Load_WF  -> set to False to skip the eigenvectors
+        :: lazy     -> keep the eigenvectors in the files (BSEigenstates) and read them on demand
+        :: workers  -> number of concurrent readers (1: serial)
+        :: executor -> 'process' or 'thread' workers. The netCDF library is not thread-safe, so
+                       thread workers only overlap the processing of the data while processes
+                       also overlap the file reads (useful on slow or network file systems).
+        """
+        if qpoints is None:
+            qpoints = sorted(int(m.group(1)) for fname in glob(os.path.join(folder,'ndb.BS_diago_Q*'))
+                             if (m := re.fullmatch(r'ndb\.BS_diago_Q(\d+)',os.path.basename(fname))))
+            if not qpoints: raise FileNotFoundError("No ndb.BS_diago_Q* files in %s"%folder)
+        qpoints = np.array(qpoints,dtype=int).reshape(-1)
+        filenames = ['ndb.BS_diago_Q%d'%iq for iq in qpoints]
+        kwargs = dict(Load_WF=Load_WF,neigs=neigs,lazy=lazy)
+
+        if workers <= 1 or len(filenames) < 2:
+            excitondbs = [_read_exciton_db(lattice,filename,folder,kwargs) for filename in filenames]
+        elif executor in ('thread','process'):
+            Executor = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+            with Executor(max_workers=min(workers,len(filenames))) as pool:
+                excitondbs = list(pool.map(_read_exciton_db,[lattice]*len(filenames),filenames,
+                                           [folder]*len(filenames),[kwargs]*len(filenames)))
+            # the databases returned by processes have their own copy of the lattice
+            for excdb in excitondbs: excdb.lattice = lattice
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Use 'process' or 'thread'")
+        return cls(lattice,qpoints,excitondbs)
+
+    def __len__(self):
+        return len(self.excitondbs)
+
+    def __getitem__(self,iq):
+        return self.excitondbs[iq]
+
+    def __iter__(self):
+        return iter(self.excitondbs)
+
+    @property
+    def nqpoints(self): return len(self.excitondbs)
+
+    @property
+    def eigenvectors(self):
+        """ Eigenvectors (BSEigenstates if lazy, None if not loaded) of each Q-point """
+        return [excdb.eigenvectors for excdb in self.excitondbs]
+
+    def get_Akcv(self,iq):
+        """ Akcv of the iq-th Q-point (in this list), read from file if lazy. See YamboExcitonDB.get_Akcv """
+        return self.excitondbs[iq].get_Akcv()
+
+    def get_string(self,mark="="):
+        lines = []; app = lines.append
+        app( marquee(self.__class__.__name__,mark=mark) )
+        app( "number of Q-points:         %d"%self.nqpoints )
+        app( "number of excitons:         %d"%self.nexcitons )
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.get_string()
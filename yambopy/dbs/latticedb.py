@@ -8,13 +8,34 @@
 # This file is part of the yambopy project
 #
 import os
+import zipfile
+import hashlib
+import warnings
+import tempfile
 import numpy as np
 from netCDF4 import Dataset
 from yambopy.tools.jsonencoder import JsonDumper, JsonLoader
-from yambopy.lattice import vol_lat, rec_lat, car_red
-from yambopy.kpoints import expand_kpoints,make_kpositive
+from yambopy.tools.dmat_cache import file_hash, cache_root
+from yambopy.lattice import vol_lat, rec_lat, car_red, readonly
+from yambopy.lattice import sym_car_red, sym_red_rec, sym_car_rec, time_rev_symmetries
+from yambopy.kpoints import expand_kpoints, kpoint_grid_size
 from yambopy.tools.string import marquee
 
+## version of the cache layout. Bump it to invalidate all the existing files.
+LATTICEDB_CACHE_VERSION = 1
+
+def latticedb_cache_file(filename):
+    """ Cache of the ns.db1 file filename: $YAMBOPY_CACHE_DIR/latticedb/<hash of its path>.npz (default ~/.cache/yambopy) """
+    path_hash = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(cache_root(),'latticedb',path_hash+'.npz')
+
+def ibz_to_bz_indexes(BZ_to_IBZ_indexes):
+    """ {ik_ibz: indexes of the kpoints of its star in the BZ (in increasing order)} """
+    BZ_to_IBZ_indexes = np.asarray(BZ_to_IBZ_indexes)
+    order = np.argsort(BZ_to_IBZ_indexes,kind='stable')
+    ibz_indexes, counts = np.unique(BZ_to_IBZ_indexes,return_counts=True)
+    return dict(zip(ibz_indexes.tolist(),np.split(order,np.cumsum(counts)[:-1])))
+
 class YamboLatticeDB(object):
     """
     Class to read the lattice information from the netcdf file
@@ -40,12 +61,23 @@ class YamboLatticeDB(object):
         return cls.from_db_file(filename,Expand,atol)
     
     @classmethod
-    def from_db_file(cls,filename='ns.db1',Expand=True,atol=1e-6):
-        """ Initialize YamboLattice from a local dbfile """
+    def from_db_file(cls,filename='ns.db1',Expand=True,atol=1e-6,cache=False):
+        """
+        Initialize YamboLattice from a local dbfile
+
+        If cache is True, the lattice and the expansion of the kpoints are read from
+        (or written to) a cache file in the user cache folder (see latticedb_cache_file),
+        which is only used if it was built from the same ns.db1 (see read_cache).
+        Nothing is written next to filename.
+        """
 
         if not os.path.isfile(filename):
             raise FileNotFoundError("error opening %s in YamboLatticeDB"%filename)
 
+        if cache:
+            y = cls.read_cache(filename,Expand=Expand,atol=atol)
+            if y is not None: return y
+
         with Dataset(filename) as database:
 
             dimensions = database.variables['DIMENSIONS'][:]
@@ -81,7 +113,91 @@ class YamboLatticeDB(object):
 
         y = cls(**args)
         if Expand: y.expand_kpoints(atol=atol,verbose=0)
+        if cache: y.write_cache(filename,atol=atol)
         return y
+
+    ## constructor arguments stored in the cache
+    _cache_args = ['lat','alat','sym_car','iku_kpoints','car_atomic_positions','atomic_numbers',
+                   'time_rev','nelectrons','spinor_components','mag_syms']
+
+    @classmethod
+    def read_cache(cls,filename='ns.db1',Expand=True,atol=1e-6):
+        """
+        Read the cache of filename. Returns None if it does not exist, if it is
+        from another version, or if it does not match filename: the size and modification
+        time are compared first and, if they differ, the sha256 of the content.
+        If Expand is True the cache must also hold the expansion done with the same atol.
+        """
+        cache_file = latticedb_cache_file(filename)
+        try:
+            with np.load(cache_file) as data: data = dict(data)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+        if int(data.get('version',-1)) != LATTICEDB_CACHE_VERSION: return None
+        if Expand and (not bool(data['expanded']) or float(data['atol']) != atol): return None
+        stat = os.stat(filename)
+        touched = (int(data['db_size']),int(data['db_mtime'])) != (stat.st_size,stat.st_mtime_ns)
+        if touched and str(data['db_hash']) != file_hash(filename): return None
+
+        args = {}
+        for name in cls._cache_args:
+            value = data['arg_'+name]
+            args[name] = value.item() if value.ndim == 0 else value
+        if bool(data['expanded']): args['iku_kpoints'] = data['ibz_kpoints']
+        y = cls(**args)
+        y._sym_red     = readonly(data['sym_red'])
+        y._sym_rec_red = readonly(data['sym_rec_red'])
+        if Expand:
+            y.ibz_kpoints       = data['ibz_kpoints']
+            y.weights_ibz       = data['weights_ibz']
+            y.symmetry_indexes  = data['symmetry_indexes']
+            y.iku_kpoints       = list(data['iku_kpoints'])
+            y.BZ_to_IBZ_indexes = data['kpoints_indexes']
+            y.kpoints_indexes   = y.BZ_to_IBZ_indexes
+            y.IBZ_to_BZ_indexes = ibz_to_bz_indexes(y.BZ_to_IBZ_indexes)
+            y.kmap              = data['kmap']
+        if touched and (Expand or not bool(data['expanded'])):
+            y.write_cache(filename,atol=atol) # same content, new modification time
+        return y
+
+    def write_cache(self,filename='ns.db1',atol=1e-6):
+        """
+        Write the cache of filename (the ns.db1 this lattice was read from).
+        The file is written to a temporary name and then moved, so concurrent readers
+        never see a partial file. If the cache folder is not writable, a warning is issued.
+        """
+        cache_file = latticedb_cache_file(filename)
+        expanded = hasattr(self,'ibz_kpoints')
+        stat = os.stat(filename)
+        data = dict(version          = LATTICEDB_CACHE_VERSION,
+                    db_size          = stat.st_size,
+                    db_mtime         = stat.st_mtime_ns,
+                    db_hash          = file_hash(filename),
+                    expanded         = expanded,
+                    atol             = atol,
+                    sym_red          = self.sym_red,
+                    sym_rec_red      = self.sym_rec_red)
+        for name in self._cache_args:
+            data['arg_'+name] = np.asarray(getattr(self,name))
+        if expanded:
+            data.update(ibz_kpoints      = np.asarray(self.ibz_kpoints),
+                        iku_kpoints      = np.asarray(self.iku_kpoints),
+                        weights_ibz      = self.weights_ibz,
+                        symmetry_indexes = self.symmetry_indexes,
+                        kpoints_indexes  = self.kpoints_indexes,
+                        kmap             = self.kmap)
+        try:
+            os.makedirs(os.path.dirname(cache_file),exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(cache_file),suffix='.tmp')
+        except OSError as error:
+            warnings.warn("YamboLatticeDB cache not written to %s: %s"%(cache_file,error))
+            return
+        try:
+            with os.fdopen(fd,'wb') as f: np.savez(f,**data)
+            os.replace(tmp_name,cache_file)
+        except BaseException:
+            if os.path.exists(tmp_name): os.remove(tmp_name)
+            raise
  
     @classmethod    
     def from_dict(cls,data):
@@ -135,6 +251,7 @@ class YamboLatticeDB(object):
     def iku_kpoints(self,value):
         if hasattr(self,"_red_kpoints"): delattr(self,"_red_kpoints")
         if hasattr(self,"_car_kpoints"): delattr(self,"_car_kpoints")
+        if hasattr(self,"_kgrid"): delattr(self,"_kgrid")
         self._iku_kpoints = value
 
     @property
@@ -164,7 +281,7 @@ class YamboLatticeDB(object):
     def car_kpoints(self):
         """convert form internal yambo units to cartesian lattice units"""
         if not hasattr(self,"_car_kpoints"):
-            self._car_kpoints = np.array([ k/self.alat for k in self.iku_kpoints ])
+            self._car_kpoints = readonly(np.array(self.iku_kpoints)/self.alat)
         return self._car_kpoints
 
     @property
@@ -177,23 +294,8 @@ class YamboLatticeDB(object):
     @property
     def k_grid(self,atol=1.e-6):
         """Return the k-points grid dimensions """
-        if hasattr(self,"_kgrid"):
-            return self._kgrid
-        if not hasattr(self,"_red_kpoints"):
-            self._red_kpoints = car_red(self.car_kpoints,self.rlat)
-        self._kgrid =np.zeros(3,dtype=int)
-        self._small_q=np.full(3,1e4,dtype=float)
-        for idx in range(3): 
-            for kpt in self._red_kpoints:
-                val = abs(kpt[idx])
-                if atol < val < self._small_q[idx]:
-                    self._small_q[idx]=val
-        self._red_kpoints=make_kpositive(self._red_kpoints)
-        for idx in range(3): 
-            for kpt in self._red_kpoints:
-                n_grid = np.rint(kpt[idx]/self._small_q[idx])+1
-                if self._kgrid[idx]< n_grid:
-                    self._kgrid[idx]=n_grid
+        if not hasattr(self,"_kgrid"):
+            self._kgrid = readonly(kpoint_grid_size(self.red_kpoints,atol=atol))
         return self._kgrid
 
     def get_ibz_kpoints(self,units='iku'):
@@ -218,39 +320,27 @@ class YamboLatticeDB(object):
     def sym_red(self):
         """Convert cartesian transformations to reduced transformations"""
         if not hasattr(self,"_sym_red"):
-            sym_red = np.zeros([self.nsym,3,3],dtype=int)
-            for n,s in enumerate(self.sym_car):
-                sym_red[n] = np.round(np.dot(np.dot(self.lat,s.T),np.linalg.inv(self.lat)))
-            self._sym_red = sym_red
+            self._sym_red = readonly(sym_car_red(self.sym_car,self.lat))
         return self._sym_red
 
     @property
     def sym_rec_red(self):
         """Convert reduced transformations to reduced reciprocal transformations"""
         if not hasattr(self,"_sym_rec_red"):
-            sym_rec_red = np.zeros([self.nsym,3,3],dtype=int)
-            for n,s in enumerate(self.sym_red):
-                sym_rec_red[n] = np.linalg.inv(s).T
-            self._sym_rec_red = sym_rec_red
+            self._sym_rec_red = readonly(sym_red_rec(self.sym_red))
         return self._sym_rec_red
          
     @property
     def sym_rec(self):
         """Convert cartesian transformations to reciprocal transformations"""
         if not hasattr(self,"_sym_rec"):
-            sym_rec = np.zeros([self.nsym,3,3])
-            for n,s in enumerate(self.sym_car):
-                sym_rec[n] = np.linalg.inv(s).T
-            self._sym_rec = sym_rec
+            self._sym_rec = readonly(sym_car_rec(self.sym_car))
         return self._sym_rec
 
     @property
     def time_rev_list(self):
         """get a list of symmetries with time reversal"""
-        time_rev_list = [False]*self.nsym
-        for i in range(self.nsym):
-            time_rev_list[i] = ( i >= self.nsym/(self.time_rev+1) )
-        return time_rev_list
+        return time_rev_symmetries(self.nsym,self.time_rev).tolist()
 
     @property
     def nbandsv(self):
@@ -283,9 +373,7 @@ class YamboLatticeDB(object):
         self.BZ_to_IBZ_indexes = BZ_to_IBZ_indexes # for clarity for users
         self.kpoints_indexes   = BZ_to_IBZ_indexes # for compatibility
         # IBZ_to_BZ_indexes[ik_ibz] = {ik_bz} in the star (first element is identity)
-        self.IBZ_to_BZ_indexes = {}
-        for ibz_index in np.unique(BZ_to_IBZ_indexes):
-            self.IBZ_to_BZ_indexes[ibz_index] = np.where(BZ_to_IBZ_indexes == ibz_index)[0]
+        self.IBZ_to_BZ_indexes = ibz_to_bz_indexes(BZ_to_IBZ_indexes)
         kmap = np.zeros((self.nkpoints, 2), dtype=int)
         kmap[:, 0] = self.kpoints_indexes
         kmap[:, 1] = self.symmetry_indexes
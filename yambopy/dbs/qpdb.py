@@ -285,7 +285,7 @@ class YamboQPDB():
         """
         Interpolate the QP bandstrcture on a k-point path, requires the lattice structure with Expand=False
         """
-        from yambopy.tools.skw import SkwInterpolator
+        from yambopy.tools.skw import get_skw_model
 
         cell = (lattice.lat, lattice.red_atomic_positions, lattice.atomic_numbers)
         nelect = 0
@@ -314,6 +314,9 @@ class YamboQPDB():
         
         band_kpoints_rlu = path.get_klist()[:,:3]
 
+        # stars and factorised SKW system, shared by KS, QP and Z
+        skw = get_skw_model(lpratio,kpoints,cell,symrel,trev_for_interp,verbose=verbose)
+
         # Obtain quantities in cc needed for plot (since interpolation wants rlu)
         _, _, path_car = get_path(lattice.car_kpoints,lattice.rlat,lattice.sym_car,path)
         band_kpoints = red_car(band_kpoints_rlu,lattice.rlat)
@@ -325,10 +328,8 @@ class YamboQPDB():
               print('Spin-polarized bands DFT')
               eigens_up = self.eigenvalues_dft[np.newaxis,:,:,0]
               eigens_dw = self.eigenvalues_dft[np.newaxis,:,:,1]
-              skw_up = SkwInterpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-              skw_dw = SkwInterpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-              dft_eigens_up_kpath = skw_up.interp_kpts(band_kpoints_rlu).eigens[0]
-              dft_eigens_dw_kpath = skw_dw.interp_kpts(band_kpoints_rlu).eigens[0]
+              dft_eigens_up_kpath, dft_eigens_dw_kpath = [eigens[0] for eigens in
+                  skw.interpolate(band_kpoints_rlu,eigens_up,eigens_dw,fermie=fermie,nelect=nelect)]
 
               #if valence: kwargs['fermie'] = np.max(dft_eigens_kpath[:,:valence])
               # tricky 
@@ -338,9 +339,8 @@ class YamboQPDB():
            else:
               print('No spin-polarized bands DFT')
               eigens  = self.eigenvalues_dft[np.newaxis,:]
-              skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
               #kpoints_path = path.get_klist()[:,:3]
-              dft_eigens_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
+              dft_eigens_kpath = skw.fit(eigens,fermie,nelect).interp_kpts(band_kpoints_rlu).eigens[0]
               if valence: kwargs['fermie'] = np.max(dft_eigens_kpath[:,:valence])
               ks_ebands = YambopyBandStructure(dft_eigens_kpath,band_kpoints,kpath=path_car,**kwargs)
 
@@ -357,11 +357,9 @@ class YamboQPDB():
                    eigens_up[0,ik,:], eigens_dw[0,ik,:] = sorted(aux_up[0,ik,:]), sorted(aux_dw[0,ik,:])
                #end sorting
 
-               skw_up = SkwInterpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
-               skw_dw = SkwInterpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
                #kpoints_path = path.get_klist()[:,:3]
-               qp_eigens_up_kpath = skw_up.interp_kpts(band_kpoints_rlu).eigens[0]
-               qp_eigens_dw_kpath = skw_dw.interp_kpts(band_kpoints_rlu).eigens[0]
+               qp_eigens_up_kpath, qp_eigens_dw_kpath = [eigens[0] for eigens in
+                   skw.interpolate(band_kpoints_rlu,eigens_up,eigens_dw,fermie=fermie,nelect=nelect)]
                #if valence: kwargs['fermie'] = np.max(dft_eigens_kpath[:,:valence])
                # tricky 
                qp_ebands_up = YambopyBandStructure(qp_eigens_up_kpath,band_kpoints,kpath=path_car,**kwargs)
@@ -375,9 +373,8 @@ class YamboQPDB():
                for ik in range(self.nkpoints):
                    eigens[0,ik,:] = sorted(aux[0,ik,:])
                #end sorting
-               skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
                #kpoints_path = path.get_klist()[:,:3]
-               qp_eigens_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
+               qp_eigens_kpath = skw.fit(eigens,fermie,nelect).interp_kpts(band_kpoints_rlu).eigens[0]
                if valence: kwargs['fermie'] = np.max(qp_eigens_kpath[:,:valence])
 
                qp_ebands = YambopyBandStructure(qp_eigens_kpath,band_kpoints,kpath=path_car,**kwargs)
@@ -386,9 +383,8 @@ class YamboQPDB():
             qp_z_kpath = None
             if 'Z' in what:
                 eigens = self.z[np.newaxis,:]
-                skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,trev_for_interp,verbose=verbose)
                 #kpoints_path = path.get_klist()[:,:3]
-                qp_z_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
+                qp_z_kpath = skw.fit(eigens,fermie,nelect).interp_kpts(band_kpoints_rlu).eigens[0]
                 
 
         if self.spin == True:
@@ -410,7 +406,7 @@ class YamboQPDB():
 
         """
 
-        from yambopy.tools.skw import SkwInterpolator
+        from yambopy.tools.skw import get_skw_model
 
         #consistency check with electrons k-points
         if len(yel_coarse.red_kpoints)!=self.nkpoints:
@@ -438,7 +434,7 @@ class YamboQPDB():
 
         corrections_coarse = qp_coarse-ks_coarse
         corrections_coarse = corrections_coarse.reshape(1,Nkpts_coarse,Nbands_coarse)
-        skw = SkwInterpolator(lpratio,kpts_coarse,corrections_coarse,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_model(lpratio,kpts_coarse,cell,symrel,time_rev,verbose=verbose).fit(corrections_coarse,fermie,nelect)
 
         kpts_dense = yel_dense.red_kpoints
         ks_dense = np.squeeze(np.array(yel_dense.eigenvalues_ibz))[:,:Nbands_coarse]
@@ -0,0 +1,30 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Helpers to generate synthetic exciton databases (ndb.BS_diago_Q* files)
+with given transition tables and eigenvectors. Used by the exciton tests and benchmarks.
+"""
+import numpy as np
+from netCDF4 import Dataset
+
+def write_bs_diago(filename,table,eigenvectors,energies):
+    """ minimal ndb.BS_diago file (TDA if eigenvectors has len(table) columns, coupling if 2*len(table)) """
+    neig, ncols = eigenvectors.shape
+    with Dataset(filename,'w') as database:
+        database.createDimension('neig',neig)
+        database.createDimension('ncols',ncols)
+        database.createDimension('ntransitions',len(table))
+        database.createDimension('complex',2)
+        database.createDimension('table',table.shape[1])
+        database.createVariable('BS_Energies','f8',('neig','complex'))[:] = np.stack([energies,np.zeros(neig)],axis=1)
+        database.createVariable('COUPLING','i4',())[...] = int(ncols == 2*len(table))
+        database.createVariable('BS_left_Residuals','f8',('neig','complex'))[:] = np.ones((neig,2))
+        database.createVariable('BS_right_Residuals','f8',('neig','complex'))[:] = np.ones((neig,2))
+        database.createVariable('BS_EIGENSTATES','f8',('neig','ncols','complex'))[:] = np.stack([eigenvectors.real,eigenvectors.imag],axis=2)
+        database.createVariable('BS_TABLE','f8',('table','ntransitions'))[:] = table.T
+        database.createVariable('SPIN_VARS','i4',('complex',))[:] = [1,1]
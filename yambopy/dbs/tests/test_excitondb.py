@@ -6,9 +6,12 @@
 import numpy as np
 import unittest
 import os
-from yambopy.dbs.excitondb import YamboExcitonDB
+import shutil
+import tempfile
+from yambopy.dbs.excitondb import YamboExcitonDB, YamboExcitonQDBs, BSEigenstates
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
+from yambopy.dbs.tests.excitondb_synthetic import write_bs_diago
 from qepy.lattice import Path
 
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
@@ -55,5 +58,136 @@ class TestYamboExcitonDB(unittest.TestCase):
         if os.path.isfile('exc_E.dat'): os.remove('exc_E.dat')
 
 
+class TestExcitonProjection(unittest.TestCase):
+
+    def setUp(self):
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        rng = np.random.default_rng(0)
+        nk = len(lat.red_kpoints)
+        k,v,c,s = np.meshgrid(np.arange(1,nk+1),[3,4],[5,6,7],[1,2],indexing='ij')
+        table = np.stack([k.ravel(),v.ravel(),c.ravel(),s.ravel(),s.ravel()],axis=1)[rng.permutation(k.size)]
+        eivecs = rng.normal(size=(6,len(table)))+1j*rng.normal(size=(6,len(table)))
+        eivecs /= np.linalg.norm(eivecs,axis=1)[:,None]
+        self.exc = YamboExcitonDB(lat,'1',np.arange(6)+0j,None,None,spin_pol='pol',table=table,eigenvectors=eivecs)
+
+    def test_weights(self):
+        """ the projection kernel reproduces the loops over BS_TABLE """
+        exc, excitons = self.exc, (1,3,6)
+        weights = np.zeros((exc.nkpoints,exc.mband))
+        transitions = np.zeros((exc.nkpoints,exc.nvbands,exc.ncbands))
+        weights_up = np.zeros((exc.nkpoints,exc.mband))
+        for exciton in excitons:
+            for t,(k,v,c,s_c,s_v) in enumerate(exc.table-1):
+                weight = abs(exc.eigenvectors[exciton-1,t])**2
+                weights[k,[v,c]] += weight
+                transitions[k,v-2,c-4] += weight
+                if s_c == 0: weights_up[k,[v,c]] += weight
+
+        np.testing.assert_allclose(exc.get_exciton_weights(excitons),weights,atol=1e-12)
+        np.testing.assert_allclose(exc.get_exciton_transitions(excitons),transitions,atol=1e-12)
+        phases = np.zeros(exc.nkpoints,dtype=complex)
+        amplitudes = np.zeros(exc.nkpoints)
+        for exciton in excitons:
+            for t,k in enumerate(exc.table[:,0]-1):
+                phases[k] += exc.eigenvectors[exciton-1,t]
+                amplitudes[k] += abs(exc.eigenvectors[exciton-1,t])
+        kpoints, amplitude, phase = exc.get_amplitudes_phases(excitons)
+        np.testing.assert_allclose(amplitude,amplitudes,atol=1e-12)
+        np.testing.assert_allclose(phase,np.angle(phases),atol=1e-12)
+        # the weights of the excitons are summed, not overwritten
+        np.testing.assert_allclose(exc.get_exciton_transitions(excitons),
+                                   sum(exc.get_exciton_transitions([exciton]) for exciton in excitons),atol=1e-12)
+        np.testing.assert_allclose(exc.get_exciton_total_weights(excitons),weights.sum(axis=1)/2,atol=1e-12)
+        np.testing.assert_allclose(exc.get_exciton_weights_spin_pol(excitons)[0],weights_up,atol=1e-12)
+        np.testing.assert_allclose(exc.get_exciton_projection(excitons,[exc.table[:,0]-1],exc.nkpoints,chunk=2)[0],
+                                   weights.sum(axis=1)/2,atol=1e-12)
+
+        exc.eigenvectors[2] *= 2
+        with self.assertRaises(ValueError): exc.get_exciton_weights(excitons)
+
+class TestPartialExcitonDB(unittest.TestCase):
+
+    def setUp(self):
+        self.lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        rng = np.random.default_rng(0)
+        k,v,c = np.meshgrid(np.arange(1,len(self.lat.red_kpoints)+1),[3,4],[5,6,7],indexing='ij')
+        self.table = np.stack([k.ravel(),v.ravel(),c.ravel(),np.ones(k.size),np.ones(k.size)],axis=1).astype(int)[rng.permutation(k.size)]
+        self.eivecs = rng.normal(size=(8,2*len(self.table)))+1j*rng.normal(size=(8,2*len(self.table)))
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_partial(self):
+        """ selected excitons/transitions and lazy eigenvectors match the full database, also after get_Akcv(inplace=True) """
+        for ncols in [len(self.table),2*len(self.table)]:
+            write_bs_diago(os.path.join(self.tmp_path,'ndb.BS_diago_Q1'),self.table,self.eivecs[:,:ncols],np.linspace(0.1,0.2,8))
+            full = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path)
+            Akcv = full.get_Akcv()
+            np.testing.assert_array_equal(full.eigenvectors,self.eivecs[:,:ncols])
+
+            excitons = [6,2,3]
+            exc = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path,excitons=excitons)
+            np.testing.assert_array_equal(exc.eigenvectors,full.eigenvectors[np.array(excitons)-1])
+            np.testing.assert_array_equal(exc.eigenvalues,full.eigenvalues[np.array(excitons)-1])
+
+            mask = self.table[:,0] <= 2
+            exc = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path,transitions=mask)
+            np.testing.assert_array_equal(exc.table,self.table[mask])
+            np.testing.assert_array_equal(exc.eigenvectors[:,:np.sum(mask)],full.eigenvectors[:,:len(mask)][:,mask])
+
+            exc = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path,excitons=excitons,lazy=True)
+            self.assertIsInstance(exc.eigenvectors,BSEigenstates)
+            np.testing.assert_array_equal(exc.eigenvectors[1],full.eigenvectors[1])
+            np.testing.assert_array_equal(exc.get_Akcv(),Akcv[np.array(excitons)-1])
+            # the lazy view and the order of the table are kept
+            self.assertIsInstance(exc.eigenvectors,BSEigenstates)
+            np.testing.assert_array_equal(exc.table,self.table)
+
+            exc = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path)
+            weights = exc.get_exciton_projection((1,2),[exc.table[:,0]-1],exc.nkpoints)[0]
+            self.assertTrue(np.shares_memory(exc.get_Akcv(inplace=True),exc.eigenvectors))
+            np.testing.assert_array_equal(exc.Akcv,Akcv)
+            np.testing.assert_allclose(exc.get_exciton_projection((1,2),[exc.table[:,0]-1],exc.nkpoints)[0],weights)
+
+    def test_kwindow(self):
+        """ get_Akcv of a k-window not starting at the first k-point is the full Akcv outside the window set to zero """
+        for ncols in [len(self.table),2*len(self.table)]:
+            write_bs_diago(os.path.join(self.tmp_path,'ndb.BS_diago_Q1'),self.table,self.eivecs[:,:ncols],np.linspace(0.1,0.2,8))
+            Akcv = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path).get_Akcv()
+            for mask in [self.table[:,0] >= 2, (self.table[:,0] == 2) & (self.table[:,2] != 6)]:
+                exc = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path,transitions=mask)
+                ref = np.zeros_like(Akcv)
+                for k,v,c in self.table[mask][:,:3]:
+                    ref[:,:,0,k-1,c-5,v-3] = Akcv[:,:,0,k-1,c-5,v-3]
+                np.testing.assert_array_equal(exc.get_Akcv(),ref)
+                np.testing.assert_array_equal(exc.get_Akcv(inplace=True),ref)
+
+    def test_qpoints(self):
+        """ concurrent reading of several ndb.BS_diago_Q* files """
+        for iq in range(3):
+            write_bs_diago(os.path.join(self.tmp_path,'ndb.BS_diago_Q%d'%(iq+1)),self.table,self.eivecs[:,:len(self.table)],np.linspace(0.1,0.2,8)+iq)
+        for executor in ['thread','process']:
+            excdbs = YamboExcitonQDBs.from_folder(self.lat,folder=self.tmp_path,neigs=5,workers=2,executor=executor)
+            np.testing.assert_array_equal(excdbs.qpoints,[1,2,3])
+            self.assertEqual(excdbs.eigenvalues.shape,(3,5))
+            for iq,exc in enumerate(excdbs):
+                ref = YamboExcitonDB.from_db_file(self.lat,folder=self.tmp_path,filename='ndb.BS_diago_Q%d'%(iq+1),neigs=5)
+                self.assertIs(exc.lattice,self.lat)
+                self.assertIsInstance(exc.eigenvectors,BSEigenstates)
+                np.testing.assert_array_equal(excdbs.eigenvalues[iq],ref.eigenvalues)
+                np.testing.assert_array_equal(excdbs.get_Akcv(iq),ref.get_Akcv())
+
+    def test_chi_qpoints(self):
+        """ one pass over the excitons of all the Q-points against get_chi of each database """
+        for iq in range(3):
+            write_bs_diago(os.path.join(self.tmp_path,'ndb.BS_diago_Q%d'%(iq+1)),self.table,self.eivecs[:,:len(self.table)],np.linspace(0.1,0.2,8)+iq)
+        excdbs = YamboExcitonQDBs.from_folder(self.lat,folder=self.tmp_path,neigs=5)
+        for method in ['direct','fft']:
+            w, chi = YamboExcitonDB.get_chi_qpoints(excdbs,emin=0,emax=4,broad=[0.1,0.2],method=method)
+            self.assertEqual(chi.shape,(3,2,len(w)))
+            for iq,exc in enumerate(excdbs):
+                np.testing.assert_allclose(chi[iq],exc.get_chi(emin=0,emax=4,broad=[0.1,0.2],method=method)[1],rtol=1e-8)
+
 if __name__ == '__main__':
     unittest.main()
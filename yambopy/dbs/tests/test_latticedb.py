@@ -5,9 +5,13 @@
 #
 import unittest
 import os
+import shutil
+import tempfile
+import numpy as np
 from qepy.lattice import Path
 from yambopy.kpoints import get_path
-from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.latticedb import YamboLatticeDB, latticedb_cache_file
+from yambopy.lattice import readonly
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw_conv')
 
 class TestYamboLatticeDB(unittest.TestCase):
@@ -37,8 +41,55 @@ class TestYamboLatticeDB(unittest.TestCase):
 
         print(ydb)
 
+    def test_cache(self):
+        """ the cache gives back the same expansion and is dropped when ns.db1 changes """
+        tmp_path = tempfile.mkdtemp()
+        cache_dir = os.environ.get('YAMBOPY_CACHE_DIR')
+        os.environ['YAMBOPY_CACHE_DIR'] = os.path.join(tmp_path,'cache')
+        try:
+            filename = os.path.join(tmp_path,'ns.db1')
+            shutil.copy(os.path.join(test_path,'SAVE/ns.db1'),filename)
+            ref = YamboLatticeDB.from_db_file(filename)
+            self.assertFalse(os.path.exists(os.path.join(tmp_path,'cache')))
+            YamboLatticeDB.from_db_file(filename,cache=True)
+            self.assertTrue(os.path.isfile(latticedb_cache_file(filename)))
+            self.assertEqual(sorted(os.listdir(tmp_path)),['cache','ns.db1'])
+            ydb = YamboLatticeDB.read_cache(filename)
+            for attr in ['iku_kpoints','ibz_kpoints','weights_ibz','kpoints_indexes','symmetry_indexes','kmap','sym_red']:
+                np.testing.assert_array_equal(getattr(ydb,attr),getattr(ref,attr))
+            for ik in ref.IBZ_to_BZ_indexes:
+                np.testing.assert_array_equal(ydb.IBZ_to_BZ_indexes[ik],ref.IBZ_to_BZ_indexes[ik])
+            self.assertIsNone(YamboLatticeDB.read_cache(filename,atol=1e-4))
+            os.utime(filename,ns=(0,0)) # same content
+            self.assertIsNotNone(YamboLatticeDB.read_cache(filename))
+            with open(filename,'ab') as f: f.write(b'\0')
+            self.assertIsNone(YamboLatticeDB.read_cache(filename))
+        finally:
+            if cache_dir is None: del os.environ['YAMBOPY_CACHE_DIR']
+            else: os.environ['YAMBOPY_CACHE_DIR'] = cache_dir
+            shutil.rmtree(tmp_path)
+
+    def test_properties(self):
+        """ batched symmetry properties against the per-symmetry definitions, cached as read-only arrays """
+        ydb = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE/ns.db1'),cache=False)
+        for n,s in enumerate(ydb.sym_car):
+            sym_red = np.round(np.dot(np.dot(ydb.lat,s.T),np.linalg.inv(ydb.lat)))
+            np.testing.assert_array_equal(ydb.sym_red[n],sym_red)
+            np.testing.assert_array_equal(ydb.sym_rec_red[n],np.round(np.linalg.inv(sym_red).T))
+            np.testing.assert_array_equal(ydb.sym_rec[n],np.linalg.inv(s).T)
+            self.assertEqual(ydb.time_rev_list[n], n >= ydb.nsym/(ydb.time_rev+1))
+        np.testing.assert_array_equal(ydb.car_kpoints,[k/ydb.alat for k in ydb.iku_kpoints])
+        np.testing.assert_array_equal(ydb.k_grid,[2,2,2])
+        self.assertIsInstance(ydb.time_rev_list,list)
+        for attr in ['sym_red','sym_rec_red','sym_rec','car_kpoints','k_grid']:
+            self.assertFalse(getattr(ydb,attr).flags.writeable)
+            self.assertIs(getattr(ydb,attr),getattr(ydb,attr))
+        array = np.zeros(3)
+        self.assertFalse(readonly(array).flags.writeable)
+        self.assertTrue(array.flags.writeable)
+
     def tearDown(self): 
-        os.remove('lattice.json')
+        if os.path.isfile('lattice.json'): os.remove('lattice.json')
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,270 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import os
+import time
+from yambopy.dbs.wfdb import YamboWFDB, GvecIndex, wfc_inner_product
+from yambopy.kpoints import find_kpt
+from scipy.spatial import KDTree
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+from yambopy.tools.dmat_cache import DmatCache
+
+class TestYamboWFDB(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_path = tempfile.mkdtemp()
+        make_synthetic_save(os.path.join(cls.tmp_path,'SAVE'),nbands=6,nspinor=2)
+        cls.wfdb = YamboWFDB(path=cls.tmp_path,bands_range=[1,5])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_path)
+
+    def test_lazy(self):
+        """ lazy loading gives the same wavefunctions with a bounded cache """
+        lazy = YamboWFDB(path=self.tmp_path,bands_range=[1,5],lazy=True,cache_size=2)
+        self.assertIsNone(lazy.wf_packed)
+        self.assertEqual(lazy.ng,self.wfdb.ng)
+        np.testing.assert_array_equal(lazy.wf,self.wfdb.wf)
+        self.assertEqual(len(lazy._wf_cache),0)
+
+        for ik in range(self.wfdb.nkpoints):
+            wfc, gvecs = lazy.get_iBZ_wf(ik)
+            wfc_ref, gvecs_ref = self.wfdb.get_iBZ_wf(ik)
+            np.testing.assert_array_equal(wfc,wfc_ref)
+            np.testing.assert_array_equal(gvecs,gvecs_ref)
+            self.assertLessEqual(len(lazy._wf_cache),2)
+
+        for ik,isym in [(1,3),(3,5)]:
+            for a,b in zip(lazy.rotate_wfc(ik,isym),self.wfdb.rotate_wfc(ik,isym)):
+                np.testing.assert_array_equal(a,b)
+
+        np.testing.assert_allclose(lazy.wfcG2r(2,1),self.wfdb.wfcG2r(2,1))
+        np.testing.assert_allclose(lazy.get_spin_m_e_BZ(),self.wfdb.get_spin_m_e_BZ())
+
+    def test_parallel_read(self):
+        """ thread and process readers fill the same array as the serial one """
+        for executor in ['thread','process']:
+            wfdb = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,workers=2,executor=executor)
+            self.assertEqual(wfdb.wf.dtype,self.wfdb.wf.dtype)
+            np.testing.assert_array_equal(wfdb.wf_packed,self.wfdb.wf_packed)
+
+    def test_packed_storage(self):
+        """ packed storage and the padded compatibility views (built once, read-only) """
+        wf, gvecs = self.wfdb.wf, self.wfdb.gvecs
+        self.assertIs(self.wfdb.wf,wf)
+        self.assertIs(self.wfdb.gvecs,gvecs)
+        self.assertFalse(wf.flags.writeable or gvecs.flags.writeable)
+        self.assertEqual(len(self.wfdb.wf_packed),self.wfdb.wf_offsets[-1])
+        for ik in range(self.wfdb.nkpoints):
+            ng = self.wfdb.ngvecs[ik]
+            wfc, gvec = self.wfdb.get_iBZ_wf(ik)
+            self.assertTrue(np.shares_memory(wfc,self.wfdb.wf_packed))
+            np.testing.assert_array_equal(wf[ik,...,:ng],wfc)
+            np.testing.assert_array_equal(wf[ik,...,ng:],0)
+            np.testing.assert_array_equal(gvecs[ik,:ng],gvec)
+            np.testing.assert_array_equal(gvecs[ik,ng:],2147483646)
+
+        self.wfdb.expand_fullBZ()
+        wf_bz, g_bz = self.wfdb.wf_bz, self.wfdb.g_bz
+        self.assertIs(self.wfdb.wf_bz,wf_bz)
+        self.assertIs(self.wfdb.g_bz,g_bz)
+        for ik in range(self.wfdb.nkBZ):
+            kbz, wfc, gvec = self.wfdb.rotate_wfc(self.wfdb.ydb.kpoints_indexes[ik],self.wfdb.ydb.symmetry_indexes[ik])
+            ng = len(gvec)
+            np.testing.assert_array_equal(wf_bz[ik,...,:ng],wfc)
+            np.testing.assert_array_equal(g_bz[ik,:ng],gvec)
+            for a,b in zip(self.wfdb.get_BZ_wf(ik),[wfc,gvec]):
+                np.testing.assert_array_equal(a,b)
+
+    def test_iter_BZ(self):
+        """ streamed and memmap full BZ wavefunctions """
+        wfdb = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,lazy=True,cache_size=1)
+        iks_all = []
+        for iks, kvecs, wfcs, gvecs in wfdb.iter_BZ_wf(chunk=3,bands=[1,3]):
+            self.assertLessEqual(len(iks),3)
+            iks_all.extend(iks)
+            for ik, kvec, wfc, gvec in zip(iks,kvecs,wfcs,gvecs):
+                kref, wref, gref = self.wfdb.rotate_wfc(wfdb.ydb.kpoints_indexes[ik],wfdb.ydb.symmetry_indexes[ik])
+                np.testing.assert_allclose(kvec,kref)
+                np.testing.assert_array_equal(wfc,wref[:,1:3])
+                np.testing.assert_array_equal(gvec,gref)
+        self.assertEqual(iks_all,list(range(wfdb.nkBZ)))
+        self.assertIsNone(wfdb.wf_bz_packed)
+
+        dmat = wfdb.Dmat()
+        wfdb.expand_fullBZ(memmap=os.path.join(self.tmp_path,'wf_bz.dat'))
+        self.assertIsInstance(wfdb.wf_bz_packed,np.memmap)
+        for ik in range(wfdb.nkBZ):
+            for a,b in zip(wfdb.get_BZ_kwfc(ik),self.wfdb.rotate_wfc(wfdb.ydb.kpoints_indexes[ik],wfdb.ydb.symmetry_indexes[ik])):
+                np.testing.assert_array_equal(a,b)
+        symm_mat = wfdb.ydb.sym_car
+        np.testing.assert_allclose(wfdb.Dmat(symm_mat,np.zeros((len(symm_mat),3)),wfdb.ydb.time_rev),dmat,atol=1e-6)
+
+    def test_fft(self):
+        """ batched FFT engine against a plain scatter + ifftn """
+        grid = self.wfdb.fft_box + 2
+        cel_vol = abs(np.linalg.det(self.wfdb.ydb.lat.T))
+        refs = []
+        for ik in range(self.wfdb.nkpoints):
+            wfc, gvec = self.wfdb.get_iBZ_wf(ik)
+            box = np.zeros(wfc.shape[:-1]+tuple(grid),dtype=complex)
+            box[...,gvec[:,0]%grid[0],gvec[:,1]%grid[1],gvec[:,2]%grid[2]] = wfc
+            refs.append(np.fft.ifftn(box,axes=(-3,-2,-1),norm='forward')/np.sqrt(cel_vol))
+        scale = np.abs(refs).max()
+
+        np.testing.assert_allclose(self.wfdb.wfcG2r(1,[0,2],grid=grid),refs[1][:,[0,2]],atol=1e-5*scale)
+        np.testing.assert_allclose(self.wfdb.wfcG2r(1,3,grid=grid),refs[1][:,3],atol=1e-5*scale)
+        np.testing.assert_allclose(self.wfdb.wfcG2r_kpoints(range(self.wfdb.nkpoints),grid=grid),refs,atol=1e-5*scale)
+        wfc_r = self.wfdb.wfcG2r_kpoints([2,0],bands=[1,3],grid=grid,dtype=np.complex64)
+        self.assertEqual(wfc_r.dtype,np.complex64)
+        np.testing.assert_allclose(wfc_r,np.array(refs)[[2,0]][:,:,1:3],atol=1e-5*scale)
+
+        fft = self.wfdb.get_fft_engine(grid)
+        wfc, gvec = self.wfdb.get_iBZ_wf(3)
+        first = fft.transform(wfc,gvec,key=('iBZ',3),reuse=True).copy()
+        fft.transform(wfc[:,::-1],gvec,key=('iBZ',3),reuse=True)
+        np.testing.assert_array_equal(fft.transform(wfc,gvec,key=('iBZ',3),reuse=True),first)
+        self.assertIs(fft,self.wfdb.get_fft_engine(grid))
+
+    def test_dtype(self):
+        """ single precision mode against double precision """
+        wf64 = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,dtype=np.complex128)
+        wf32 = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,dtype=np.complex64,
+                         lazy=True)
+        self.assertEqual(wf64.wf_packed.dtype,np.complex128)
+        self.assertEqual(wf32.get_wf_kpoint(0).dtype,np.complex64)
+        wfpar = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,dtype=np.complex128,workers=2)
+        np.testing.assert_array_equal(wfpar.wf_packed,wf64.wf_packed)
+
+        rot64, rot32 = wf64.rotate_wfc(2,5), wf32.rotate_wfc(2,5)
+        self.assertEqual(rot32[1].dtype,np.complex64)
+        np.testing.assert_allclose(rot32[1],rot64[1],rtol=1e-6,atol=1e-6*np.abs(rot64[1]).max())
+
+        ip64 = wfc_inner_product(*rot64,*rot64)
+        ip32 = wfc_inner_product(*rot32,*rot32)
+        self.assertEqual(ip32.dtype,np.complex64)
+        np.testing.assert_allclose(ip32,ip64,atol=1e-5*np.abs(ip64).max())
+
+        symm_mat = wf64.ydb.sym_car
+        frac_vec = np.random.default_rng(3).random((len(symm_mat),3))
+        d64, d32 = wf64.Dmat(symm_mat,frac_vec,True), wf32.Dmat(symm_mat,frac_vec,True)
+        self.assertEqual(d32.dtype,np.complex64)
+        np.testing.assert_allclose(d32,d64,atol=1e-5*np.abs(d64).max())
+
+        s64, s32 = wf64.get_spin_m_e_BZ(), wf32.get_spin_m_e_BZ()
+        self.assertEqual(s32.dtype,np.complex64)
+        np.testing.assert_allclose(s32,s64,atol=1e-5*np.abs(s64).max())
+
+        r64 = wf64.to_real_space(*wf64.get_iBZ_wf(1))
+        r32 = wf32.to_real_space(*wf32.get_iBZ_wf(1))
+        self.assertEqual(r32.dtype,np.complex64)
+        np.testing.assert_allclose(r32,r64,atol=1e-5*np.abs(r64).max())
+
+    def test_gvec_index(self):
+        """ exact G-vector lookup against a KDTree and brute force inner products """
+        gvecs = self.wfdb.get_iBZ_gvecs(1)
+        gindex = GvecIndex(gvecs)
+        query = np.concatenate([gvecs[::-3]+np.array([1,0,-1]),gvecs.max(axis=0)[None]+1])
+        dd, ii = KDTree(gvecs).query(query)
+        idx = gindex.find(query)
+        np.testing.assert_array_equal(idx>=0,dd<1e-6)
+        np.testing.assert_array_equal(idx[idx>=0],ii[dd<1e-6])
+
+        # rotated index of BZ k-points
+        for ik in range(self.wfdb.nkBZ):
+            kvec, wfc, gvec = self.wfdb.rotate_wfc(self.wfdb.ydb.kpoints_indexes[ik],self.wfdb.ydb.symmetry_indexes[ik])
+            np.testing.assert_array_equal(self.wfdb.get_BZ_gvec_index(ik).find(gvec),np.arange(len(gvec)))
+
+        kvec, wfc, gvec = self.wfdb.rotate_wfc(2,4)
+        ref = wfc_inner_product(kvec,wfc,gvec,kvec+1,wfc,gvec+1,ket_Gtree=KDTree(gvec+1))
+        np.testing.assert_allclose(wfc_inner_product(kvec,wfc,gvec,kvec+1,wfc,gvec+1),ref,rtol=1e-5)
+        np.testing.assert_allclose(wfc_inner_product(kvec,wfc,gvec,kvec+1,wfc,gvec+1,
+                                   bra_Gindex=GvecIndex(gvec)),ref,rtol=1e-5)
+
+    def reference_Dmat(self, wfdb, symm_mat, frac_vec, time_rev):
+        """ Dmat with one apply_symm/wfc_inner_product call per (k,symmetry) """
+        nsym = len(symm_mat)
+        kmap = zip(wfdb.ydb.kpoints_indexes,wfdb.ydb.symmetry_indexes)
+        rotated = [wfdb.rotate_wfc(ik,isym) for ik,isym in kmap]
+        dmat = np.zeros((nsym,wfdb.nkBZ,wfdb.nspin,wfdb.nbands,wfdb.nbands),dtype=complex)
+        for ik in range(wfdb.nkBZ):
+            for isym in range(nsym):
+                trev = (isym >= nsym/(1+int(time_rev)))
+                Rk, wfc_Rk, gvec_Rk = wfdb.apply_symm(*rotated[ik],trev,symm_mat[isym],frac_vec[isym])
+                k_rk, w_rk, g_rk = rotated[find_kpt(wfdb.ktree,Rk)]
+                dmat[isym,ik] = wfc_inner_product(k_rk,w_rk,g_rk,Rk,wfc_Rk,gvec_Rk,ket_Gtree=KDTree(gvec_Rk))
+        return dmat
+
+    def test_dmat(self):
+        """ batched Dmat against the (k,symmetry) loop """
+        wfdb = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb)
+        symm_mat = wfdb.ydb.sym_car
+        frac_vec = np.random.default_rng(1).random((len(symm_mat),3))
+        ref = self.reference_Dmat(wfdb,symm_mat,frac_vec,True)
+        scale = np.abs(ref).max()
+        np.testing.assert_allclose(wfdb.Dmat(symm_mat,frac_vec,True),ref,atol=1e-5*scale)
+        np.testing.assert_allclose(wfdb.Dmat(symm_mat,frac_vec,True,sym_batch=5),ref,atol=1e-5*scale)
+
+        ref = self.reference_Dmat(wfdb,symm_mat,0*frac_vec,wfdb.ydb.time_rev)
+        np.testing.assert_allclose(wfdb.Dmat(),ref,atol=1e-5*scale)
+        wfdb.expand_fullBZ()
+        np.testing.assert_allclose(wfdb.Dmat(symm_mat,0*frac_vec,wfdb.ydb.time_rev),ref,atol=1e-5*scale)
+
+    def test_dmat_parallel(self):
+        """ process-pool Dmat is identical to the serial one, lazy workers read their own fragments """
+        wfdb = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb,lazy=True)
+        symm_mat = wfdb.ydb.sym_car
+        frac_vec = np.random.default_rng(2).random((len(symm_mat),3))
+        dmat = wfdb.Dmat(symm_mat,frac_vec,True,workers=2)
+        self.assertEqual(len(wfdb._wf_cache),0)
+        np.testing.assert_array_equal(dmat,wfdb.Dmat(symm_mat,frac_vec,True))
+        np.testing.assert_array_equal(self.wfdb.Dmat(symm_mat,frac_vec,True,workers=3),
+                                      self.wfdb.Dmat(symm_mat,frac_vec,True))
+
+    def test_dmat_cache(self):
+        """ persistent Dmat cache: keys, hits, eviction """
+        cache = DmatCache(os.path.join(self.tmp_path,'dmat_cache'))
+        wfdb = YamboWFDB(path=self.tmp_path,bands_range=[1,5],latdb=self.wfdb.ydb)
+        symm_mat = wfdb.ydb.sym_car
+        frac_vec = np.zeros((len(symm_mat),3))
+        ref = wfdb.Dmat(symm_mat,frac_vec,False,cache=cache)
+        self.assertEqual(len(cache.entries()),1)
+        np.testing.assert_array_equal(cache.load(wfdb.Dmat_cache_key(symm_mat,frac_vec,False)),ref)
+        np.testing.assert_array_equal(wfdb.Dmat(symm_mat,frac_vec,False,cache=cache.cache_dir),ref)
+        self.assertEqual(len(cache.entries()),1)
+
+        # a different band range, symmetry set or time reversal is a different entry
+        other = YamboWFDB(path=self.tmp_path,bands_range=[0,5],latdb=self.wfdb.ydb)
+        keys = {wfdb.Dmat_cache_key(symm_mat,frac_vec,False), wfdb.Dmat_cache_key(symm_mat,frac_vec,True),
+                wfdb.Dmat_cache_key(symm_mat[:6],frac_vec[:6],False), other.Dmat_cache_key(symm_mat,frac_vec,False),
+                wfdb.Dmat_cache_key(symm_mat,frac_vec+0.5,False)}
+        self.assertEqual(len(keys),5)
+
+        # the least recently used entry is evicted first: a is read after b was saved
+        cache.clear()
+        cache.save('a',ref)
+        time.sleep(0.05)
+        cache.save('b',ref)
+        time.sleep(0.05)
+        np.testing.assert_array_equal(cache.load('a'),ref)
+        time.sleep(0.05)
+        cache.max_size = cache.size()
+        cache.save('c',ref)
+        self.assertNotIn('b',cache)
+        self.assertIn('a',cache)
+        self.assertIn('c',cache)
+        cache.clear()
+        self.assertEqual(cache.size(),0)
+
+if __name__ == '__main__':
+    unittest.main()
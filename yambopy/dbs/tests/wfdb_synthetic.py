@@ -0,0 +1,73 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+"""
+Helpers to generate synthetic SAVE folders (ns.db1 + ns.wf fragments)
+with random wavefunction coefficients. Used by the wfdb tests and benchmarks.
+"""
+import os
+import numpy as np
+from netCDF4 import Dataset
+
+template_db1 = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse','SAVE','ns.db1')
+
+def _dim(database,size):
+    """ get (or create) a dimension with the yambo naming convention """
+    name = 'D_%010d'%size
+    if name not in database.dimensions: database.createDimension(name,size)
+    return name
+
+def make_synthetic_save(save_path,nbands=8,nspin=1,nspinor=1,nkpoints=None,seed=0,template=template_db1):
+    """
+    Write a SAVE folder with a copy of the template ns.db1 and random ns.wf fragments.
+
+    :: save_path -> folder to be created (ns.db1 and ns.wf_fragments_* are written inside)
+    :: nbands, nspin, nspinor -> dimensions of the synthetic wavefunctions
+    :: nkpoints -> number of IBZ kpoints. If None, the template kpoints are used, otherwise
+                   the template kpoints are repeated with a random shift to reach nkpoints.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(save_path,exist_ok=True)
+
+    with Dataset(template) as tmpl:
+        kpts    = tmpl['K-POINTS'][...].data.T
+        wfc_ng  = tmpl['WFC_NG'][...].data
+        wfc_grd = tmpl['WFC_GRID'][...].data
+        nk_tmpl = len(kpts)
+        if nkpoints is None: nkpoints = nk_tmpl
+        kidx = np.arange(nkpoints)%nk_tmpl
+        new_kpts = kpts[kidx].copy()
+        new_kpts[nk_tmpl:] += 1e-2*rng.random((nkpoints-nk_tmpl,3))
+        ng = wfc_grd.shape[1]
+
+        dims = tmpl['DIMENSIONS'][...].data.copy()
+        dims[5]  = nbands
+        dims[6]  = nkpoints
+        dims[11] = nspinor
+        dims[12] = nspin
+
+        with Dataset(os.path.join(save_path,'ns.db1'),'w',format='NETCDF3_64BIT_OFFSET') as db1:
+            for name,var in tmpl.variables.items():
+                if name in ['K-POINTS','EIGENVALUES','WFC_NG','WFC_GRID']: continue
+                out = db1.createVariable(name,var.dtype,tuple(_dim(db1,s) for s in var.shape))
+                out[...] = var[...]
+            db1['DIMENSIONS'][...] = dims
+            db1.createVariable('K-POINTS','f4',(_dim(db1,3),_dim(db1,nkpoints)))[...] = new_kpts.T
+            db1.createVariable('EIGENVALUES','f4',(_dim(db1,nspin),_dim(db1,nkpoints),_dim(db1,nbands)))[...] = \
+                np.sort(rng.random((nspin,nkpoints,nbands)),axis=-1)
+            db1.createVariable('WFC_NG','f4',(_dim(db1,nkpoints),))[...] = wfc_ng[kidx]
+            db1.createVariable('WFC_GRID','f4',(_dim(db1,nkpoints),_dim(db1,ng)))[...] = wfc_grd[kidx]
+
+    for ispin in range(nspin):
+        for ik in range(nkpoints):
+            fname = os.path.join(save_path,'ns.wf_fragments_%d_1'%(ispin*nkpoints+ik+1))
+            with Dataset(fname,'w',format='NETCDF3_64BIT_OFFSET') as frag:
+                varname = 'WF_COMPONENTS_@_SP_POL%d_K%d_BAND_GRP_1'%(ispin+1,ik+1)
+                dim_names = (_dim(frag,nbands),_dim(frag,nspinor),_dim(frag,ng),_dim(frag,2))
+                frag.createVariable(varname,'f4',dim_names)[...] = rng.standard_normal((nbands,nspinor,ng,2))
+
+    return save_path
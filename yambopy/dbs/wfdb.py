@@ -8,6 +8,9 @@ from yambopy.tools.string import marquee
 from yambopy.units import I
 import shutil
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from tqdm import tqdm
 import scipy.fft
 from yambopy.io.cubetools import write_cube
@@ -23,6 +26,8 @@ except ImportError as e:
 from yambopy.kpoints import build_ktree, find_kpt
 from yambopy.tools.function_profiler import func_profile
 from yambopy.tools.citations import citation
+from yambopy.tools.lru_cache import LRUCache
+from yambopy.tools.dmat_cache import DmatCache, dmat_cache_key
 
 class YamboWFDB:
     """
@@ -42,18 +47,49 @@ class YamboWFDB:
 
         abc.expand_fullBZ() ## expand wfcs to full BZ
 
+        ## for very large SAVEs, read the wfcs of each k-point only when needed
+        ## and keep at most cache_size k-points in memory
+        abc_lazy = wfdb.YamboWFDB(path='.', bands_range = [5,10], lazy=True, cache_size=8)
+
+        ## full BZ wfcs kept on disk, or never stored and rotated block by block
+        abc_lazy.expand_fullBZ(memmap='wf_bz.dat')
+        for iks, kvecs, wfcs, gvecs in abc_lazy.iter_BZ_wf(chunk=32): pass
+
+        ## single precision wavefunctions (half the memory and faster Dmat/FFTs)
+        abc_sp = wfdb.YamboWFDB(path='.', bands_range = [5,10], dtype=np.complex64)
+
+        ## read the ns.wf fragments with 8 worker processes (useful on parallel filesystems)
+        abc_par = wfdb.YamboWFDB(path='.', bands_range = [5,10], workers=8)
+
         abc.write2cube(ik=2,ib=2) ## write electronic wfc to .cube for visualization
 
+        wfc_r = abc.wfcG2r_kpoints([0,1,2], dtype=np.complex64) ## real space wfcs, one batched (single precision) FFT
+
         print(abc.get_spin_projections(ik = 2,ib= 0)) ## get spin projection for SOC systems
 
         Dmat = abc.Dmat() ## compute phase matrices for SAVE symmetries
+
+        Dmat = abc.Dmat(workers=4) ## same, with 4 worker processes sharing the wfcs
+
+        Dmat = abc.Dmat(cache='dmat_cache') ## read from / stored in a persistent cache (see DmatCache)
     ::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
 
     Attributes:
         path (str): Path to the directory containing the wavefunction files.
         filename (str): Name of the wavefunction file (default: 'ns.wf').
-        wf (numpy.ndarray): Wavefunctions stored as a 5D array [nkpoints, nspin, nbands, nspinor, ngvect].
-        gvecs (numpy.ndarray): G-vectors for the wavefunctions [nkpoints, ngvect, 3] (in reduced/crystal coordiantes).
+        wf_packed (numpy.ndarray): Wavefunctions of all k-points stored one after the other in a flat
+                                   buffer, without padding. The block of k-point ik is
+                                   wf_packed[wf_offsets[ik]:wf_offsets[ik+1]] with shape
+                                   [nspin, nbands, nspinor, ngvecs[ik]]. None in lazy mode.
+        wf_offsets (numpy.ndarray): Offsets of each k-point in wf_packed [nkpoints+1].
+        gvecs_packed (numpy.ndarray): G-vectors of all k-points [sum(ngvecs), 3] (in reduced/crystal coordiantes).
+        gvecs_offsets (numpy.ndarray): Offsets of each k-point in gvecs_packed [nkpoints+1].
+        wf (numpy.ndarray): Padded view of the wavefunctions [nkpoints, nspin, nbands, nspinor, ngvect].
+                            Read-only, built at the first access and kept (kept for compatibility).
+        gvecs (numpy.ndarray): Padded view of the G-vectors [nkpoints, ngvect, 3]. Invalid G-vectors are
+                               set to 2147483646. Read-only, built at the first access and kept.
+        lazy (bool): If True, the wavefunctions of each k-point are read on first access.
+        wf_dtype (numpy.dtype): Complex dtype of the wavefunctions (see the dtype option).
         kpts_iBZ (numpy.ndarray): K-points in the irreducible Brillouin Zone (iBZ) in crystal coordinates.
         ngvecs (numpy.ndarray): Number of meaningful G-vectors for each wavefunction.
         fft_box (numpy.ndarray): Default FFT grid size for real-space conversion.
@@ -66,16 +102,28 @@ class YamboWFDB:
     Methods:
         read(bands_range=[]): Read wavefunctions from the file.
         get_spin_projections(ik, ib, s_z=np.array([[1, 0], [0, -1]])): Compute spin projections for operator sz.
+        get_wf_kpoint(ik): Get the wavefunctions of a k-point, reading them on demand in lazy mode.
         get_iBZ_wf(ik): Get wavefunctions and G-vectors for a specific k-point.
+        get_iBZ_gvecs(ik): Get the G-vectors for a specific k-point.
+        get_gvec_index(ik): Get the (cached) G-vector lookup index of an iBZ k-point.
+        get_BZ_gvec_index(ik): Get the G-vector lookup index of a full BZ k-point.
+        expand_fullBZ(memmap=None): Store the full BZ wavefunctions (in memory or in a memmap file).
+        iter_BZ_wf(chunk=64, bands=None): Iterate over blocks of full BZ wavefunctions.
+        get_BZ_kwfc(ik, bands=None): Get k-point, wavefunctions and G-vectors of a full BZ k-point.
+        Dmat(symm_mat, frac_vec, time_rev, sym_batch=None, workers=1, cache=None): Compute the representation matrices.
+        Dmat_cache_key(symm_mat, frac_vec, time_rev): Key of the representation matrices in a DmatCache.
         wfcG2r(ik, ib, grid=[]): Convert wavefunctions from G-space to real space.
         write2cube(ik, ib, grid=[]): Write wavefunctions to a cube file.
         get_iBZ_kpt(ik): Get the k-point in crystal coordinates.
         rotate_wfc(ik, isym): Rotate wavefunctions using a symmetry operation.
         apply_symm(kvec, wfc_k, gvecs_k, time_rev, sym_mat, frac_vec=np.array([0, 0, 0])): Apply symmetry to wavefunctions.
         to_real_space(wfc_tmp, gvec_tmp, grid=[]): Convert wavefunctions to real space.
+        wfcG2r_kpoints(iks, bands=None, grid=[]): Real-space wavefunctions of several k-points (one batched FFT).
+        get_fft_engine(grid=[], dtype=None, workers=None): Get the (cached) batched FFT engine.
     """
 
-    def __init__(self, path=None, save='SAVE', filename='ns.wf', bands_range=[], latdb=None):
+    def __init__(self, path=None, save='SAVE', filename='ns.wf', bands_range=[], latdb=None,
+                 lazy=False, cache_size=16, workers=1, executor='process', fft_workers=-1, dtype=None):
         """
         Initialize the YamboWFDB class.
 
@@ -84,22 +132,45 @@ class YamboWFDB:
             save (str, optional): Subdirectory containing the wavefunction files. Defaults to 'SAVE'.
             filename (str, optional): Name of the wavefunction file. Defaults to 'ns.wf'.
             bands_range (list, optional): Range of bands to load. Defaults to all bands.
+            lazy (bool, optional): If True, do not load all the wavefunctions at once. The fragment
+                of a k-point is read on first access and kept in a bounded LRU cache. Defaults to False.
+            cache_size (int, optional): Maximum number of iBZ k-points kept in memory in lazy mode. Defaults to 16.
+            workers (int, optional): Number of workers used to read the ns.wf fragments. Defaults to 1 (serial).
+            executor (str, optional): 'process' or 'thread' workers. Defaults to 'process'.
+                The netCDF library is not thread-safe, so thread workers only overlap the
+                conversion of the data while processes also overlap the file reads.
+            fft_workers (int, optional): Threads used by the real-space FFTs (scipy.fft). Defaults to -1 (all cores).
+            dtype (numpy.dtype, optional): Complex dtype of the wavefunctions (np.complex64 or np.complex128).
+                The data are converted while reading, and rotations, inner products, Dmat,
+                spin matrix elements and real-space FFTs are done in this precision.
+                Defaults to None (precision of the ns.wf files).
         """
         if path is None:
             path = os.getcwd()
         self.path = os.path.join(path, save)
         self.filename = filename
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.fft_workers = fft_workers
+        self._fft_engines = {}
+        # None until read() takes the precision of the ns.wf files
+        self.wf_dtype = None if dtype is None else np.result_type(dtype, np.complex64)
 
         # Read wavefunctions
-        self.read(bands_range=bands_range, latdb=latdb)
+        self.read(bands_range=bands_range, latdb=latdb, workers=workers, executor=executor)
 
-    def read(self, bands_range=[], latdb=None):
+    def read(self, bands_range=[], latdb=None, workers=1, executor='process'):
         """
         Read wavefunctions from the file.
 
+        In lazy mode only ns.db1 is read here and the wavefunction fragments
+        are read on demand (see get_wf_kpoint).
+
         Args:
             bands_range (list, optional): Range of bands to load. Defaults to all bands.
             latdb : latticedb, if None (default), it will be created internally
+            workers (int, optional): Number of workers used to read the fragments. Defaults to 1 (serial).
+            executor (str, optional): 'process' or 'thread' workers. Defaults to 'process'.
         """
         path = self.path
         filename = self.filename
@@ -172,30 +243,160 @@ class YamboWFDB:
             raise IOError(f'Cannot read ns.db1 file: {e}')
 
         # Load wavefunctions
-        wf = []
-        for ik in tqdm(range(self.nkpoints), desc="Loading Wavefunctions"):
-            for ispin in range(self.nspin):
-                try:
-                    fname = f"{filename}_fragments_{ispin * self.nkpoints + ik + 1}_1"
-                    fname = os.path.join(path, fname)
-                    database = Dataset(fname, 'r')
-                    database_var_name = f'WF_COMPONENTS_@_SP_POL{ispin + 1}_K{ik + 1}_BAND_GRP_1'
-                    aux = database.variables[database_var_name][self.min_bnd:self.min_bnd + self.nbands, ...].data
-                    aux = aux[..., 0] + 1j * aux[..., 1]
-                    aux[..., igk[ik]:] = 0  # Set invalid components to zero
-                    wf.append(aux)
-                    database.close()
-                except Exception as e:
-                    raise IOError(f'Could not read {fname}: {e}')
-
-        self.ng = wf[0].shape[-1]  # Maximum number of wavefunction components
-        self.wf = np.array(wf).reshape(self.nkpoints, self.nspin, self.nbands, self.nspinor, self.ng)
-        # (nk, nspin,nbands,nspinor,ngvec)
+        # Only the dimensions of the first fragment are needed to allocate the wfcs
+        fname = self._fragment_fname(0, 0)
+        try:
+            with Dataset(fname, 'r') as database:
+                frag_var = database.variables[self._fragment_varname(0, 0)]
+                self.ng = frag_var.shape[-2]  # Maximum number of wavefunction components
+                if self.wf_dtype is None:
+                    self.wf_dtype = np.result_type(frag_var.dtype, np.complex64)
+        except Exception as e:
+            raise IOError(f'Could not read {fname}: {e}')
+
+        # Packed layout: the k-points are stored one after the other without padding
+        self.wf_offsets = np.zeros(self.nkpoints + 1, dtype=np.int64)
+        self.wf_offsets[1:] = np.cumsum(self.nspin * self.nbands * self.nspinor * igk)
+        self.gvecs_offsets = np.zeros(self.nkpoints + 1, dtype=np.int64)
+        self.gvecs_offsets[1:] = np.cumsum(igk)
+        self.wf_bz_packed = None
+        self._gvec_index = {}
+        self._padded = {}
+
+        if self.lazy:
+            self.wf_packed = None
+            self._wf_cache = LRUCache(self.cache_size)
+        else:
+            self.wf_packed = np.zeros(self.wf_offsets[-1], dtype=self.wf_dtype)
+            self._read_all_fragments(workers=workers, executor=executor)
         # Load G-vectors
-        self.gvecs = np.zeros((self.nkpoints, self.ng, 3), dtype=int)
+        self.gvecs_packed = np.zeros((self.gvecs_offsets[-1], 3), dtype=int)
         for ik in tqdm(range(self.nkpoints), desc="Loading Miller Indices"):
-            self.gvecs[ik, igk[ik]:, :] = 2147483646 * np.array([1, 1, 1])[None, :]  # Invalid G-vector marker
-            self.gvecs[ik, :igk[ik], :] = G_vec[wfc_grid[ik][:igk[ik]] - 1, :]
+            self.get_iBZ_gvecs(ik)[...] = G_vec[wfc_grid[ik][:igk[ik]] - 1, :]
+
+    def _fragment_fname(self, ik, ispin):
+        """Name of the ns.wf fragment containing iBZ k-point ik and spin ispin."""
+        fname = f"{self.filename}_fragments_{ispin * self.nkpoints + ik + 1}_1"
+        return os.path.join(self.path, fname)
+
+    def _fragment_varname(self, ik, ispin):
+        """Name of the netCDF variable with the wavefunction components in a fragment."""
+        return f'WF_COMPONENTS_@_SP_POL{ispin + 1}_K{ik + 1}_BAND_GRP_1'
+
+    def _fragment_args(self, ik, ispin):
+        """Arguments of read_wf_fragment for iBZ k-point ik and spin ispin."""
+        return (self._fragment_fname(ik, ispin), self._fragment_varname(ik, ispin),
+                self.min_bnd, self.nbands, self.ngvecs[ik])
+
+    def _packed_wf_kpoint(self, ik):
+        """View of the block of iBZ k-point ik in wf_packed (nspin, nbands, nspinor, ngvecs[ik])."""
+        return self.wf_packed[self.wf_offsets[ik]:self.wf_offsets[ik + 1]].reshape(
+            self.nspin, self.nbands, self.nspinor, self.ngvecs[ik])
+
+    def _read_wf_kpoint(self, ik):
+        """
+        Read the wavefunctions of iBZ k-point ik from the ns.wf fragments.
+
+        Returns:
+            numpy.ndarray: Wavefunctions (nspin, nbands, nspinor, ngvecs[ik]).
+        """
+        wfc = np.empty((self.nspin, self.nbands, self.nspinor, self.ngvecs[ik]), dtype=self.wf_dtype)
+        for ispin in range(self.nspin):
+            read_wf_fragment(*self._fragment_args(ik, ispin), out=wfc[ispin])
+        return wfc
+
+    def _read_all_fragments(self, workers=1, executor='process'):
+        """
+        Fill the preallocated self.wf_packed buffer with all the ns.wf fragments.
+
+        With workers > 1 the fragments are read concurrently. Thread workers write
+        directly into self.wf_packed, process workers send back one fragment at a time, so
+        the peak memory is self.wf_packed plus at most a few fragments.
+        """
+        tasks = [(ik, ispin) for ik in range(self.nkpoints) for ispin in range(self.nspin)]
+        pbar = tqdm(total=len(tasks), desc="Loading Wavefunctions")
+        if workers <= 1:
+            for ik, ispin in tasks:
+                read_wf_fragment(*self._fragment_args(ik, ispin), out=self._packed_wf_kpoint(ik)[ispin])
+                pbar.update(1)
+        elif executor == 'thread':
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(read_wf_fragment, *self._fragment_args(ik, ispin),
+                                       out=self._packed_wf_kpoint(ik)[ispin]) for ik, ispin in tasks]
+                for future in as_completed(futures):
+                    future.result()
+                    pbar.update(1)
+        elif executor == 'process':
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(read_wf_fragment, *self._fragment_args(ik, ispin), dtype=self.wf_dtype): (ik, ispin)
+                           for ik, ispin in tasks}
+                for future in as_completed(futures):
+                    ik, ispin = futures.pop(future)
+                    self._packed_wf_kpoint(ik)[ispin] = future.result()
+                    pbar.update(1)
+        else:
+            raise ValueError(f"Unknown executor '{executor}'. Use 'process' or 'thread'")
+        pbar.close()
+
+    def get_wf_kpoint(self, ik):
+        """
+        Get the wavefunctions of iBZ k-point ik (only the meaningful G-vectors).
+
+        In lazy mode, the fragment is read on first access and stored in the LRU cache.
+        Otherwise a view of the packed buffer is returned.
+
+        Args:
+            ik (int): iBZ K-point index.
+
+        Returns:
+            numpy.ndarray: Wavefunctions (nspin, nbands, nspinor, ngvecs[ik]).
+        """
+        if not self.lazy: return self._packed_wf_kpoint(ik)
+        wfc = self._wf_cache.get(ik)
+        if wfc is None:
+            wfc = self._read_wf_kpoint(ik)
+            self._wf_cache.put(ik, wfc)
+        return wfc
+
+    def _padded_view(self, name, build):
+        """
+        Padded copy of a packed array, built once by build() and kept (read-only)
+        until the packed storage is read or expanded again.
+        """
+        if name not in self._padded:
+            padded = build()
+            padded.flags.writeable = False
+            self._padded[name] = padded
+        return self._padded[name]
+
+    @property
+    def wf(self):
+        """
+        Padded wavefunctions (nk, nspin, nbands, nspinor, ng), read-only.
+
+        Built from the packed storage at the first access (in lazy mode this reads all
+        the fragments) and then kept in memory. Use get_iBZ_wf to access single k-points
+        without the padded copy.
+        """
+        def build():
+            wf = np.zeros((self.nkpoints, self.nspin, self.nbands, self.nspinor, self.ng), dtype=self.wf_dtype)
+            for ik in range(self.nkpoints):
+                if self.lazy and ik not in self._wf_cache: wfc = self._read_wf_kpoint(ik)
+                else: wfc = self.get_wf_kpoint(ik)
+                wf[ik, ..., :self.ngvecs[ik]] = wfc
+            return wf
+        return self._padded_view('wf', build)
+
+    @property
+    def gvecs(self):
+        """
+        Padded G-vectors (nk, ng, 3), read-only. Invalid G-vectors are set to 2147483646.
+
+        Built from the packed storage at the first access and then kept in memory.
+        Use get_iBZ_gvecs to access single k-points.
+        """
+        return self._padded_view('gvecs', lambda: pad_packed(self.gvecs_packed, self.gvecs_offsets,
+                                                             self.ng, 2147483646))
 
     def __str__(self):
         """Return a string representation of the object."""
@@ -239,10 +440,11 @@ class YamboWFDB:
         assert self.nspin == 1 and self.nspinor == 2, "Spin projections are only useful for nspin=1 and nspinor=2"
         assert s_z.shape == (2, 2), "Spin operator must be a 2x2 matrix"
 
+        wfc_k = self.get_wf_kpoint(ik)[0]
         if np.isscalar(ib):
-            if ib < 0 : wfc_tmp = self.wf[ik, 0]
-            else : wfc_tmp = self.wf[ik, 0][[ib]]
-        else: wfc_tmp = self.wf[ik, 0][ib] 
+            if ib < 0 : wfc_tmp = wfc_k
+            else : wfc_tmp = wfc_k[[ib]]
+        else: wfc_tmp = wfc_k[ib] 
 
         s_tmp = s_z[None,:,:]@wfc_tmp #'ij,bjg->big', s_z, wfc_tmp
         tmp_nb = s_tmp.shape[0]
@@ -277,7 +479,7 @@ class YamboWFDB:
         sym_mat = self.ydb.sym_car
         nsym = len(sym_mat)
         ## compute su(2) matrices for symmetries 
-        su2_ops = np.zeros((nsym,2,2),dtype=self.wf.dtype)
+        su2_ops = np.zeros((nsym,2,2),dtype=self.wf_dtype)
         for isym in range(nsym):
             trev_tmp = (isym >= nsym / (1 + int(np.rint(self.ydb.time_rev))))
             su2_ops[isym] = su2_mat(sym_mat[isym],trev_tmp)
@@ -285,7 +487,7 @@ class YamboWFDB:
         time_rev = (sym_idx >= nsym / (1 + int(np.rint(self.ydb.time_rev))))
         #
         su2_k = su2_ops[sym_idx]
-        S_z_tmp = np.zeros((len(sym_idx),2,2),dtype=self.wf.dtype)
+        S_z_tmp = np.zeros((len(sym_idx),2,2),dtype=self.wf_dtype)
         S_z_tmp[...] = s_z[None,:,:]
         #
         # COnjugate the S_z operator in case of time reversal
@@ -294,13 +496,16 @@ class YamboWFDB:
         S_z_tmp = S_z_tmp@su2_k
         S_z_tmp = su2_k.conj().transpose(0,2,1)@S_z_tmp
         #
-        # Apply to wfc
-        wfc_tmps = self.wf[:,0,...][kpt_idx]
-        nk, nb, nspinor, ng = wfc_tmps.shape
-        S_me = S_z_tmp[:,None,:,:]@wfc_tmps
-        #
-        ## compute the inner product
-        S_me = wfc_tmps.reshape(nk,nb,-1).conj()  @ S_me.reshape(nk,nb,-1).transpose(0,2,1)
+        # Apply to wfc, one star of iBZ k-points at a time
+        S_me = np.zeros((len(sym_idx), self.nbands, self.nbands), dtype=self.wf_dtype)
+        for ik in range(self.nkpoints):
+            kstar = np.where(kpt_idx == ik)[0]
+            if len(kstar) == 0: continue
+            wfc_k = self.get_wf_kpoint(ik)[0]
+            nb, nspinor, ng = wfc_k.shape
+            S_wfc = S_z_tmp[kstar][:,None,:,:]@wfc_k[None]
+            ## compute the inner product
+            S_me[kstar] = wfc_k.reshape(nb,-1).conj()[None] @ S_wfc.reshape(len(kstar),nb,-1).transpose(0,2,1)
         ## Take care of time reversal 
         S_me[time_rev] = S_me[time_rev].conj()
         return S_me
@@ -317,8 +522,55 @@ class YamboWFDB:
             in crystal coordinates.
         """
         self.assert_k_inrange(ik)
-        return [self.wf[ik][..., :self.ngvecs[ik]], self.gvecs[ik, :self.ngvecs[ik], :]]
+        return [self.get_wf_kpoint(ik), self.get_iBZ_gvecs(ik)]
+
+    def get_iBZ_gvecs(self, ik):
+        """
+        Get the G-vectors for a specific k-point.
+
+        Args:
+            ik (int): iBZ K-point index.
+
+        Returns:
+            numpy.ndarray: G-vectors (ngvec,3) in crystal coordinates (view of the packed storage).
+        """
+        return self.gvecs_packed[self.gvecs_offsets[ik]:self.gvecs_offsets[ik + 1]]
+
+
+    def get_gvec_index(self, ik):
+        """
+        Get the lookup index of the G-vectors of an iBZ k-point.
+        The index is built on first use and cached.
+
+        Args:
+            ik (int): iBZ K-point index.
+
+        Returns:
+            GvecIndex: exact lookup of Miller indices for get_iBZ_gvecs(ik).
+        """
+        gindex = self._gvec_index.get(ik)
+        if gindex is None:
+            gindex = GvecIndex(self.get_iBZ_gvecs(ik))
+            self._gvec_index[ik] = gindex
+        return gindex
+
+    def get_BZ_gvec_index(self, ik):
+        """
+        Get the lookup index of the G-vectors of a full BZ k-point.
 
+        The G-vectors of a BZ k-point are the rotated G-vectors of its iBZ k-point
+        (same ordering), so the cached iBZ index is reused with rotated queries.
+
+        Args:
+            ik (int): BZ K-point index.
+
+        Returns:
+            GvecIndex: exact lookup of Miller indices for get_BZ_wf(ik)[1] (or rotate_wfc).
+        """
+        isym = self.ydb.symmetry_indexes[ik]
+        sym_red = np.linalg.inv(self.ydb.lat.T) @ self.ydb.sym_car[isym].T @ self.ydb.lat.T
+        sym_red = np.rint(sym_red).astype(int)
+        return self.get_gvec_index(self.ydb.kpoints_indexes[ik]).rotated(sym_red)
 
     def wfcG2r(self, ik, ib, grid=[]):
         """
@@ -326,27 +578,70 @@ class YamboWFDB:
 
         Args:
             ik (int): iBZ K-point index.
-            ib (int): Band index.
+            ib (int or list): Band index (or list of band indices, transformed in a single batched FFT).
             grid (list, optional): FFT grid size. Defaults to the default FFT box.
 
         Returns:
-            numpy.ndarray: Wavefunctions in real space.
+            numpy.ndarray: Wavefunctions in real space (nspin, [nb,] nspinor, Nx, Ny, Nz).
         """
-        assert len(grid) == 0 or len(grid) == 3, "Grid must be an empty list or a list of 3 integers"
+        grid = self._check_fft_grid(grid)
         self.assert_k_inrange(ik)
-        self.assert_bnd_range(ib)
+        for i in np.atleast_1d(ib): self.assert_bnd_range(i)
 
-        if len(grid) == 0:
-            grid = self.fft_box
-        else:
-            for i in range(3):
-                assert grid[i] >= self.fft_box[i], f"Invalid FFT grid. Grid must be >= {self.fft_box[i]}"
+        wfc_tmp = self.get_wf_kpoint(ik)[:, ib]
+        return self.get_fft_engine(grid).transform(wfc_tmp, self.get_iBZ_gvecs(ik), key=('iBZ', ik))
+
+    def wfcG2r_kpoints(self, iks, bands=None, grid=[], dtype=None):
+        """
+        Real-space wavefunctions of several iBZ k-points with a single batched FFT.
+
+        Args:
+            iks (list): iBZ K-point indices.
+            bands (list, optional): [ib1, ib2) subset of the loaded bands (python indexing). Defaults to all.
+            grid (list, optional): FFT grid size. Defaults to the default FFT box.
+            dtype (numpy.dtype, optional): dtype of the FFT (e.g. np.complex64). Defaults to wf_dtype.
 
-        print(f'FFT Grid: {grid[0]} {grid[1]} {grid[2]}')
+        Returns:
+            numpy.ndarray: Wavefunctions in real space (nk, nspin, nb, nspinor, Nx, Ny, Nz).
+        """
+        grid = self._check_fft_grid(grid)
+        bnd_slice = slice(None) if bands is None else slice(bands[0], bands[1])
+        for ik in iks: self.assert_k_inrange(ik)
+        wfcs = [self.get_wf_kpoint(ik)[:, bnd_slice] for ik in iks]
+        gvecs = [self.get_iBZ_gvecs(ik) for ik in iks]
+        return self.get_fft_engine(grid, dtype=dtype).transform_kpoints(wfcs, gvecs, keys=[('iBZ', ik) for ik in iks])
+
+    def _check_fft_grid(self, grid):
+        """ Default (or validated) FFT grid """
+        assert len(grid) == 0 or len(grid) == 3, "Grid must be an empty list or a list of 3 integers"
+        if len(grid) == 0: return self.fft_box
+        for i in range(3):
+            assert grid[i] >= self.fft_box[i], f"Invalid FFT grid. Grid must be >= {self.fft_box[i]}"
+        return grid
 
-        wfc_tmp = self.wf[ik][:, ib, :, :self.ngvecs[ik]]
-        gvec_tmp = self.gvecs[ik, :self.ngvecs[ik], :]
-        return self.to_real_space(wfc_tmp, gvec_tmp, grid=grid)
+    def get_fft_engine(self, grid=[], dtype=None, workers=None):
+        """
+        FFT engine (WfcFFT) for a given grid and dtype. Engines are cached, so the
+        scatter index maps of the k-points are computed only once.
+
+        Args:
+            grid (list, optional): FFT grid size. Defaults to the default FFT box.
+            dtype (numpy.dtype, optional): Complex dtype of the FFT. Defaults to wf_dtype.
+            workers (int, optional): Threads used by scipy.fft. Defaults to self.fft_workers (-1 = all cores).
+
+        Returns:
+            WfcFFT: the FFT engine.
+        """
+        if len(grid) == 0: grid = self.fft_box
+        dtype = self.wf_dtype if dtype is None else np.result_type(dtype, np.complex64)
+        if workers is None: workers = self.fft_workers
+        key = (tuple(int(i) for i in grid), np.dtype(dtype).str)
+        engines = self._fft_engines
+        if key not in engines:
+            engines[key] = WfcFFT(grid, abs(np.linalg.det(self.ydb.lat.T)), self.nspinor,
+                                  dtype=dtype, workers=workers)
+        engines[key].workers = workers
+        return engines[key]
 
     def write2cube(self, ik, ib, grid=[]):
         """
@@ -354,16 +649,18 @@ class YamboWFDB:
 
         Args:
             ik (int): iBZ K-point index.
-            ib (int): Band index.
+            ib (int or list): Band index (or list of band indices, transformed together).
             grid (list, optional): FFT grid size. Defaults to the default FFT box.
         """
-        wfc_r = self.wfcG2r(ik, ib, grid=grid)
-        wfc_r = np.sum(np.abs(wfc_r) ** 2, axis=(1))
-        wfc_r = wfc_r / wfc_r.max()
-        for ispin in range(self.nspin):
-            filename = f'wfc_k{ik + 1}_bnd_{ib + self.min_bnd + 1}_spin{ispin + 1}.cube'
-            write_cube(filename, wfc_r[ispin], self.ydb.lat.T, self.ydb.car_atomic_positions,
-                       self.ydb.atomic_numbers, header='Real space electronic wavefunction')
+        bands = np.atleast_1d(ib)
+        wfc_r = self.wfcG2r(ik, bands, grid=grid)
+        wfc_r = np.sum(np.abs(wfc_r) ** 2, axis=2)
+        for i, jb in enumerate(bands):
+            wfc_b = wfc_r[:, i] / wfc_r[:, i].max()
+            for ispin in range(self.nspin):
+                filename = f'wfc_k{ik + 1}_bnd_{jb + self.min_bnd + 1}_spin{ispin + 1}.cube'
+                write_cube(filename, wfc_b[ispin], self.ydb.lat.T, self.ydb.car_atomic_positions,
+                           self.ydb.atomic_numbers, header='Real space electronic wavefunction')
 
     def get_iBZ_kpt(self, ik):
         """
@@ -436,74 +733,159 @@ class YamboWFDB:
 
 
     @func_profile
-    def to_real_space(self, wfc_tmp, gvec_tmp, grid=[]):
+    def to_real_space(self, wfc_tmp, gvec_tmp, grid=[], key=None):
         """
-        Convert wavefunctions from G-space to real space.
+        Convert wavefunctions from G-space to real space (see WfcFFT).
 
         Args:
-            wfc_tmp (numpy.ndarray): Wavefunctions in G-space.
+            wfc_tmp (numpy.ndarray): Wavefunctions in G-space (nb, nspinor, ngvec).
             gvec_tmp (numpy.ndarray): G-vectors.
             grid (list, optional): FFT grid size. Defaults to the default FFT box.
+            key (hashable, optional): Key to cache the scatter indices of gvec_tmp (e.g. ('iBZ', ik)).
 
         Returns:
             numpy.ndarray: Wavefunctions in real space.
         """
-        if len(grid) == 0:
-            grid = self.fft_box
-        cel_vol = abs(np.linalg.det(self.ydb.lat.T))
-
-        tmp_wfc = np.zeros((len(wfc_tmp), self.nspinor, grid[0], grid[1], grid[2]), dtype=wfc_tmp.dtype)
-
-        Nx_vals = np.where(gvec_tmp[:, 0] >= 0, gvec_tmp[:, 0], gvec_tmp[:, 0] + grid[0])
-        Ny_vals = np.where(gvec_tmp[:, 1] >= 0, gvec_tmp[:, 1], gvec_tmp[:, 1] + grid[1])
-        Nz_vals = np.where(gvec_tmp[:, 2] >= 0, gvec_tmp[:, 2], gvec_tmp[:, 2] + grid[2])
-        #
-        assert np.min(Nx_vals) >=0 and (np.min(Ny_vals) >=0 and np.min(Nz_vals)) >=0, "Wrong fft indices"
-        tmp_wfc[:,:,Nx_vals, Ny_vals,Nz_vals] = wfc_tmp
-        return scipy.fft.ifftn(tmp_wfc,norm="forward",axes=(2,3,4))/np.sqrt(cel_vol)
+        fft = self.get_fft_engine(grid, dtype=np.result_type(wfc_tmp.dtype, np.complex64))
+        return fft.transform(wfc_tmp, gvec_tmp, key=key)
 
     
-    def expand_fullBZ(self):
+    def expand_fullBZ(self, memmap=None):
         """
         Expands the wavefunctions to the full Brillouin Zone (BZ) by applying symmetry operations.
 
         This method constructs wavefunctions at all symmetry-equivalent k-points in the full BZ.
+        The k-points are rotated block by block (see iter_BZ_wf), so with memmap only
+        one block of rotated wavefunctions is in memory at a time.
 
         Parameters
         ----------
-        None
+        memmap : str (optional)
+            File used as on-disk (numpy.memmap) storage of the full BZ wavefunctions.
+            Default is None (kept in memory).
 
         Returns
         -------
         None
         """
         #
-        if getattr(self, 'wf_bz', None) is not None: return
+        if self.wf_bz_packed is not None: return
         #
         kpt_idx = self.ydb.kpoints_indexes
         sym_idx = self.ydb.symmetry_indexes
         nkBZ = len(sym_idx)
 
-        self.wf_bz = np.zeros((nkBZ, self.nspin, self.nbands, self.nspinor, self.ng),dtype=self.wf.dtype)
-        self.g_bz = 2147483646 + np.zeros((nkBZ,self.ng,3),dtype=int)
-        self.kBZ = np.zeros((nkBZ,3))
+        # Same packed layout as the iBZ wavefunctions: a rotation does not change the number of G-vectors
+        self.ngBZ = self.ngvecs[kpt_idx]
+        self.wf_bz_offsets = np.zeros(nkBZ + 1, dtype=np.int64)
+        self.wf_bz_offsets[1:] = np.cumsum(self.nspin * self.nbands * self.nspinor * self.ngBZ)
+        self.g_bz_offsets = np.zeros(nkBZ + 1, dtype=np.int64)
+        self.g_bz_offsets[1:] = np.cumsum(self.ngBZ)
+        if memmap is None:
+            wf_bz_packed = np.zeros(self.wf_bz_offsets[-1], dtype=self.wf_dtype)
+        else:
+            wf_bz_packed = np.memmap(memmap, dtype=self.wf_dtype, mode='w+', shape=(max(1, self.wf_bz_offsets[-1]),))
+        self.g_bz_packed = np.zeros((self.g_bz_offsets[-1], 3), dtype=int)
+        kBZ = np.zeros((nkBZ,3))
         # NM : The reason we want to replace the existing kBZ variable is to make sure we have 
         # correct rotated kpoint (here they should not differ by a G vector !)
-        self.ngBZ = np.zeros(nkBZ,dtype=int)
-        for i in tqdm(range(nkBZ), desc="Expanding Wavefunctions full BZ"):
-            ik = kpt_idx[i]
-            isym = sym_idx[i]
-            #if isym == 1 : w_t, g_t = self.get_iBZ_wf(ik)
-            kbz, w_t, g_t = self.rotate_wfc(ik, isym)
-            ng_t = w_t.shape[-1]
-            self.ngBZ[i] = ng_t
-            self.kBZ[i] = kbz
-            self.wf_bz[i][...,:ng_t]  = w_t
-            self.g_bz[i][:ng_t,:]  = g_t
+        pbar = tqdm(total=nkBZ, desc="Expanding Wavefunctions full BZ")
+        for iks, kvecs, wfcs, gvecs in self.iter_BZ_wf():
+            kBZ[iks] = kvecs
+            for i, w_t, g_t in zip(iks, wfcs, gvecs):
+                wf_bz_packed[self.wf_bz_offsets[i]:self.wf_bz_offsets[i + 1]] = w_t.reshape(-1)
+                self.g_bz_packed[self.g_bz_offsets[i]:self.g_bz_offsets[i + 1]] = g_t
+            pbar.update(len(iks))
+        pbar.close()
+        if memmap is not None: wf_bz_packed.flush()
+        self.wf_bz_packed = wf_bz_packed
+        self._padded.pop('wf_bz', None)
+        self._padded.pop('g_bz', None)
+        self.kBZ = kBZ
         #
         self.ktree = build_ktree(self.kBZ)
         return 
 
+    def iter_BZ_wf(self, chunk=64, bands=None):
+        """
+        Iterate over the full BZ wavefunctions, chunk k-points at a time, without
+        expanding (and storing) all of them.
+
+        The wavefunctions are taken from the full BZ storage if expand_fullBZ was
+        called (in memory or memmap), otherwise they are rotated on the fly from
+        the iBZ ones (see get_BZ_kwfc).
+
+        Args:
+            chunk (int, optional): Number of BZ k-points per block. Defaults to 64.
+            bands (list, optional): [ib1, ib2) subset of the loaded bands (python indexing). Defaults to all.
+
+        Yields:
+            tuple: (iks, kvecs, wfcs, gvecs). BZ indices (n,), k-points in crystal coordinates (n,3),
+                   list of wavefunctions (nspin,nbands,nspinor,ngvec) and list of G-vectors (ngvec,3).
+
+        Example:
+            for iks, kvecs, wfcs, gvecs in wfdb.iter_BZ_wf(chunk=16):
+                for ik, wfc, gvec in zip(iks, wfcs, gvecs): ...
+        """
+        chunk = max(1, int(chunk))
+        for ikstart in range(0, self.nkBZ, chunk):
+            iks = np.arange(ikstart, min(ikstart + chunk, self.nkBZ))
+            kvecs = np.zeros((len(iks), 3))
+            wfcs, gvecs = [], []
+            for i, ik in enumerate(iks):
+                kvecs[i], wfc, gvec = self.get_BZ_kwfc(ik, bands=bands)
+                wfcs.append(wfc)
+                gvecs.append(gvec)
+            yield iks, kvecs, wfcs, gvecs
+
+    def get_BZ_kwfc(self, ik, bands=None):
+        """
+        K-point, wavefunctions and G-vectors of a full BZ k-point, from the full BZ
+        storage if expanded, otherwise rotated on the fly from the iBZ (nothing is stored).
+
+        Args:
+            ik (int): BZ K-point index.
+            bands (list, optional): [ib1, ib2) subset of the loaded bands (python indexing). Defaults to all.
+
+        Returns:
+            list: K-point in crystal coordinates, wavefunctions (nspin,nbands,nspinor,ngvec)
+                  and G-vectors in crystal coordinates (ngvec,3).
+        """
+        bnd_slice = slice(None) if bands is None else slice(bands[0], bands[1])
+        if self.wf_bz_packed is not None:
+            wfc, gvec = self.get_BZ_wf(ik)
+            return [self.get_BZ_kpt(ik), wfc[:, bnd_slice], gvec]
+        ik_ibz = self.ydb.kpoints_indexes[ik]
+        isym = self.ydb.symmetry_indexes[ik]
+        wfc_k, gvecs_k = self.get_iBZ_wf(ik_ibz)
+        time_rev = (isym >= len(self.ydb.sym_car) / (1 + int(np.rint(self.ydb.time_rev))))
+        return self.apply_symm(self.get_iBZ_kpt(ik_ibz), wfc_k[:, bnd_slice], gvecs_k,
+                               time_rev, self.ydb.sym_car[isym])
+
+    @property
+    def wf_bz(self):
+        """
+        Padded full BZ wavefunctions (nkBZ, nspin, nbands, nspinor, ng), read-only, None if not expanded.
+        Built from the packed storage at the first access and then kept in memory (kept for compatibility).
+        """
+        if self.wf_bz_packed is None: return None
+        def build():
+            wf_bz = np.zeros((self.nkBZ, self.nspin, self.nbands, self.nspinor, self.ng), dtype=self.wf_dtype)
+            for ik in range(self.nkBZ):
+                wf_bz[ik, ..., :self.ngBZ[ik]] = self.get_BZ_wf(ik)[0]
+            return wf_bz
+        return self._padded_view('wf_bz', build)
+
+    @property
+    def g_bz(self):
+        """
+        Padded full BZ G-vectors (nkBZ, ng, 3), read-only, None if not expanded. Invalid G-vectors are set to 2147483646.
+        Built from the packed storage at the first access and then kept in memory (kept for compatibility).
+        """
+        if self.wf_bz_packed is None: return None
+        return self._padded_view('g_bz', lambda: pad_packed(self.g_bz_packed, self.g_bz_offsets,
+                                                            self.ng, 2147483646))
+
     def get_BZ_kpt(self, ik):
         """
         Get the BZ k-point in crystal coordinates.
@@ -525,18 +907,35 @@ class YamboWFDB:
         Returns:
             list: Wavefunctions at ik (nspin,nbands,nspinor,ngvec) and G-vectors in crystal coordinates (ngvec,3).
         """
-        if getattr(self, 'wf_bz', None) is None: self.expand_fullBZ()
+        if self.wf_bz_packed is None: self.expand_fullBZ()
         #
-        return [self.wf_bz[ik][..., :self.ngBZ[ik]], self.g_bz[ik, :self.ngBZ[ik], :]]
+        wfc = self.wf_bz_packed[self.wf_bz_offsets[ik]:self.wf_bz_offsets[ik + 1]]
+        wfc = wfc.reshape(self.nspin, self.nbands, self.nspinor, self.ngBZ[ik])
+        return [wfc, self.g_bz_packed[self.g_bz_offsets[ik]:self.g_bz_offsets[ik + 1]]]
 
 
+    def Dmat_cache_key(self, symm_mat=None, frac_vec=None, time_rev=None):
+        """
+        Key of the Dmats in a DmatCache: hash of the content of ns.db1, the band range,
+        the symmetries and time reversal (SAVE symmetries if any of them is None).
+        """
+        if symm_mat is None or frac_vec is None or time_rev is None:
+            symm_mat = self.ydb.sym_car
+            frac_vec = np.zeros((len(symm_mat),3),dtype=symm_mat.dtype)
+            time_rev = int(np.rint(self.ydb.time_rev))
+        return dmat_cache_key(os.path.join(self.path, 'ns.db1'), [self.min_bnd, self.min_bnd + self.nbands],
+                              symm_mat, frac_vec, time_rev, dtype=self.wf_dtype)
+
     @func_profile
     @citation("M. Nalabothula et al. arXiv:2511.21540 (2025)")
-    def Dmat(self, symm_mat=None, frac_vec=None, time_rev=None):
+    def Dmat(self, symm_mat=None, frac_vec=None, time_rev=None, sym_batch=None, workers=1, cache=None):
         """
         Computes the symmetry-adapted matrix elements < Rk | U(R) | k >.
         Implements Eq. 5 of M Nalabothula et al. arXiv:2511.21540.
 
+        For each k-point, all the symmetries are applied at once and the
+        band overlaps are computed as stacked matrix products (see DmatEngine).
+
         Parameters
         ----------
         symm_mat : np.ndarray
@@ -545,6 +944,18 @@ class YamboWFDB:
             Fractional translation vectors associated with symmetries (nsym, 3).
         time_rev : bool
             Whether time-reversal symmetry is included.
+        sym_batch : int (optional)
+            Number of symmetries treated together. Default (None) is all of them.
+            Lower it to reduce the memory (nsym*nspin*nbands*nspinor*ng per k-point).
+        workers : int (optional)
+            Number of worker processes, each computing a slice of the k-points.
+            The iBZ wavefunctions and G-vectors are shared with the workers through
+            shared memory (they are not pickled). In lazy mode each worker reads the
+            fragments of its own k-points instead. Default is 1 (serial).
+        cache : DmatCache or str (optional)
+            Persistent cache (or its folder). The Dmats are looked up with a key built from
+            the content of ns.db1, the band range, the symmetries and time reversal, and
+            are computed and stored only if not found. Default is None (no disk cache).
 
         if symm_mat or frac_vec or time_rev is None, the use the symmetries from SAVE
         Returns
@@ -556,8 +967,6 @@ class YamboWFDB:
         ## isym >= len(symm_mat)/(1+int(time_rev)) must be timereversal symmetries
         ## X -> Rx + tau, R matrices are given in symm_mat, tau are frac_vec, time_rev is bool
         ## (nsym, nk, nspin, Rk_bnd, k_bnd)
-        expand_wf_present = True
-        if getattr(self, 'wf_bz', None) is None: expand_wf_present = False
         ##
         ## Check if already computed for SAVE symetries 
         dmat_save = getattr(self, 'save_Dmat', None)
@@ -575,49 +984,82 @@ class YamboWFDB:
             frac_vec = np.zeros((len(symm_mat),3),dtype=symm_mat.dtype)
             time_rev = int(np.rint(self.ydb.time_rev))
         #
-        ktree = self.ktree #build_ktree(self.kBZ)
-        Dmat = []
         nsym = len(symm_mat)
-        kpt_idx = self.ydb.kpoints_indexes
-        sym_idx = self.ydb.symmetry_indexes
-        #
         assert nsym == len(frac_vec), "The number for frac translation must be same as Rotation matrices"
-        for ik in tqdm(range(self.nkBZ), desc="Dmat"):
-            # IN case the wfc are already expanded, load them
-            if expand_wf_present:
-                wfc_k, gvec_k = self.get_BZ_wf(ik)
-                kvec = self.get_BZ_kpt(ik)
-            else:
-                ## else rotate them
-                ixk = kpt_idx[ik]
-                isk = sym_idx[ik]
-                kvec, wfc_k, gvec_k = self.rotate_wfc(ixk, isk)
-
-            for isym in range(nsym):
-                trev = (isym >= nsym/(1+int(time_rev)))
-                #
-                ## Compute U(R)\psi_k
-                #
-                Rk, wfc_Rk, gvec_Rk = self.apply_symm(kvec, wfc_k, gvec_k, trev, symm_mat[isym], frac_vec[isym])
-                idx = find_kpt(ktree, Rk)
-                #
-                ## get Rk wfc 
-                # in case stored
-                if expand_wf_present:
-                    w_rk, g_rk = self.get_BZ_wf(idx)
-                    k_rk = self.get_BZ_kpt(idx)
-                else :
-                    iktmp = kpt_idx[idx]
-                    istmp = sym_idx[idx]
-                    k_rk, w_rk, g_rk = self.rotate_wfc(iktmp, istmp)
-                Dmat.append(wfc_inner_product(k_rk, w_rk, g_rk, Rk, wfc_Rk, gvec_Rk))
         #
-        Dmat = np.array(Dmat).reshape(self.nkBZ, nsym, self.nspin, self.nbands, self.nbands).transpose(1,0,2,3,4)
+        if cache is not None:
+            if not isinstance(cache, DmatCache): cache = DmatCache(cache)
+            key = self.Dmat_cache_key(symm_mat, frac_vec, time_rev)
+            Dmat = cache.load(key)
+            if Dmat is None:
+                Dmat = self.Dmat(symm_mat, frac_vec, time_rev, sym_batch=sym_batch, workers=workers)
+                cache.save(key, Dmat, symm_mat=symm_mat, frac_vec=frac_vec, time_rev=int(time_rev),
+                           bands_range=[self.min_bnd, self.min_bnd + self.nbands])
+            if is_save_symm: self.save_Dmat = Dmat
+            return Dmat
+        #
+        if workers > 1:
+            Dmat = self._Dmat_parallel(symm_mat, frac_vec, time_rev, sym_batch, workers)
+        else:
+            engine = DmatEngine(self, symm_mat, frac_vec, time_rev, sym_batch=sym_batch)
+            Dmat = np.zeros((nsym, self.nkBZ, self.nspin, self.nbands, self.nbands), dtype=self.wf_dtype)
+            for ik in tqdm(range(self.nkBZ), desc="Dmat"):
+                Dmat[:, ik] = engine.compute(ik)
         #
         if is_save_symm: self.save_Dmat = Dmat
         #
         return Dmat
 
+    def _Dmat_parallel(self, symm_mat, frac_vec, time_rev, sym_batch, workers):
+        """
+        Dmat computed by a pool of processes, each one working on chunks of k-points.
+
+        wf_packed, gvecs_packed and the output array live in shared memory blocks
+        attached by the workers. In lazy mode wf_packed is not built: each worker reads
+        the fragments it needs (in its own LRU cache). The k-points are distributed star
+        by star, since the Rk of a k-point belong to its star. Every worker runs the same
+        DmatEngine as the serial code, so the results are identical.
+        """
+        nsym = len(symm_mat)
+        shape_out = (nsym, self.nkBZ, self.nspin, self.nbands, self.nbands)
+        shms = []
+        try:
+            shared = {}
+            if not self.lazy:
+                shm_wf, wf_sh = _shared_array((self.wf_offsets[-1],), self.wf_dtype)
+                shms.append(shm_wf)
+                wf_sh[...] = self.wf_packed
+                shared['wf_packed'] = (shm_wf.name, wf_sh.shape, wf_sh.dtype)
+                del wf_sh
+            shm_g, g_sh = _shared_array(self.gvecs_packed.shape, self.gvecs_packed.dtype)
+            shms.append(shm_g)
+            g_sh[...] = self.gvecs_packed
+            shm_out, out_sh = _shared_array(shape_out, self.wf_dtype)
+            shms.append(shm_out)
+            #
+            state = {key: getattr(self, key) for key in _dmat_shared_attributes}
+            shared.update({'gvecs_packed': (shm_g.name, g_sh.shape, g_sh.dtype),
+                           'dmat': (shm_out.name, out_sh.shape, out_sh.dtype)})
+            dmat_args = (symm_mat, frac_vec, time_rev, sym_batch)
+            #
+            ## k-points sorted by star, so that each chunk needs few iBZ wavefunctions
+            order = np.argsort(self.ydb.kpoints_indexes, kind='stable')
+            chunk = max(1, self.nkBZ // (4 * workers))
+            chunks = [order[i:i + chunk].tolist() for i in range(0, self.nkBZ, chunk)]
+            pbar = tqdm(total=self.nkBZ, desc="Dmat")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_dmat_worker_init,
+                                     initargs=(state, shared, dmat_args)) as pool:
+                for future in as_completed([pool.submit(_dmat_worker_run, iks) for iks in chunks]):
+                    pbar.update(future.result())
+            pbar.close()
+            Dmat = out_sh.copy()
+            del g_sh, out_sh
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+        return Dmat
+
     def OverlapUkkp(self, kpt_bra, kpt_ket):
         """
         Compute the following matrix elements : < k_bra | e^{i(k_bra-k_ket).r} | k_ket>
@@ -646,13 +1088,410 @@ class YamboWFDB:
         G0_bra = kpt_bra-k_rk_bra
         #
         G0 = G0_ket-G0_bra
-        return wfc_inner_product(G0, w_rk_bra, g_rk_bra, np.array([0,0,0]), w_rk_ket, g_rk_ket)
+        return wfc_inner_product(G0, w_rk_bra, g_rk_bra, np.array([0,0,0]), w_rk_ket, g_rk_ket,
+                                 bra_Gindex=self.get_BZ_gvec_index(ikpt_bra))
 
 ## end of class
 
+## Parallel Dmat helpers (run in the worker processes)
+_dmat_shared_attributes = ['path', 'filename', 'ydb', 'nkBZ', 'kpts_iBZ', 'kBZ', 'ktree', 'ngvecs', 'fft_box',
+                           'nkpoints', 'nspin', 'nspinor', 'nbands', 'min_bnd', 'ng', 'wf_dtype',
+                           'wf_offsets', 'gvecs_offsets', 'lazy', 'cache_size', 'fft_workers']
+_dmat_worker = {}
+
+def _shared_array(shape, dtype):
+    """Create a shared memory block and a numpy array using it."""
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _dmat_worker_init(state, shared, dmat_args):
+    """Attach the shared arrays and build a YamboWFDB view (lazy if the parent is) and a DmatEngine in the worker."""
+    arrays = {}
+    for key, (name, shape, dtype) in shared.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _dmat_worker.setdefault('shms', []).append(shm)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    wfdb = object.__new__(YamboWFDB)
+    wfdb.__dict__.update(state)
+    if wfdb.lazy:
+        # the fragments are read by the worker itself
+        wfdb.wf_packed = None
+        wfdb._wf_cache = LRUCache(wfdb.cache_size)
+    else:
+        wfdb.wf_packed = arrays['wf_packed']
+    wfdb.gvecs_packed = arrays['gvecs_packed']
+    wfdb.wf_bz_packed = None
+    wfdb._gvec_index = {}
+    wfdb._padded = {}
+    wfdb._fft_engines = {}
+    _dmat_worker['dmat'] = arrays['dmat']
+    _dmat_worker['engine'] = DmatEngine(wfdb, *dmat_args[:3], sym_batch=dmat_args[3])
+
+def _dmat_worker_run(iks):
+    """Compute the Dmats of a chunk of BZ k-points and write them in the shared output."""
+    for ik in iks:
+        _dmat_worker['dmat'][:, ik] = _dmat_worker['engine'].compute(ik)
+    return len(iks)
+
+class DmatEngine:
+    """
+    Batched computation of the representation matrices < Rk | U(R) | k > (see YamboWFDB.Dmat).
+
+    For a given full BZ k-point, the G-vectors and spinors are rotated for all the
+    symmetries at once, all the Rk points are found with a single k-tree query and
+    the nsym band-overlap blocks are obtained with stacked matrix products.
+    The wavefunctions of the Rk points (bra) are taken from the expanded full BZ
+    wavefunctions if present, otherwise they are rotated on the fly and the
+    last ones are kept in a small LRU cache (consecutive k-points of a star share their Rk).
+
+    Example usage:
+
+        engine = DmatEngine(wfdb, wfdb.ydb.sym_car, frac_vec, time_rev)
+        dmat_k = engine.compute(ik) # (nsym, nspin, nbands, nbands)
+    """
+    def __init__(self, wfdb, symm_mat, frac_vec, time_rev, sym_batch=None):
+        """
+        Args:
+            wfdb (YamboWFDB): Wavefunction database.
+            symm_mat (numpy.ndarray): Symmetry matrices in cartesian units (nsym,3,3).
+            frac_vec (numpy.ndarray): Fractional translations in cartesian units (nsym,3).
+            time_rev (bool): If True, the second half of the symmetries includes time reversal.
+            sym_batch (int, optional): Number of symmetries treated together. Default is all.
+        """
+        self.wfdb = wfdb
+        self.nsym = len(symm_mat)
+        lat = wfdb.ydb.lat.T
+        lat_inv = np.linalg.inv(lat)
+        self.trev = np.arange(self.nsym) >= self.nsym/(1+int(time_rev))
+        # Rotation matrices acting on Miller indices (row vectors)
+        self.sym_red = np.rint(lat_inv[None,:,:] @ np.transpose(symm_mat,(0,2,1)) @ lat[None,:,:]).astype(int)
+        self.tau_frac = np.asarray(frac_vec) @ lat_inv.T
+        self.has_frac = np.any(np.abs(self.tau_frac) > 0)
+        if wfdb.nspinor == 2:
+            self.su2 = np.array([su2_mat(symm_mat[isym], self.trev[isym]) for isym in range(self.nsym)])
+            self.su2 = self.su2.astype(wfdb.wf_dtype)
+        self.sym_batch = self.nsym if sym_batch is None else max(int(sym_batch), 1)
+        self._bra_cache = LRUCache(2*len(wfdb.ydb.sym_car))
+
+    def get_BZ(self, ik):
+        """ Crystal momentum, wavefunctions and G-vectors of BZ k-point ik """
+        wfdb = self.wfdb
+        if wfdb.wf_bz_packed is not None:
+            return wfdb.get_BZ_kwfc(ik)
+        res = self._bra_cache.get(ik)
+        if res is None:
+            res = wfdb.get_BZ_kwfc(ik)
+            self._bra_cache.put(ik, res)
+        return res
+
+    def compute(self, ik):
+        """
+        Compute < Rk | U(R) | k > for all the symmetries at BZ k-point ik.
+
+        Returns:
+            numpy.ndarray: (nsym, nspin, nbands, nbands)
+        """
+        wfdb = self.wfdb
+        kvec, wfc_k, gvec_k = self.get_BZ(ik)
+        nspin, nbnd, nspinor, ng = wfc_k.shape
+        dmat = np.zeros((self.nsym, nspin, nbnd, nbnd), dtype=wfc_k.dtype)
+        #
+        ## Rk for all the symmetries and their index in the BZ (single query)
+        Rk_all = kvec @ self.sym_red
+        idx_all = np.atleast_1d(find_kpt(wfdb.ktree, Rk_all))
+        #
+        for s0 in range(0, self.nsym, self.sym_batch):
+            syms = np.arange(s0, min(s0 + self.sym_batch, self.nsym))
+            nsb = len(syms)
+            ## U(R)psi_k for the block of symmetries
+            gvec_rot = gvec_k[None,:,:] @ self.sym_red[syms]
+            if nspinor == 2:
+                wfc_rot = self.su2[syms][:,None,None,:,:] @ wfc_k[None]
+            else:
+                wfc_rot = np.repeat(wfc_k[None], nsb, axis=0)
+            if self.has_frac:
+                tau = self.tau_frac[syms]
+                kphase = np.exp(-1j * 2 * np.pi * np.sum(Rk_all[syms] * tau, axis=-1))
+                gphase = kphase[:,None] * np.exp(-1j * 2 * np.pi * (gvec_rot @ tau[:,:,None])[...,0])
+                wfc_rot *= gphase[:,None,None,None,:]
+            trev = self.trev[syms]
+            wfc_rot[trev] = wfc_rot[trev].conj()
+            #
+            ## gather the Rk wavefunctions on the G-vectors of U(R)psi_k
+            bra = np.zeros(wfc_rot.shape, dtype=wfc_rot.dtype)
+            for i, isym in enumerate(syms):
+                idx = idx_all[isym]
+                k_rk, w_rk, g_rk = self.get_BZ(idx)
+                kdiff = k_rk - Rk_all[isym]
+                G0 = np.rint(kdiff).astype(int)
+                ## crystal momentum mismatch delta_{k,k'}
+                if np.max(np.abs(kdiff - G0)) > 1e-5: continue
+                pos = wfdb.get_BZ_gvec_index(idx).find(gvec_rot[i] - G0[None,:])
+                found = pos >= 0
+                bra[i][..., found] = w_rk[..., pos[found]]
+            np.conj(bra, out=bra)
+            #
+            ## stacked gemms : (nsb, nspin, Rk_bnd, k_bnd)
+            dmat[syms] = bra.reshape(nsb, nspin, nbnd, -1) @ wfc_rot.reshape(nsb, nspin, nbnd, -1).transpose(0,1,3,2)
+        return dmat
+
+# netCDF-C is not thread-safe: serialize the file access among threads
+_netcdf_lock = threading.Lock()
+
+class WfcFFT:
+    """
+    Batched G-space -> real-space FFT of wavefunctions on a fixed FFT grid (see YamboWFDB.get_fft_engine).
+
+    The scatter indices of the G-vectors in the flattened FFT box are cached per
+    key (e.g. per k-point), all the bands (and k-points with transform_kpoints) are
+    transformed with a single multithreaded scipy.fft call, and the FFT is done
+    in place in the box. With reuse=True the box is a preallocated buffer
+    (valid until the next call), otherwise a new box is allocated.
+    dtype=np.complex64 performs single precision FFTs.
+
+    Example usage:
+
+        fft = wfdb.get_fft_engine(dtype=np.complex64)
+        wfc_r = fft.transform(wfc, gvecs, key=ik)   # (..., nspinor, Nx, Ny, Nz)
+        wfc_r = fft.transform_kpoints(wfcs, gvecs_list, keys=iks)  # (nk, ..., nspinor, Nx, Ny, Nz)
+    """
+    def __init__(self, grid, cel_vol, nspinor, dtype=np.complex128, workers=-1, cache_size=64):
+        """
+        Args:
+            grid (list): FFT grid (Nx, Ny, Nz).
+            cel_vol (float): Unit cell volume (the wavefunctions are normalized with 1/sqrt(cel_vol)).
+            nspinor (int): Number of spinor components.
+            dtype (numpy.dtype, optional): Complex dtype of the FFT. Defaults to complex128.
+            workers (int, optional): Threads used by scipy.fft (-1 = all cores). Defaults to -1.
+            cache_size (int, optional): Number of cached scatter index maps. Defaults to 64.
+        """
+        self.grid = tuple(int(i) for i in grid)
+        self.norm = 1.0 / np.sqrt(cel_vol)
+        self.nspinor = nspinor
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+        self._index_cache = LRUCache(cache_size)
+        self._buffer = None
+
+    def scatter_index(self, gvecs, key=None):
+        """ Flat indices of the G-vectors (ngvec,3) in the FFT box, cached for key (if not None) """
+        if key is not None:
+            idx = self._index_cache.get(key)
+            if idx is not None: return idx
+        gvecs = np.asarray(gvecs)
+        grid = np.array(self.grid)
+        assert np.all(gvecs >= -grid[None, :]) and np.all(gvecs < grid[None, :]), "Wrong fft indices"
+        idx = np.ravel_multi_index(tuple((gvecs % grid[None, :]).T), self.grid)
+        if key is not None: self._index_cache.put(key, idx)
+        return idx
+
+    def _box(self, nbatch, out=None, reuse=False):
+        """ Zeroed FFT box (nbatch, nspinor, Nx, Ny, Nz) """
+        shape = (nbatch, self.nspinor) + self.grid
+        if out is not None:
+            assert out.dtype == self.dtype and out.flags.c_contiguous and out.size == np.prod(shape), \
+                "out must be a C-contiguous %s array with %d elements" % (self.dtype, np.prod(shape))
+            box = out.reshape(shape)
+        elif reuse:
+            if self._buffer is None or len(self._buffer) < nbatch:
+                self._buffer = np.empty(shape, dtype=self.dtype)
+            box = self._buffer[:nbatch]
+        else:
+            return np.zeros(shape, dtype=self.dtype)
+        box.fill(0)
+        return box
+
+    def _ifft(self, box):
+        res = scipy.fft.ifftn(box, axes=(2, 3, 4), norm="forward", workers=self.workers, overwrite_x=True)
+        res *= self.norm
+        return res
+
+    def transform(self, wfc, gvecs, key=None, out=None, reuse=False):
+        """
+        Real-space wavefunctions of all the bands of wfc at once.
+
+        Args:
+            wfc (numpy.ndarray): Wavefunctions (..., nspinor, ngvec).
+            gvecs (numpy.ndarray): G-vectors in crystal coordinates (ngvec, 3).
+            key (hashable, optional): Key used to cache the scatter indices of gvecs.
+            out (numpy.ndarray, optional): Box used for the output (size prod(...)*nspinor*Nx*Ny*Nz).
+            reuse (bool, optional): If True, use the internal buffer (overwritten by the next call).
+
+        Returns:
+            numpy.ndarray: Real-space wavefunctions (..., nspinor, Nx, Ny, Nz).
+        """
+        lead = wfc.shape[:-2]
+        ng = wfc.shape[-1]
+        nbatch = int(np.prod(lead))
+        box = self._box(nbatch, out=out, reuse=reuse)
+        idx = self.scatter_index(gvecs, key=key)
+        box.reshape(nbatch, self.nspinor, -1)[:, :, idx] = wfc.reshape(nbatch, self.nspinor, ng)
+        return self._ifft(box).reshape(lead + (self.nspinor,) + self.grid)
+
+    def transform_kpoints(self, wfcs, gvecs_list, keys=None, out=None, reuse=False):
+        """
+        Same as transform for several k-points with a single FFT call.
+        All the wfcs must have the same leading shape (...).
+
+        Returns:
+            numpy.ndarray: Real-space wavefunctions (nk, ..., nspinor, Nx, Ny, Nz).
+        """
+        if keys is None: keys = [None] * len(wfcs)
+        lead = wfcs[0].shape[:-2]
+        nbatch = int(np.prod(lead))
+        box = self._box(len(wfcs) * nbatch, out=out, reuse=reuse)
+        box_flat = box.reshape(len(wfcs), nbatch, self.nspinor, -1)
+        for i, (wfc, gvecs, key) in enumerate(zip(wfcs, gvecs_list, keys)):
+            assert wfc.shape[:-2] == lead, "All the wavefunctions must have the same leading shape"
+            idx = self.scatter_index(gvecs, key=key)
+            box_flat[i][:, :, idx] = wfc.reshape(nbatch, self.nspinor, -1)
+        return self._ifft(box).reshape((len(wfcs),) + lead + (self.nspinor,) + self.grid)
+
+def read_wf_fragment(fname, varname, min_bnd, nbands, ngvec, out=None, dtype=None):
+    """
+    Read the wavefunction components from a single ns.wf fragment.
+
+    Parameters
+    ----------
+    fname : str
+        Path of the ns.wf_fragments_* file.
+    varname : str
+        Name of the netCDF variable (WF_COMPONENTS_@_SP_POL*_K*_BAND_GRP_1).
+    min_bnd, nbands : int
+        Bands [min_bnd, min_bnd+nbands) are read.
+    ngvec : int
+        Number of meaningful G-vectors. Only these components are read.
+    out : ndarray (optional)
+        Complex array (nbands, nspinor, ngvec) to be filled in place. If None, a new one is created.
+    dtype : numpy.dtype (optional)
+        Complex dtype of the new array (if out is None). Default is the precision of the file.
+
+    Returns
+    -------
+    ndarray
+        Wavefunction components (nbands, nspinor, ngvec).
+    """
+    try:
+        with _netcdf_lock, Dataset(fname, 'r') as database:
+            aux = database.variables[varname][min_bnd:min_bnd + nbands, :, :ngvec, :].data
+    except Exception as e:
+        raise IOError(f'Could not read {fname}: {e}')
+    if out is None:
+        if dtype is None: dtype = np.result_type(aux.dtype, np.complex64)
+        out = np.empty(aux.shape[:-1], dtype=dtype)
+    out.real = aux[..., 0]
+    out.imag = aux[..., 1]
+    return out
+
+def pad_packed(packed, offsets, ng, fill_value=0):
+    """
+    Convert a packed (ragged) array of G-vector quantities to a padded array.
+
+    Parameters
+    ----------
+    packed : ndarray
+        G-vector quantities of all k-points stored one after the other (sum(ng_k), ...).
+    offsets : ndarray
+        Offsets of each k-point in packed (nk+1).
+    ng : int
+        Size of the padded G-vector axis (>= max(ng_k)).
+    fill_value : scalar
+        Value of the padded entries.
+
+    Returns
+    -------
+    ndarray
+        Padded array (nk, ng, ...).
+    """
+    nk = len(offsets) - 1
+    padded = np.full((nk, ng) + packed.shape[1:], fill_value, dtype=packed.dtype)
+    for ik in range(nk):
+        padded[ik, :offsets[ik + 1] - offsets[ik]] = packed[offsets[ik]:offsets[ik + 1]]
+    return padded
+
+class GvecIndex:
+    """
+    Exact lookup of integer Miller indices.
+
+    The G-vectors are linearised inside their bounding box and the keys are sorted,
+    so a search is a np.searchsorted call (no tree and no floating point distances).
+    It can be used in place of a KDTree of G-vectors: query() has the same signature
+    and returns zero distance for the G-vectors found and inf otherwise.
+
+    Example usage:
+
+        gindex = GvecIndex(gvecs)     # gvecs (ng,3) integers
+        idx = gindex.find(gvecs_other) # idx[i] = j if gvecs_other[i] == gvecs[j], else -1
+    """
+    def __init__(self, gvecs):
+        """
+        Args:
+            gvecs (numpy.ndarray): Miller indices (ng,3).
+        """
+        gvecs = np.asarray(gvecs, dtype=np.int64).reshape(-1, 3)
+        self.ng = len(gvecs)
+        self.rot_inv = None
+        if len(gvecs) == 0:
+            self.gmin = np.zeros(3, dtype=np.int64)
+            self.dims = np.ones(3, dtype=np.int64)
+        else:
+            self.gmin = gvecs.min(axis=0)
+            self.dims = gvecs.max(axis=0) - self.gmin + 1
+        keys = self._keys(gvecs)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def _keys(self, gvecs):
+        """Linear index of the G-vectors in the bounding box."""
+        g = gvecs - self.gmin[None, :]
+        return (g[:, 0] * self.dims[1] + g[:, 1]) * self.dims[2] + g[:, 2]
+
+    def rotated(self, rot):
+        """
+        Index of the rotated G-vectors gvecs @ rot sharing the same lookup tables.
+
+        Args:
+            rot (numpy.ndarray): Invertible integer matrix (3,3).
+        """
+        new = object.__new__(GvecIndex)
+        new.__dict__.update(self.__dict__)
+        rot_inv = np.rint(np.linalg.inv(rot)).astype(np.int64)
+        new.rot_inv = rot_inv if self.rot_inv is None else rot_inv @ self.rot_inv
+        return new
+
+    def find(self, gvecs):
+        """
+        Find the position of G-vectors in the index.
+
+        Args:
+            gvecs (numpy.ndarray): Miller indices (n,3).
+
+        Returns:
+            numpy.ndarray: (n,) positions in the original G-vector list, -1 if not present.
+        """
+        gvecs = np.asarray(gvecs).reshape(-1, 3)
+        if self.ng == 0: return np.full(len(gvecs), -1, dtype=np.int64)
+        if self.rot_inv is not None: gvecs = gvecs @ self.rot_inv
+        gvecs = np.rint(gvecs).astype(np.int64)
+        inside = np.all((gvecs >= self.gmin[None, :]) & (gvecs < (self.gmin + self.dims)[None, :]), axis=1)
+        keys = self._keys(np.where(inside[:, None], gvecs, self.gmin[None, :]))
+        pos = np.minimum(np.searchsorted(self.sorted_keys, keys), self.ng - 1)
+        found = inside & (self.sorted_keys[pos] == keys)
+        return np.where(found, self.order[pos], -1)
+
+    def query(self, gvecs, k=1):
+        """
+        KDTree-like interface. Returns (dist, idx) with dist = 0 for the
+        G-vectors found and inf otherwise (idx is then meaningless).
+        """
+        idx = self.find(gvecs)
+        dist = np.where(idx >= 0, 0.0, np.inf)
+        return dist, np.maximum(idx, 0)
+
 ##
 @func_profile
-def wfc_inner_product(k_bra, wfc_bra, gvec_bra, k_ket, wfc_ket, gvec_ket, ket_Gtree=None):
+def wfc_inner_product(k_bra, wfc_bra, gvec_bra, k_ket, wfc_ket, gvec_ket, ket_Gtree=None, bra_Gindex=None):
     """
     Computes the inner product between two wavefunctions in reciprocal space. <k_bra | k_ket>
     
@@ -670,8 +1509,12 @@ def wfc_inner_product(k_bra, wfc_bra, gvec_bra, k_ket, wfc_ket, gvec_ket, ket_Gt
         Wavefunction coefficients for the ket state with shape (nspin, nbnd, nspinor, ng).
     gvec_ket : ndarray
         Miller indices of the ket wavefunction (ng, 3) in reduced coordinates.
-    ket_Gtree  : scipy.spatial._kdtree.KDTree (optional)
-        Kdtree for gvec_ket. leave it or give None to internally build one
+    ket_Gtree  : GvecIndex or KDTree (optional)
+        Lookup object for gvec_ket. leave it or give None to internally build one (GvecIndex)
+    bra_Gindex : GvecIndex (optional)
+        Lookup object for gvec_bra (e.g. from YamboWFDB.get_BZ_gvec_index). If given,
+        the ket G-vectors are searched among the bra ones and ket_Gtree is not used.
+        Useful when the bra wavefunction is reused in many inner products.
     #
     Returns
     -------
@@ -690,9 +1533,19 @@ def wfc_inner_product(k_bra, wfc_bra, gvec_bra, k_ket, wfc_ket, gvec_ket, ket_Gt
     ## crystal momentum mismatch delta_{k,k'}
     if np.max(np.abs(kdiff)) > 1e-5:
         return np.zeros((nspin, nbnd, nbnd),dtype=wfc_ket.dtype)
-    # Construct KDTree for nearest-neighbor search in G-vectors
+    if bra_Gindex is not None:
+        ## position of each ket G-vector in the bra
+        ii = bra_Gindex.find(gvec_ket - G0[None,:])
+        ket_idx = np.where(ii >= 0)[0]
+        bra_idx = ii[ket_idx]
+        inprod = np.zeros((nspin, nbnd, nbnd),dtype=wfc_bra.dtype)
+        for ispin in range(nspin):
+            inprod[ispin] = wfc_bra[ispin][...,bra_idx].conj().reshape(nbnd,-1) \
+                            @ wfc_ket[ispin][...,ket_idx].reshape(nbnd,-1).T
+        return inprod
+    # Exact lookup of the ket G-vectors
     if ket_Gtree is None:
-        ket_Gtree = KDTree(gvec_ket)
+        ket_Gtree = GvecIndex(gvec_ket)
     gbra_shift = gvec_bra + G0[None,:]
     ## get the nearest indices and their distance
     dd, ii = ket_Gtree.query(gbra_shift, k=1)
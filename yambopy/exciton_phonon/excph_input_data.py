@@ -3,12 +3,14 @@
 ##
 import numpy as np
 import os
+import warnings
 import netCDF4 
-from yambopy import YamboLatticeDB,YamboExcitonDB,LetzElphElectronPhononDB,YamboDipolesDB,YamboWFDB
+from yambopy import YamboLatticeDB,YamboExcitonDB,YamboExcitonQDBs,LetzElphElectronPhononDB,YamboDipolesDB,YamboWFDB
 from yambopy.exciton_phonon.excph_matrix_elements import exciton_phonon_matelem
 from yambopy.bse.excitondipoles import exc_dipoles_pol
+from yambopy.tools.dmat_cache import DmatCache
 
-def exc_ph_get_inputs(lat_path,elph_path,bse_path1,mode='PL',bse_path2=None,wf_path=None,dipoles_path=None,nexc_in='all',nexc_out='all',bands_range=[],phonons_range=[],overwrite=False,dmat_file='Dmats.npy',exph_file='Ex-ph.npy',dip_file='exc_dipoles.npy'):
+def exc_ph_get_inputs(lat_path,elph_path,bse_path1,mode='PL',bse_path2=None,wf_path=None,dipoles_path=None,nexc_in='all',nexc_out='all',bands_range=[],phonons_range=[],overwrite=False,dmat_cache=None,exph_file='Ex-ph.npy',dip_file='exc_dipoles.npy',dmat_file=None):
     """
     This functions creates the necessary inputs for exciton-phonon calculations,
     in the format accepted by the related functions.
@@ -51,9 +53,18 @@ def exc_ph_get_inputs(lat_path,elph_path,bse_path1,mode='PL',bse_path2=None,wf_p
         Number of phonon modes included. Python indexing. Right one is excluded.
     overwrite : bool, optional
         If True, do not read from existing *.npy files and always perform the calculations
-    dmat_file, exph_file, dip_file : strings, optional
-        Name of .npy auxiliary output files for dmats, exc-ph couplings, and unprojected dipoles
+        (the Dmats are recomputed and their entry in `dmat_cache` is replaced)
+    dmat_cache : string, optional
+        Folder of the persistent Dmat cache (entries are keyed by SAVE, bands and symmetries).
+        Default None: DmatCache default folder (~/.cache/yambopy/dmats)
+    exph_file, dip_file : strings, optional
+        Name of .npy auxiliary output files for exc-ph couplings and unprojected dipoles
+    dmat_file : string, optional
+        Deprecated and ignored: the Dmats are stored in `dmat_cache`.
     """
+    if dmat_file is not None:
+        warnings.warn("exc_ph_get_inputs: `dmat_file` is deprecated and ignored, "
+                      "the Dmats are stored in the `dmat_cache` folder", FutureWarning, stacklevel=2)
     if wf_path is None:   wf_path = lat_path
     if mode=='PL' and dipoles_path is None:
         raise ValueError('Please specify `dipoles_path` to ndb.dipoles directory')
@@ -66,15 +77,11 @@ def exc_ph_get_inputs(lat_path,elph_path,bse_path1,mode='PL',bse_path2=None,wf_p
     if len(phonons_range)==0: phonons_range=[0,elph.nm]
     ph_energies = elph.ph_energies[:,phonons_range[0]:phonons_range[1]]
 
-    # Load exciton energies (Lout)
-    exc_energies = []
-    for iq in range(lattice.ibz_nkpoints):
-        filename = 'ndb.BS_diago_Q%d' % (iq+1)
-        excdb = YamboExcitonDB.from_db_file(lattice,filename=filename,\
-                                            folder=bse_path1,Load_WF=False,\
-                                            neigs=nexc_out)
-        exc_energies.append( excdb.eigenvalues.real )
-    exc_energies = np.array(exc_energies)
+    # Load exciton energies (Lout), reading the Q-points concurrently
+    excdbs = YamboExcitonQDBs.from_folder(lattice,folder=bse_path1,\
+                                          qpoints=np.arange(1,lattice.ibz_nkpoints+1),\
+                                          Load_WF=False,neigs=nexc_out)
+    exc_energies = excdbs.eigenvalues.real
     exc_energies = exc_energies[lattice.BZ_to_IBZ_indexes,:]
 
     # Load exciton energies (Lin)
@@ -92,11 +99,11 @@ def exc_ph_get_inputs(lat_path,elph_path,bse_path1,mode='PL',bse_path2=None,wf_p
     wfcs = YamboWFDB(filename='ns.wf',save=wf_path,latdb=lattice,bands_range=bands_range)
 
     # Calculate and load exciton-phonon matrix elements
-    if os.path.isfile(dmat_file) and not overwrite: dmat_mode='load'
-    else: dmat_mode='save'
+    # (Dmats are reused from the cache only if computed for the same SAVE, bands and symmetries)
+    if overwrite: DmatCache(dmat_cache).remove(wfcs.Dmat_cache_key())
     excph_couplings = exciton_phonon_matelem(lattice,elph,wfcs,BSE_dir=bse_path1,BSE_Lin_dir=bse_path2,\
                                              nexc_in=nexc_in,nexc_out=nexc_out,overwrite=overwrite,\
-                                             dmat_mode=dmat_mode,exph_file=exph_file)
+                                             dmat_mode='save',dmat_cache=dmat_cache,exph_file=exph_file)
     excph_couplings = excph_couplings[:,phonons_range[0]:phonons_range[1],:nexc_in,:nexc_out]
     
     if mode=='PL':
@@ -3,13 +3,18 @@
 ##
 import numpy as np
 import os
-from yambopy.dbs.excitondb import YamboExcitonDB
+import warnings
+from yambopy.dbs.excitondb import YamboExcitonDB, YamboExcitonQDBs
 from yambopy.bse.exciton_matrix_elements import exciton_X_matelem
 from yambopy.bse.rotate_excitonwf import rotate_exc_wf
+from yambopy.tools.dmat_cache import DmatCache
+from yambopy.tools.lru_cache import LRUCache
 from tqdm import tqdm
 
 def exciton_phonon_matelem(latdb,elphdb,wfdb,Qrange=[0,1],BSE_dir='bse',BSE_Lin_dir=None,
-                           nexc_in=-1,nexc_out=-1,dmat_mode='run',save_files=True,exph_file='Ex-ph.npy',overwrite=False):
+                           nexc_in=-1,nexc_out=-1,dmat_mode='run',save_files=True,exph_file='Ex-ph.npy',overwrite=False,
+                           dmat_cache=None,workers=1,akcv_cache_size=64,akcv_cache_bytes=1024**3,
+                           akcv_cache=None,verbose=False):
     """
     This function calculates the exciton-phonon matrix elements
 
@@ -39,7 +44,25 @@ def exciton_phonon_matelem(latdb,elphdb,wfdb,Qrange=[0,1],BSE_dir='bse',BSE_Lin_
     nexc_out : int, optional
         Number of excitonic states included in Lout calculation. Default is -1 (all).
     dmat_mode : str, optional
-        If 'save', print dmats on .npy file for faster recalculation. If 'load', load from .npy file. Else, calculate Dmats at runtime.
+        If 'save', store dmats in the cache `dmat_cache` for faster recalculation (reusing them if already there).
+        If 'load', load them from the cache. Else, calculate Dmats at runtime.
+    dmat_cache : str, optional
+        Folder of the persistent Dmat cache (see yambopy.tools.dmat_cache).
+        Default is None (DmatCache default folder, ~/.cache/yambopy/dmats).
+    workers : int, optional
+        Number of processes reading the ndb.BS_diago_Q* databases. Default is 1 (serial).
+    akcv_cache_size : int, optional
+        Maximum number of rotated exciton coefficients kept in memory and reused among
+        the Q-points (see AkcvCache). 0 disables the cache. Default is 64.
+    akcv_cache_bytes : int, optional
+        Maximum memory (in bytes) used by the cached exciton coefficients. Default is 1 GB.
+    akcv_cache : AkcvCache, optional
+        Cache to use instead of a new one bounded by `akcv_cache_size` and `akcv_cache_bytes`,
+        e.g. to read its hit rate afterwards with akcv_cache.stats(). The rotated coefficients
+        are keyed by the wfdb, exciton databases and Dmats used, so only the Lin databases are
+        reused by another call. Default is None.
+    verbose : bool, optional
+        If True, print the statistics of the Akcv cache at the end. Default is False.
     save_files : bool, optional
         If True, the matrix elements will be saved in .npy file `exph_file`. Default is True.
     overwrite : bool, optional
@@ -52,13 +75,10 @@ def exciton_phonon_matelem(latdb,elphdb,wfdb,Qrange=[0,1],BSE_dir='bse',BSE_Lin_
         exph_mat_loaded = np.load(exph_file)
         return exph_mat_loaded
 
-    # Load exc dbs
-    exdbs = []
-    for ik in range(wfdb.nkpoints):
-        filename = 'ndb.BS_diago_Q%d' % (ik+1)
-        excdb = YamboExcitonDB.from_db_file(latdb,filename=filename,folder=BSE_dir,\
-                                            Load_WF=True, neigs=nexc_out)
-        exdbs.append(excdb)
+    # Load exc dbs (concurrently, the eigenvectors are read by get_Akcv when needed)
+    exdbs = YamboExcitonQDBs.from_folder(latdb,folder=BSE_dir,qpoints=np.arange(1,wfdb.nkpoints+1),\
+                                         Load_WF=True,lazy=True,neigs=nexc_out,workers=workers)
+    for excdb in exdbs:
         #
         # NM : Add a sanity check to avoid a disasterous consequence
         # if the user gives wrong bse band indices.
@@ -70,15 +90,18 @@ def exciton_phonon_matelem(latdb,elphdb,wfdb,Qrange=[0,1],BSE_dir='bse',BSE_Lin_
                 "Bse band range found (expected) : [%d %d]" %( min_bnd_bse,max_bnd_bse))
 
     # get D matrices
-    Dmats = save_or_load_dmat(wfdb,mode=dmat_mode,dmat_file='Dmats.npy')
+    Dmats = save_or_load_dmat(wfdb,mode=dmat_mode,dmat_cache=dmat_cache)
 
     # Calculation
     print('Calculating EXCPH matrix elements...')
+    if akcv_cache is None: akcv_cache = AkcvCache(maxsize=akcv_cache_size,max_bytes=akcv_cache_bytes)
     exph_mat = []
     for iQ in tqdm(range(Qrange[0],Qrange[1])):
         Q_in = wfdb.kBZ[iQ]
         exph_mat.append( exciton_phonon_matelem_iQ(elphdb,wfdb,exdbs,Dmats,\
-                                                   BSE_Lin_dir=BSE_Lin_dir,Q_in=Q_in,neigs=nexc_in) )
+                                                   BSE_Lin_dir=BSE_Lin_dir,Q_in=Q_in,neigs=nexc_in,\
+                                                   akcv_cache=akcv_cache) )
+    if verbose: print(akcv_cache)
     # IO
     if len(exph_mat)<2: exph_mat = exph_mat[0] # single Q-point calculation (suppress axis)
     else:               exph_mat = np.array(exph_mat) #[nQ,nq,nmodes,nexc_in (Qexc),nexc_out (Qexc+q)]
@@ -91,7 +114,7 @@ def exciton_phonon_matelem(latdb,elphdb,wfdb,Qrange=[0,1],BSE_dir='bse',BSE_Lin_
     return exph_mat
 
 def exciton_phonon_matelem_iQ(elphdb,wfdb,exdbs,Dmats,BSE_Lin_dir=None,
-                              Q_in=np.zeros(3),neigs=-1,dmat_mode='run'): 
+                              Q_in=np.zeros(3),neigs=-1,dmat_mode='run',akcv_cache=None): 
     """
     This function calculates the exciton-phonon matrix element per Q 
 
@@ -115,10 +138,13 @@ def exciton_phonon_matelem_iQ(elphdb,wfdb,exdbs,Dmats,BSE_Lin_dir=None,
         Excitonic momentum in reduced units. Default np.array([0.0,0.0,0.0]) 
     neigs : int, optional
         Number of excitonic states included in calculation. Default is -1 (all).
+    akcv_cache : AkcvCache, optional
+        Cache of the rotated exciton coefficients (and of the Lin databases), shared among Q-points.
+        Default is None (no cache).
     """
     latdb = wfdb.ydb
     # Determine Lkind(in)
-    Ak = rotate_Akcv_Q(wfdb, exdbs, Q_in, Dmats, neigs=neigs, folder=BSE_Lin_dir)
+    Ak = rotate_Akcv_Q(wfdb, exdbs, Q_in, Dmats, neigs=neigs, folder=BSE_Lin_dir, cache=akcv_cache)
     # Compute ex-ph
     exph_mat = []
     bse_bnds_range = [wfdb.min_bnd,wfdb.min_bnd + wfdb.nbands]
@@ -126,7 +152,7 @@ def exciton_phonon_matelem_iQ(elphdb,wfdb,exdbs,Dmats,BSE_Lin_dir=None,
         ph_eig, elph_mat = elphdb.read_iq(iq,bands_range=bse_bnds_range,convention='standard')
         elph_mat = elph_mat.transpose(1,0,2,4,3)
         #
-        Akq = rotate_Akcv_Q(wfdb, exdbs, Q_in + elphdb.qpoints[iq], Dmats) # q+Q
+        Akq = rotate_Akcv_Q(wfdb, exdbs, Q_in + elphdb.qpoints[iq], Dmats, cache=akcv_cache) # q+Q
         tmp_exph = exciton_X_matelem(Q_in, elphdb.qpoints[iq], \
                                      Akq, Ak, elph_mat, wfdb.kBZ, \
                                      contribution='b', diagonal_only=False, ktree=wfdb.ktree)
@@ -137,31 +163,104 @@ def exciton_phonon_matelem_iQ(elphdb,wfdb,exdbs,Dmats,BSE_Lin_dir=None,
 
     return exph_mat
 
-def save_or_load_dmat(wfdb, mode='run', dmat_file='Dmats.npy'):
+def save_or_load_dmat(wfdb, mode='run', dmat_cache=None, dmat_file=None):
     """
-    Save or load Dmats to/from .npy file `dmat_file` for faster recalculation.
+    Save or load Dmats to/from the persistent cache `dmat_cache` for faster recalculation.
 
-     If mode=='save', print dmats on .npy file for faster recalculation. 
-     If mode=='load', load from .npy file. 
+     The cache entries are keyed by the content of ns.db1, the band range and the
+     symmetries, so Dmats computed for a different SAVE or bands are never reused.
+     dmat_cache=None uses the default folder of DmatCache (~/.cache/yambopy/dmats).
+
+     If mode=='save', load dmats from the cache if present, otherwise compute and store them.
+     If mode=='load', load dmats from the cache (error if they are not there).
      Else, calculate Dmats at runtime.
+
+     dmat_file is deprecated and ignored (the Dmats are stored in `dmat_cache`).
     """
-    if dmat_file[-4:]!='.npy': dmat_file = dmat_file+'.npy'
+    if dmat_file is not None:
+        warnings.warn("save_or_load_dmat: `dmat_file` is deprecated and ignored, "
+                      "the Dmats are stored in the `dmat_cache` folder", FutureWarning, stacklevel=2)
     if mode=='save':
         print('Saving D matrices...')
-        Dmats = wfdb.Dmat()
-        np.save(dmat_file,Dmats)
-        return Dmats
+        return wfdb.Dmat(cache=DmatCache(dmat_cache))
     elif mode=='load': 
         print('Loading D matrices...')
-        if not os.path.exists(dmat_file):
-            raise FileNotFoundError(f"Cannot load '{dmat_file}' - file does not exist.")
-        Dmats_loaded = np.load(dmat_file)
+        cache = DmatCache(dmat_cache)
+        Dmats_loaded = cache.load(wfdb.Dmat_cache_key())
+        if Dmats_loaded is None:
+            raise FileNotFoundError(f"Cannot load Dmats - no entry for this SAVE, bands and symmetries in '{cache.cache_dir}'.")
         return Dmats_loaded
     else:
         return wfdb.Dmat()
 
 
-def rotate_Akcv_Q(wfdb, exdbs, Qpt, Dmats, neigs=-1, folder=None):
+class AkcvCache:
+    """
+    Cache of the exciton coefficients used by exciton_phonon_matelem.
+
+    The rotated coefficients A_{Q}(kcv) are kept in a bounded LRU cache keyed by
+    (source, Lin folder, iQ_iBZ, isym, time reversal): the Q+q points of different Q in Qrange
+    are obtained from the same iBZ points and symmetries. The source identifies the wfdb,
+    exdbs and Dmats objects the coefficients were computed with (the cache keeps a reference
+    to them), so a cache reused with other exciton databases, bands or Dmats never returns
+    stale coefficients. Each Q visits all the Q+q points, so to reuse all of them maxsize
+    must be the number of phonon q-points, each entry being nexc*nkBZ*nc*nv complex numbers.
+    The Lin databases (BSE_Lin_dir) are kept in a second cache with the same bounds.
+
+    Example usage:
+
+        cache = AkcvCache(maxsize=128, max_bytes=4*1024**3)
+        Ak = rotate_Akcv_Q(wfdb, exdbs, Qpt, Dmats, cache=cache)
+        print(cache)    ## hit rate, to size maxsize
+
+    Attributes:
+        rotated (LRUCache): Rotated Akcv. maxsize <= 0 disables it.
+        lin_Akcv (LRUCache): iBZ Akcv of the Lin databases, keyed by (folder, neigs, iQ_iBZ).
+        lin_reads (int): Number of Lin databases read from disk.
+    """
+    def __init__(self, maxsize=64, max_bytes=1024**3):
+        self.rotated = LRUCache(maxsize=maxsize, max_bytes=max_bytes)
+        self.lin_Akcv = LRUCache(maxsize=maxsize, max_bytes=max_bytes)
+        self.lin_reads = 0
+        self._sources = {}
+
+    def source(self, wfdb, exdbs, Dmats):
+        """ Key of the objects used to compute the rotated coefficients """
+        key = (id(wfdb), id(exdbs), id(Dmats))
+        # keep them alive, so that their ids are not reused by other objects
+        self._sources[key] = (wfdb, exdbs, Dmats)
+        return key
+
+    def get_lin_Akcv(self, latdb, folder, iQ_iBZ, neigs):
+        """ Akcv of ndb.BS_diago_Q{iQ_iBZ+1} in folder (read again only if evicted) """
+        key = (os.path.abspath(folder), neigs, iQ_iBZ)
+        Akcv = self.lin_Akcv.get(key)
+        if Akcv is None:
+            filename = 'ndb.BS_diago_Q%d' % (iQ_iBZ+1)
+            excdbin = YamboExcitonDB.from_db_file(latdb,filename=filename,folder=folder,\
+                                                  Load_WF=True, neigs=neigs, lazy=True)
+            Akcv = excdbin.get_Akcv()
+            self.lin_Akcv.put(key, Akcv)
+            self.lin_reads += 1
+        return Akcv
+
+    def clear(self):
+        """ Remove all the entries and the references to their sources (statistics are kept) """
+        self.rotated.clear()
+        self.lin_Akcv.clear()
+        self._sources.clear()
+
+    def stats(self):
+        """ Statistics of the rotated Akcv cache (see LRUCache.stats) and number of Lin reads """
+        return dict(self.rotated.stats(), lin_reads=self.lin_reads)
+
+    def __str__(self):
+        stats = self.stats()
+        return ("Akcv cache: %d hits, %d misses (hit rate %.1f%%), %d/%d entries (%.1f MB), %d Lin databases read" %
+                (stats['hits'], stats['misses'], 100*stats['hit_rate'], stats['entries'],
+                 stats['maxsize'], stats['nbytes']/1024**2, stats['lin_reads']))
+
+def rotate_Akcv_Q(wfdb, exdbs, Qpt, Dmats, neigs=-1, folder=None, cache=None):
     '''
     Qpt reduced coordinates in BZ or whatever
 
@@ -172,6 +271,7 @@ def rotate_Akcv_Q(wfdb, exdbs, Qpt, Dmats, neigs=-1, folder=None):
     neigs: number of states (used if folder is not None, otherwise it's nexc_out)
     folder: where to load the Lin exciton states (if needed). 
             can be used also to reload the same in case we want nexc_in/=nexc_out for same L
+    cache: AkcvCache (optional) to reuse the rotated states and read the Lin databases only once
     '''
     latdb = wfdb.ydb
     idx_BZQ = wfdb.kptBZidx(Qpt)
@@ -181,15 +281,25 @@ def rotate_Akcv_Q(wfdb, exdbs, Qpt, Dmats, neigs=-1, folder=None):
     symm_mat_red = latdb.lat@latdb.sym_car[iQ_isymm]@np.linalg.inv(latdb.lat)
     exe_iQIBZ = wfdb.kpts_iBZ[iQ_iBZ]
     #
+    if folder is not None and neigs==-1:
+        neigs = len(exdbs[0].eigenvalues) # Set neigs equal to nexc_out
+    #
+    if cache is not None:
+        key = (cache.source(wfdb, exdbs, Dmats), None if folder is None else (os.path.abspath(folder), neigs),
+               iQ_iBZ, iQ_isymm, bool(trev))
+        AQ_rot = cache.rotated.get(key)
+        if AQ_rot is not None: return AQ_rot
+    #
     if folder is not None:
-        if neigs==-1:
-            neigs = len(exdbs[0].eigenvalues) # Set neigs equal to nexc_out
-        filename = 'ndb.BS_diago_Q%d' % (iQ_iBZ+1)
-        excdbin = YamboExcitonDB.from_db_file(latdb,filename=filename,folder=folder,\
-                                              Load_WF=True, neigs=neigs)
-        AQibz = excdbin.get_Akcv()
+        if cache is not None: AQibz = cache.get_lin_Akcv(latdb, folder, iQ_iBZ, neigs)
+        else:
+            filename = 'ndb.BS_diago_Q%d' % (iQ_iBZ+1)
+            excdbin = YamboExcitonDB.from_db_file(latdb,filename=filename,folder=folder,\
+                                                  Load_WF=True, neigs=neigs)
+            AQibz = excdbin.get_Akcv()
     else : AQibz = exdbs[iQ_iBZ].get_Akcv()
     #
     AQ_rot = rotate_exc_wf(AQibz,symm_mat_red,wfdb.kBZ,exe_iQIBZ,Dmats[iQ_isymm],trev,wfdb.ktree)
+    if cache is not None: cache.rotated.put(key, AQ_rot)
     
     return AQ_rot
@@ -0,0 +1,89 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import os
+from yambopy.dbs.wfdb import YamboWFDB
+from yambopy.dbs.excitondb import YamboExcitonQDBs
+from yambopy.dbs.tests.wfdb_synthetic import make_synthetic_save
+from yambopy.dbs.tests.excitondb_synthetic import write_bs_diago
+from yambopy.exciton_phonon.excph_matrix_elements import rotate_Akcv_Q, AkcvCache, save_or_load_dmat
+
+class TestRotateAkcv(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        make_synthetic_save(os.path.join(self.tmp_path,'SAVE'),nbands=6)
+        self.wfdb = YamboWFDB(path=self.tmp_path,bands_range=[2,6])
+        k,v,c = np.meshgrid(np.arange(1,self.wfdb.nkBZ+1),[3,4],[5,6],indexing='ij')
+        table = np.stack([k.ravel(),v.ravel(),c.ravel(),np.ones(k.size),np.ones(k.size)],axis=1)
+        rng = np.random.default_rng(0)
+        for folder in ['bse','lin']:
+            os.makedirs(os.path.join(self.tmp_path,folder))
+            for iq in range(self.wfdb.nkpoints):
+                eivecs = rng.normal(size=(4,len(table)))+1j*rng.normal(size=(4,len(table)))
+                write_bs_diago(os.path.join(self.tmp_path,folder,'ndb.BS_diago_Q%d'%(iq+1)),table,eivecs,np.linspace(1,2,4))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_cache(self):
+        """ cached rotated Akcv are the same as the ones computed at each call, Lin read once """
+        exdbs = YamboExcitonQDBs.from_folder(self.wfdb.ydb,folder=os.path.join(self.tmp_path,'bse'))
+        Dmats = self.wfdb.Dmat()
+        cache = AkcvCache(maxsize=2*self.wfdb.nkBZ)
+        for sweep in range(2):
+            for Qpt in self.wfdb.kBZ:
+                for folder in [None,os.path.join(self.tmp_path,'lin')]:
+                    ref = rotate_Akcv_Q(self.wfdb,exdbs,Qpt,Dmats,folder=folder)
+                    np.testing.assert_array_equal(rotate_Akcv_Q(self.wfdb,exdbs,Qpt,Dmats,folder=folder,cache=cache),ref)
+        stats = cache.stats()
+        self.assertEqual(stats['misses'],2*self.wfdb.nkBZ)
+        self.assertEqual(stats['hits'],2*self.wfdb.nkBZ)
+        self.assertEqual(stats['lin_reads'],self.wfdb.nkpoints)
+
+        # other exciton databases or Dmats never give back the cached coefficients
+        exdbs_lin = YamboExcitonQDBs.from_folder(self.wfdb.ydb,folder=os.path.join(self.tmp_path,'lin'))
+        for Qpt in self.wfdb.kBZ:
+            np.testing.assert_array_equal(rotate_Akcv_Q(self.wfdb,exdbs_lin,Qpt,Dmats,cache=cache),
+                                          rotate_Akcv_Q(self.wfdb,exdbs_lin,Qpt,Dmats))
+        self.assertEqual(cache.stats()['hits'],2*self.wfdb.nkBZ)
+        rotate_Akcv_Q(self.wfdb,exdbs,self.wfdb.kBZ[0],Dmats.copy(),cache=cache)
+        self.assertEqual(cache.stats()['hits'],2*self.wfdb.nkBZ)
+
+    def test_cache_bytes(self):
+        """ the cache never holds more than max_bytes """
+        exdbs = YamboExcitonQDBs.from_folder(self.wfdb.ydb,folder=os.path.join(self.tmp_path,'bse'))
+        Dmats = self.wfdb.Dmat()
+        nbytes = rotate_Akcv_Q(self.wfdb,exdbs,self.wfdb.kBZ[0],Dmats).nbytes
+        cache = AkcvCache(maxsize=100,max_bytes=2*nbytes)
+        for Qpt in self.wfdb.kBZ:
+            rotate_Akcv_Q(self.wfdb,exdbs,Qpt,Dmats,folder=os.path.join(self.tmp_path,'lin'),cache=cache)
+            self.assertLessEqual(cache.rotated.nbytes,2*nbytes)
+            self.assertLessEqual(cache.lin_Akcv.nbytes,2*nbytes)
+        self.assertEqual(len(cache.rotated),2)
+
+class TestSaveOrLoadDmat(unittest.TestCase):
+
+    def test_dmat_file(self):
+        """ the deprecated dmat_file argument warns and is ignored """
+        tmp_path = tempfile.mkdtemp()
+        try:
+            make_synthetic_save(os.path.join(tmp_path,'SAVE'),nbands=4)
+            wfdb = YamboWFDB(path=tmp_path,bands_range=[0,4])
+            with self.assertWarns(FutureWarning):
+                Dmats = save_or_load_dmat(wfdb,mode='save',dmat_cache=os.path.join(tmp_path,'dmats'),dmat_file='Dmats.npy')
+            self.assertFalse(os.path.exists('Dmats.npy'))
+            np.testing.assert_array_equal(save_or_load_dmat(wfdb,mode='load',dmat_cache=os.path.join(tmp_path,'dmats')),Dmats)
+        finally:
+            shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,20 +9,28 @@
 #
 import numpy as np
 from itertools import product
-from yambopy.lattice import red_car, vec_in_list, isbetween, car_red
+from yambopy.lattice import red_car
 from qepy.lattice import Path
 from scipy.spatial import KDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-def expand_kpoints(car_kpoints,sym_car,rlat,atol=1.e-6):
+def expand_kpoints(car_kpoints,sym_car,rlat,atol=1.e-6,chunk=2048):
     """
     Take a list of kpoints and symmetry operations and return the full brillouin zone
     with the corresponding index in the irreducible brillouin zone
 
+    All the symmetries are applied to all the kpoints at once (one batched matmul). The images of each kpoint
+    are then compared with each other (vectorised over the kpoints), keeping the first
+    image of each group of equivalent ones in the order of the symmetries, as in the
+    original sequential search.
+
     Input:
     * IBZ kpoints in Cartesian coodinates
     * Symmetry operations in Cartesian coordinates
     * rlat: reciprocal lattice vectors
     * atol: tolerance for the distance between kpoints
+    * chunk: number of IBZ kpoints compared at once (limits the memory)
 
     Output:
     * weights: weights of the kpoints in the irreducible brillouin zone
@@ -30,44 +38,34 @@ def expand_kpoints(car_kpoints,sym_car,rlat,atol=1.e-6):
     * symmetry_indexes: indexes of the symmetries used to generate the kpoints
     * kpoints_full: kpoints in the full brillouin zone
     """
-
-    #check if the kpoints were already exapnded
-    kpoints_indexes  = []
-    kpoints_full     = []
-    symmetry_indexes = []
-
-    #kpoints in the full brillouin zone organized per index
-    kpoints_full_i = {}
-
-    #expand using symmetries
-    for nk,k in enumerate(car_kpoints):
-        #if the index in not in the dicitonary add a list
-        if nk not in kpoints_full_i:
-            kpoints_full_i[nk] = []
-
-        for ns,sym in enumerate(sym_car):
-
-            new_k = np.dot(sym,k)
-            #check if the point is inside the bounds
-            k_red = car_red([new_k],rlat)[0]
-            k_red[np.abs(k_red) < atol] = 0. # Set to zero values < atol to avoid mistakes
-            k_bz = (k_red+atol)%1
-
-            #if the vector is not in the list of this index add it
-            if not vec_in_list(k_bz,kpoints_full_i[nk],atol=atol):
-                kpoints_full_i[nk].append(k_bz)
-                kpoints_full.append(new_k)
-                kpoints_indexes.append(nk)
-                symmetry_indexes.append(ns)
-                continue
+    car_kpoints = np.array(car_kpoints).reshape(-1,3)
+    sym_car = np.array(sym_car).reshape(-1,3,3)
+    nk, nsym = len(car_kpoints), len(sym_car)
+
+    # all the images S.k (nk,nsym,3) and their reduced coordinates
+    new_k = np.ascontiguousarray((car_kpoints[None,:,:] @ sym_car.transpose(0,2,1)).transpose(1,0,2))
+    k_red = np.linalg.solve(np.array(rlat).T,new_k.reshape(-1,3).T).T.reshape(nk,nsym,3)
+    k_red[np.abs(k_red) < atol] = 0. # Set to zero values < atol to avoid mistakes
+    k_bz = (k_red+atol)%1
+
+    # an image is new if it is not close (same criterion as vec_in_list) to a previously kept one of its star
+    keep = np.zeros((nk,nsym),dtype=bool)
+    for k0 in range(0,nk,chunk):
+        kb = k_bz[k0:k0+chunk]
+        kp = keep[k0:k0+chunk]
+        for ns in range(nsym):
+            close = np.all(np.abs(kb[:,ns,None,:]-kb[:,:ns,:]) <= atol+atol*np.abs(kb[:,:ns,:]),axis=-1)
+            kp[:,ns] = ~np.any(close & kp[:,:ns],axis=1)
+
+    kpoints_indexes, symmetry_indexes = np.nonzero(keep)
+    kpoints_full = new_k[kpoints_indexes,symmetry_indexes]
 
     #calculate the weights of each of the kpoints in the irreducible brillouin zone
     nkpoints_full = len(kpoints_full)
     weights = np.zeros([nkpoints_full])
-    for nk in kpoints_full_i:
-        weights[nk] = float(len(kpoints_full_i[nk]))/nkpoints_full
+    weights[:nk] = np.sum(keep,axis=1)/nkpoints_full
 
-    return np.array(weights), np.array(kpoints_indexes), np.array(symmetry_indexes), np.array(kpoints_full)
+    return weights, kpoints_indexes, symmetry_indexes, kpoints_full
 
 def get_path_car(kpts_path_car,path):
     """
@@ -75,73 +73,74 @@ def get_path_car(kpts_path_car,path):
     """
     return Path( [[kpts_path_car[i],path.klabels[i]] for i in range(len(kpts_path_car))],path.intervals )
 
-def get_path(car_kpoints,rlat,sym_car,path,debug=False):
+def get_path(car_kpoints,rlat,sym_car,path,debug=False,eps=1e-5):
     """
     Obtain a list kpoints along a specific high-symmetry path
 
+    For each segment, the collinearity test is done at once on all the kpoints
+    and their periodic images. Points of different images that coincide
+    (to 4 decimal places) are counted once, as in the original sequential
+    search.
+
     Input:
     * car_kpoints: kpoints in Cartesian coordinates [IBZ/Full BZ]
     * rlat: reciprocal lattice vectors
     * sym_car [symmetry ops. if car_kpoints given in IBZ] | None [if car_kpoints in fulll BZ]
     * path: Path object with the high-symmetry path (points in reduced coordinates)
+    * eps: tolerance of the collinearity test (same as isbetween)
 
     Output:
     * bands_kpoints: kpoints Cartesian coordinates along the path
     * bands_indexes: indexes of the kpoints in the path
     * path_car: path in Cartesian coordinates
     """
-
     # expand if symmetries are provided, otherwise the kpoints are considered already expanded
-    if sym_car is None: nks = list(range(len(car_kpoints)))
+    if sym_car is None: nks = np.arange(len(car_kpoints))
     else:               _, nks, _, car_kpoints = expand_kpoints(car_kpoints,sym_car,rlat)
+    car_kpoints = np.array(car_kpoints,dtype=float).reshape(-1,3)
+    nks = np.asarray(nks)
 
     # high-symmetry points in cartesian coordinates
     kpts_path_car = red_car(path.kpoints, rlat)
-    # Path object in cartesian coordinates (for later plotting)
-    path_car = get_path_car(kpts_path_car,path)
+
+    # repetitions of the brillouin zone (in-plane only)
+    shifts = red_car([np.array([x,y,z]) for x,y,z in product(range(-1,2),range(-1,2),range(1))],rlat)
 
     #find the points along the high symmetry lines
     bands_kpoints = []
     bands_indexes = []
-
-    #for all the paths
-    for k in range(len(path.kpoints)-1):
-
-        # store here all the points in the path
-        # key:   has the coordinates of the kpoint rounded to 4 decimal places
-        # value: index of the kpoint
-        #        distance to the starting kpoint
-        #        the kpoint cordinate
-        kpoints_in_path = {}
-
-        start_kpt = kpts_path_car[k]   #start point of the path
-        end_kpt   = kpts_path_car[k+1] #end point of the path
-
-        #generate repetitions of the brillouin zone
-        for x,y,z in product(list(range(-1,2)),list(range(-1,2)),list(range(1))):
-
-            #shift the brillouin zone
-            shift = red_car([np.array([x,y,z])],rlat)[0]
-
-            #iterate over all the kpoints
-            for index, kpt in zip(nks,car_kpoints):
-
-                kpt_shift = kpt+shift #shift the kpoint
-
-                #if the point is collinear we add it
-                if isbetween(start_kpt,end_kpt,kpt_shift):
-                    key = tuple([round(kpt,4) for kpt in kpt_shift])
-                    value = [ index, np.linalg.norm(start_kpt-kpt_shift), kpt_shift ]
-                    kpoints_in_path[key] = value
+    for start_kpt, end_kpt in zip(kpts_path_car[:-1],kpts_path_car[1:]):
+        length = np.linalg.norm(end_kpt-start_kpt)
+
+        # all the (image,kpoint) pairs collinear with and between start_kpt and end_kpt
+        kpts, kidx = [], []
+        for shift in shifts:
+            kpt_shift = car_kpoints+shift
+            dist_start = np.linalg.norm(kpt_shift-start_kpt,axis=1)
+            dist_end   = np.linalg.norm(kpt_shift-end_kpt,axis=1)
+            between = np.abs(dist_start+dist_end-length) <= eps
+            kpts.append(kpt_shift[between])
+            kidx.append(nks[between])
+        kpts, kidx = np.concatenate(kpts), np.concatenate(kidx)
+        if not len(kpts): continue
+
+        # points with the same coordinates (rounded to 4 decimal places) are counted once:
+        # the last one found is kept, at the position of the first one
+        keys = np.round(kpts,4)+0.
+        _, first, inverse = np.unique(keys,axis=0,return_index=True,return_inverse=True)
+        last = np.zeros(len(first),dtype=int)
+        np.maximum.at(last,inverse.ravel(),np.arange(len(kpts)))
 
         #sort the points acoording to distance to the start of the path
-        kpoints_in_path = sorted(list(kpoints_in_path.values()),key=lambda i: i[1])
+        order = last[np.lexsort((first,np.linalg.norm(kpts[last]-start_kpt,axis=1)))]
+        bands_kpoints.extend(kpts[order])
+        bands_indexes.extend(kidx[order].tolist())
 
-        #for all the kpoints in the path
-        for index, disp, kpt in kpoints_in_path:
-            bands_kpoints.append( kpt )
-            bands_indexes.append( index )
-            if debug: print(("%12.8lf "*3)%tuple(kpt), index)
+    if debug:
+        for kpt, index in zip(bands_kpoints,bands_indexes): print(("%12.8lf "*3)%tuple(kpt), index)
+
+    # Path object in cartesian coordinates (for later plotting)
+    path_car = get_path_car(red_car(path.kpoints, rlat),path)
 
     return bands_kpoints, bands_indexes, path_car
 
@@ -166,20 +165,96 @@ def make_kpositive(klist, tol=1e-6):
     return (kpos + tol) % 1  # Apply small tolerance correction
 
 
-def build_ktree(kpts):
+def kpoint_grid_size(red_kpoints,atol=1.e-6):
+    """
+    Dimensions of the regular grid of red_kpoints (reduced coordinates): along each
+    direction, the largest coordinate (in [0,1)) divided by the smallest non-zero one, plus one.
+    """
+    red_kpoints = np.array(red_kpoints,dtype=float).reshape(-1,3)
+    abs_k = np.abs(red_kpoints)
+    small_q = np.min(np.where(abs_k > atol, abs_k, 1e4), axis=0, initial=1e4)
+    n_grid = np.rint(make_kpositive(red_kpoints)/small_q)+1
+    return np.max(n_grid, axis=0, initial=0).astype(int)
+
+
+class KMeshIndex:
     """
-    Builds a k-d tree for efficient k-point searching.
+    Exact index of the kpoints of a regular (Gamma-centred) Monkhorst-Pack mesh.
+
+    The index of a kpoint is the linearisation of round(k*N) mod N, so a
+    lookup is a few integer operations instead of a tree search. It has the
+    same query interface as the periodic KDTree returned by build_ktree for
+    irregular sets, so find_kpt works with both.
+
+    Attributes:
+        k_grid (np.ndarray): Number of kpoints along each reciprocal lattice vector.
+        index (np.ndarray): Position in the original list of each mesh point (linearised).
+    """
+    def __init__(self, k_grid, index):
+        self.k_grid = np.array(k_grid, dtype=int)
+        self.index = index
+        self.n = len(index)
+
+    @classmethod
+    def from_kpoints(cls, kpts, k_grid=None, tol=1e-5):
+        """
+        Build the index of kpts (crystal coordinates), or return None if they are
+        not a full regular mesh (of size k_grid if given) with every point once.
+        """
+        kpts = np.array(kpts, dtype=float).reshape(-1, 3)
+        if not len(kpts): return None
+        kpos = kpts - np.floor(kpts)
+        if k_grid is None:
+            # number of distinct coordinates along each direction
+            k_grid = [len(np.unique(np.round(kpos[:, i], 6) % 1)) for i in range(3)]
+        k_grid = np.array(k_grid, dtype=int)
+        if np.prod(k_grid) != len(kpts): return None
+        kn = kpos * k_grid[None, :]
+        nint = np.rint(kn)
+        if np.max(np.abs(kn - nint) / k_grid[None, :]) >= tol: return None
+        lin = cls._linearise(nint.astype(np.int64), k_grid)
+        index = np.full(len(kpts), -1, dtype=np.intp)
+        index[lin] = np.arange(len(kpts))
+        if np.any(index < 0): return None # some points repeated (and others missing)
+        return cls(k_grid, index)
+
+    @staticmethod
+    def _linearise(nint, k_grid):
+        nint = nint % k_grid
+        return (nint[..., 0] * k_grid[1] + nint[..., 1]) * k_grid[2] + nint[..., 2]
+
+    def query(self, kpt_search, workers=1):
+        """
+        Same as KDTree.query (k=1, periodic box of size 1): returns the distance
+        (in crystal coordinates) to the closest mesh point and its index.
+        """
+        kpt_search = np.asarray(kpt_search, dtype=float)
+        kn = kpt_search * self.k_grid
+        nint = np.rint(kn)
+        dist = np.linalg.norm((kn - nint) / self.k_grid, axis=-1)
+        return dist, self.index[self._linearise(nint.astype(np.int64), self.k_grid)]
+
+
+def build_ktree(kpts, k_grid=None):
+    """
+    Builds an index for efficient k-point searching.
 
     Parameters
     ----------
     kpts : np.ndarray
         Array of k-points in crystal coordinates.
+    k_grid : array-like, optional
+        Dimensions of the mesh (e.g. YamboLatticeDB.k_grid). If not given, it is
+        detected from kpts.
 
     Returns
     -------
-    KDTree
-        A KDTree structure for fast nearest-neighbor lookup of k-points.
+    KMeshIndex or KDTree
+        A KMeshIndex (exact integer lookup) if kpts form a full regular mesh,
+        otherwise a KDTree structure for fast nearest-neighbor lookup of k-points.
     """
+    mesh = KMeshIndex.from_kpoints(kpts, k_grid)
+    if mesh is not None: return mesh
     tree = make_kpositive(kpts)  # Normalize k-points to [0,1)
     return KDTree(tree, boxsize=[1, 1, 1])  # Construct KDTree with periodic boundaries
 
@@ -190,8 +265,8 @@ def find_kpt(tree, kpt_search, tol=1e-5):
 
     Parameters
     ----------
-    tree : KDTree
-        Pre-built KDTree of k-points.
+    tree : KMeshIndex or KDTree
+        Index of k-points returned by build_ktree.
     kpt_search : np.ndarray
         The k-point to search for in crystal coordinates.
     tol : float, optional
@@ -207,7 +282,8 @@ def find_kpt(tree, kpt_search, tol=1e-5):
     SystemExit
         If the k-point is not found within the specified tolerance.
     """
-    kpt_search = make_kpositive(kpt_search)  # Normalize k-point
+    if not isinstance(tree, KMeshIndex):
+        kpt_search = make_kpositive(kpt_search)  # Normalize k-point
     dist, idx = tree.query(kpt_search, workers=1)  # Perform nearest-neighbor search
     assert np.max(dist) < tol, "Kpoint not found"
     return idx  # Return the index of the found k-point
@@ -225,46 +301,63 @@ def regular_grid(nk1,nk2,nk3):
     ])
     return xkg.T # shape [nk,3]
 
-def find_kpatch(kpts, kcentre, kdist, lat_vecs):
+def find_kpatch(kpts, kcentre, kdist, lat_vecs, chunk=256):
     """
     find set of kpoints around the kcentre with in kdist
 
+    The kpoints (folded to [0,1)) are stored in a KDTree in Cartesian coordinates
+    and a ball query is done around the periodic images of the centre, so the
+    memory does not grow with nk x (number of images).
+
     Parameters
     ----------
     kpts : kpoints in crystal coordinates (nk,3)
-    kcentre : kpoint centre in crystal coordinates (3)
+    kcentre : kpoint centre in crystal coordinates (3), or several centres (ncentres,3)
     kdist : distance around kcentre to be considered in atomic units 
             i.e 1/bohr.
     lat_vecs: lattice vectors. ith lattice vector is ai = a[:,i]
+    chunk : number of centres queried at once (only for several centres)
     Returns
     -------
-    int array
+    int array (list of int arrays if several centres are given)
         Indices of kpoints in kpts array which satify the given condition i.e
         | k - kcentre + G0| <= kdist, where G0 is reciprocal lattice vector to bring to BZ
+        (G0 in [-3,3]^3)
     """
     #
     blat = 2*np.pi*np.linalg.inv(lat_vecs)
-    kdiff = kpts-kcentre[None,:]
-    kdiff = kdiff-np.floor(kdiff)
+    kpts = np.asarray(kpts, dtype=float).reshape(-1, 3)
+    kcentre = np.asarray(kcentre, dtype=float)
+    single = kcentre.ndim == 1
+    kcentre = kcentre.reshape(-1, 3)
     #
+    tree = KDTree((kpts - np.floor(kpts)) @ blat)
     tmp_arr = np.array([-3, -2, -1, 0, 1, 2, 3])
-    nG0 = len(tmp_arr)
-    G0 = np.zeros((nG0,nG0,nG0,3))
-    G0[...,0], G0[...,1], G0[...,2] = np.meshgrid(tmp_arr, tmp_arr,
-                                                  tmp_arr, indexing='ij')
-    G0 = G0.reshape(-1,3)
-    kdiff = kdiff[:,None,:]-G0[None,:,:]
-    kdiff = kdiff.reshape(-1,3)@blat
-    kdiff = np.linalg.norm(kdiff,axis=-1).reshape(len(kpts),-1)
-    kdiff = np.min(kdiff,axis=-1)
-    return np.where(kdiff <= kdist)[0]
-
-    
+    G0 = np.stack(np.meshgrid(tmp_arr, tmp_arr, tmp_arr, indexing='ij'), axis=-1).reshape(-1, 3)
+    G0_car = G0 @ blat
+    # only the images of the centres closer than kdist to the unit cell are queried
+    cell_centre = 0.5*np.sum(blat, axis=0)
+    cell_radius = np.max(np.linalg.norm(np.array(list(product([0, 1], repeat=3))) @ blat - cell_centre, axis=-1))
+    #
+    patches = []
+    for c0 in range(0, len(kcentre), chunk):
+        centres = (kcentre[c0:c0+chunk] - np.floor(kcentre[c0:c0+chunk])) @ blat
+        images = centres[:, None, :] + G0_car[None, :, :]
+        near = np.linalg.norm(images - cell_centre, axis=-1) <= kdist + cell_radius
+        for ic in range(len(centres)):
+            found = tree.query_ball_point(images[ic, near[ic]], kdist)
+            patches.append(np.unique(np.concatenate([np.zeros(0, dtype=int)] + [np.asarray(f, dtype=int) for f in found])))
+    return patches[0] if single else patches
+
+
 def generate_kpoint_grid(nk1,nk2,nk3,sym_and_trev,IBZ=True,eps=1.0e-5):
     """
     Generation of gamma-centered Monkhorst-Pack grid.
 
     This function is the python porting of the Quantum ESPRESSO subroutine `kpoint_grid` found in PW/kpoint_grid.f90
+    The equivalent points are found for the whole grid at once: all the symmetries are applied
+    to all the points (kpoint_grid_images) and each class is represented by its smallest index
+    (equivalence_classes), which gives the same result as the sequential search of QE.
 
     Input:
         nk1, nk2, nk3 -> grid dimensions
@@ -297,54 +390,73 @@ def generate_kpoint_grid(nk1,nk2,nk3,sym_and_trev,IBZ=True,eps=1.0e-5):
     xkg = regular_grid(nk1,nk2,nk3) # [nk,3]
 
     if IBZ:
-        # Now we have to start checking for equivalent points:
-        for ik in range(Nk):
-            # Check if this k-point has already been found equivalent to another
-            # Do not consider points previously found equivalent to another
-            # Check both k and -k
-            if equiv[ik] == ik:
-                for i_s in range(Nsym):
-                    # Apply symmetry operations
-                    xkr = np.dot(sym_red[i_s,:,:], xkg[ik,:])
-                    # Bring back in 1st BZ
-                    xkr -= np.round(xkr)
-                    # Take opposite if symmetry is composed with TR
-                    if is_sym_trev[i_s]: xkr = -xkr
-
-                    # Check if in the list
-                    xx, yy, zz = xkr*[nk1,nk2,nk3]
-                    in_the_list = all( abs(v-round(v)) <= eps for v in [xx, yy, zz])
-
-                    if in_the_list:
-                        i,j,k = [(round(xkr[dim]*nki + 2*nki) % nki) + 1 for dim, nki in enumerate([nk1, nk2, nk3])]
-                        n = (k-1) + (j-1)*nk3 + (i-1)*nk2*nk3
-
-                        if n > ik and equiv[n] == n:
-                            equiv[n] = ik
-                            wkk[ik] += 1.0
-                        elif equiv[n] != ik or n < ik:
-                            raise ValueError("Error in the checking algorithm")
-
-                    # Time reversal symmetry check
-                    if is_trev:
-                        xx, yy, zz = -xkr*[nk1,nk2,nk3]
-                        in_the_list = all(abs(v - round(v)) <= eps for v in [xx, yy, zz])
-
-                        if in_the_list:
-                            i, j, k = [(round(-xkr[dim]*nki + 2*nki) % nki) + 1 for dim, nki in enumerate([nk1, nk2, nk3])]
-                            n = (k-1) + (j-1)*nk3 + (i-1)*nk2*nk3
-
-                            if n > ik and equiv[n] == n:
-                                equiv[n] = ik
-                                wkk[ik] += 1.0
-                            elif equiv[n] != ik or n < ik:
-                                raise ValueError("Error in the checking algorithm")
+        # Grid index of all the images of all the kpoints (-1 if the image is not on the grid)
+        images = kpoint_grid_images(xkg,[nk1,nk2,nk3],sym_red,is_trev,is_sym_trev,eps=eps)
+        # Equivalence classes: connected components of the graph k -> S.k,
+        # each one represented by its smallest index (as the sequential QE search)
+        equiv, wkk = equivalence_classes(images)
 
     # Filter unique k-points
     unique_kpoints = (equiv == np.arange(Nk))
     # Bring back unique points into first BZ
     xk = xkg[unique_kpoints,:] - np.round(xkg[unique_kpoints,:])
     wk = wkk[unique_kpoints] / np.sum(wkk[unique_kpoints])  # Normalize weights
-    nks = len(xk[0])
+    nks = len(xk)
 
     return nks, xk, wk
+
+def kpoint_grid_images(xkg,nk,sym_red,is_trev,is_sym_trev,eps=1.0e-5,chunk=65536):
+    """
+    Images of the points of a regular grid under all the symmetries (and time reversal).
+
+    Input:
+        xkg         -> grid points in crystal coordinates [Nk,3] (see regular_grid)
+        nk          -> grid dimensions [nk1,nk2,nk3]
+        sym_red, is_trev, is_sym_trev -> see generate_kpoint_grid
+        eps         -> numerical error for points on the grid
+
+    Output:
+        images -> [Nk,Nops] grid index of S.k (-1 if S.k is not on the grid),
+                  Nops = Nsym (x2 with time reversal)
+    """
+    nk = np.array(nk)
+    sign = np.where(np.array(is_sym_trev,dtype=bool),-1.,1.)[:,None,None]
+    images = []
+    for k0 in range(0,len(xkg),chunk):
+        # Apply symmetry operations and bring back in 1st BZ
+        xkr = np.einsum('sij,kj->ski',sym_red,xkg[k0:k0+chunk])
+        xkr -= np.round(xkr)
+        # Take opposite if symmetry is composed with TR
+        xkr *= sign
+        if is_trev: xkr = np.concatenate([xkr,-xkr])
+        # Check if in the list and get the index
+        xx = xkr*nk
+        in_the_list = np.all(np.abs(xx-np.round(xx)) <= eps,axis=-1)
+        ijk = np.round(xx+2*nk).astype(int) % nk
+        n = ijk[...,2] + ijk[...,1]*nk[2] + ijk[...,0]*nk[1]*nk[2]
+        images.append(np.where(in_the_list,n,-1).T)
+    return np.concatenate(images) if len(images) else np.zeros((0,len(sym_red)*(1+int(is_trev))),dtype=int)
+
+def equivalence_classes(images):
+    """
+    Group points connected by the images (e.g. from kpoint_grid_images).
+
+    Output:
+        equiv -> [Nk] smallest index of the class of each point
+        wkk   -> [Nk] number of points in the class (for representatives, 1 otherwise)
+    """
+    Nk = len(images)
+    rows, cols = np.nonzero(images >= 0)
+    graph = coo_matrix((np.ones(len(rows)),(rows,images[rows,cols])),shape=(Nk,Nk))
+    ncomp, labels = connected_components(graph,directed=True,connection='weak')
+    rep = np.full(ncomp,Nk)
+    np.minimum.at(rep,labels,np.arange(Nk))
+    equiv = rep[labels]
+    wkk = np.ones(Nk)
+    wkk[rep] = np.bincount(labels,minlength=ncomp)
+    # The representative must reach all its class directly (symmetries form a group)
+    direct = np.sort(images[rep],axis=1)
+    ndirect = np.sum((direct[:,1:] != direct[:,:-1]) & (direct[:,1:] >= 0),axis=1) + (direct[:,0] >= 0)
+    if np.any(ndirect != wkk[rep]):
+        raise ValueError("Error in the checking algorithm")
+    return equiv, wkk
@@ -53,13 +53,22 @@ def red_car(red,lat):
     """
     Convert reduced coordinates to cartesian
     """
-    return np.array([coord[0]*lat[0]+coord[1]*lat[1]+coord[2]*lat[2] for coord in red])
+    red = np.asarray(red)
+    if not red.size: return np.array([])
+    lat = np.asarray(lat)
+    red = red.reshape(-1,3)
+    return red[:,0,None]*lat[0]+red[:,1,None]*lat[1]+red[:,2,None]*lat[2]
 
 def car_red(car,lat):
     """
     Convert cartesian coordinates to reduced
     """
-    return np.array([np.linalg.solve(np.array(lat).T,coord) for coord in car])
+    car = np.asarray(car)
+    if not car.size: return np.array([])
+    car = car.reshape(-1,3)
+    # one 3x3 system per vector (same result as solving them one by one)
+    lat_t = np.array(lat).T
+    return np.linalg.solve(np.broadcast_to(lat_t,(len(car),3,3)),car[...,None])[...,0]
 
 def vol_lat(lat):
     """
@@ -79,6 +88,40 @@ def rec_lat(lat):
     b3 = np.cross(a1,a2)/v
     return np.array([b1,b2,b3])
 
+def readonly(array):
+    """
+    Return a read-only view of array (used for cached properties, so that
+    callers cannot modify the cached value by mistake); array itself stays writeable
+    """
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+def sym_car_red(sym_car,lat):
+    """
+    Convert cartesian transformations to reduced (integer) transformations
+    """
+    lat = np.array(lat)
+    return np.round(lat @ np.transpose(sym_car,(0,2,1)) @ np.linalg.inv(lat)).astype(int)
+
+def sym_red_rec(sym_red):
+    """
+    Convert reduced transformations to reduced reciprocal transformations
+    """
+    return np.rint(np.transpose(np.linalg.inv(sym_red),(0,2,1))).astype(int)
+
+def sym_car_rec(sym_car):
+    """
+    Convert cartesian transformations to reciprocal transformations
+    """
+    return np.transpose(np.linalg.inv(sym_car),(0,2,1)).astype(float)
+
+def time_rev_symmetries(nsym,time_rev):
+    """
+    Flag the symmetries that include time reversal (the second half of the list if time_rev)
+    """
+    return np.arange(nsym) >= nsym/(time_rev+1)
+
 def replicate_red_kmesh(kmesh,repx=list(range(1)),repy=list(range(1)),repz=list(range(1))):
     """
     copy a kmesh in the tree directions
@@ -0,0 +1,116 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+import unittest
+import os
+import numpy as np
+from itertools import product
+from qepy.lattice import Path
+from yambopy.lattice import car_red, red_car, vec_in_list, isbetween
+from scipy.spatial import KDTree
+from yambopy.kpoints import expand_kpoints, generate_kpoint_grid, get_path
+from yambopy.kpoints import build_ktree, find_kpt, make_kpositive, regular_grid, KMeshIndex, find_kpatch
+from yambopy.dbs.latticedb import YamboLatticeDB
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','data','refs')
+
+def expand_kpoints_loop(car_kpoints,sym_car,rlat,atol=1.e-6):
+    """ reference expansion: one (kpoint,symmetry) pair at a time """
+    kpoints_full_i = {nk:[] for nk in range(len(car_kpoints))}
+    kpoints_indexes, symmetry_indexes, kpoints_full = [], [], []
+    for nk,k in enumerate(car_kpoints):
+        for ns,sym in enumerate(sym_car):
+            new_k = np.dot(sym,k)
+            k_red = car_red([new_k],rlat)[0]
+            k_red[np.abs(k_red) < atol] = 0.
+            k_bz = (k_red+atol)%1
+            if not vec_in_list(k_bz,kpoints_full_i[nk],atol=atol):
+                kpoints_full_i[nk].append(k_bz)
+                kpoints_full.append(new_k)
+                kpoints_indexes.append(nk)
+                symmetry_indexes.append(ns)
+    weights = np.zeros(len(kpoints_full))
+    for nk in kpoints_full_i: weights[nk] = len(kpoints_full_i[nk])/len(kpoints_full)
+    return weights, np.array(kpoints_indexes), np.array(symmetry_indexes), np.array(kpoints_full)
+
+class TestKpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.lattices = [YamboLatticeDB.from_db_file(os.path.join(refs_path,name,'SAVE','ns.db1'),Expand=False)
+                         for name in ['bse','gw_conv','ip']]
+
+    def test_expand_kpoints(self):
+        """ vectorised expansion against the (kpoint,symmetry) loop """
+        for ydb in self.lattices:
+            ref = expand_kpoints_loop(ydb.car_kpoints,ydb.sym_car,ydb.rlat)
+            res = expand_kpoints(ydb.car_kpoints,ydb.sym_car,ydb.rlat,chunk=3)
+            for a,b in zip(ref[:3],res[:3]): np.testing.assert_array_equal(a,b)
+            # same images up to the round-off of the input precision (float32 for some databases)
+            np.testing.assert_allclose(res[3],ref[3],atol=10*np.finfo(ydb.car_kpoints.dtype).resolution*np.max(np.abs(ref[3])))
+
+    def test_generate_kpoint_grid(self):
+        """ IBZ of a regular grid: the stars of the IBZ points give back the grid with the same weights """
+        for ydb in self.lattices:
+            for nk in [[4,4,4],[6,6,6]]:
+                nks, xk, wk = generate_kpoint_grid(*nk,(ydb.sym_red,ydb.time_rev,ydb.time_rev_list))
+                self.assertEqual(nks,len(xk))
+                self.assertAlmostEqual(np.sum(wk),1)
+                weights, kidx, sidx, kfull = expand_kpoints(red_car(xk,ydb.rlat),ydb.sym_car,ydb.rlat)
+                self.assertEqual(len(kfull),np.prod(nk))
+                np.testing.assert_allclose(weights[:nks],wk)
+                kred = car_red(kfull,ydb.rlat)*nk
+                np.testing.assert_allclose(kred,np.round(kred),atol=1e-6)
+                self.assertEqual(len(np.unique(np.round(kred).astype(int)%nk,axis=0)),np.prod(nk))
+
+    def test_get_path(self):
+        """ kpoints along the path are collinear and sorted """
+        path = Path([ [[0.0,0.0,0.0],'G'],
+                      [[0.5,0.0,0.0],'M'],
+                      [[1/3,1/3,0.0],'K'],
+                      [[0.0,0.0,0.0],'G']], [20,20,20])
+        ydb = self.lattices[2]
+        _, _, _, car_kpoints = expand_kpoints(ydb.car_kpoints,ydb.sym_car,ydb.rlat)
+        bands_kpoints, bands_indexes, path_car = get_path(car_kpoints,ydb.rlat,None,path)
+        self.assertEqual(len(bands_kpoints),15)
+        kpts_path = red_car(path.kpoints,ydb.rlat)
+        for kpt, index in zip(bands_kpoints,bands_indexes):
+            self.assertTrue(any(isbetween(a,b,kpt) for a,b in zip(kpts_path[:-1],kpts_path[1:])))
+            kred = car_red([kpt-car_kpoints[index]],ydb.rlat)[0]
+            np.testing.assert_allclose(kred,np.round(kred),atol=1e-5)
+
+    def test_find_kpt(self):
+        """ regular meshes use the exact index and give the same result as the periodic KDTree """
+        rng = np.random.default_rng(0)
+        for ydb in self.lattices:
+            kpts = car_red(expand_kpoints(ydb.car_kpoints,ydb.sym_car,ydb.rlat)[3],ydb.rlat)
+            ktree = build_ktree(kpts)
+            self.assertIsInstance(ktree,KMeshIndex)
+            kdtree = KDTree(make_kpositive(kpts),boxsize=[1,1,1])
+            ksearch = kpts[rng.permutation(len(kpts))] + rng.integers(-2,3,size=kpts.shape)
+            np.testing.assert_array_equal(find_kpt(ktree,ksearch),find_kpt(kdtree,ksearch))
+            self.assertEqual(find_kpt(ktree,ksearch[0]),find_kpt(kdtree,ksearch[0]))
+        self.assertIsInstance(build_ktree(regular_grid(4,4,1)[1:]),KDTree)
+        self.assertRaises(AssertionError,find_kpt,build_ktree(regular_grid(4,4,1)),[0.1,0,0])
+
+    def test_find_kpatch(self):
+        """ ball query around the periodic images of the centres against all the distances """
+        rng = np.random.default_rng(1)
+        lat_vecs = np.array([[1.,-0.5,0.],[0.,np.sqrt(3)/2,0.],[0.,0.,4.]]).T*6
+        blat = 2*np.pi*np.linalg.inv(lat_vecs)
+        kpts = regular_grid(12,12,2) + rng.integers(-2,3,size=(288,3))
+        centres = rng.random((5,3))*4-2
+        G0 = np.array(list(product(range(-3,4),repeat=3)))
+        patches = find_kpatch(kpts,centres,0.3,lat_vecs,chunk=2)
+        self.assertEqual(len(patches),len(centres))
+        for kcentre, patch in zip(centres,patches):
+            kdiff = (kpts-kcentre)%1
+            dist = np.min(np.linalg.norm((kdiff[:,None,:]-G0[None,:,:])@blat,axis=-1),axis=-1)
+            np.testing.assert_array_equal(patch,np.where(dist <= 0.3)[0])
+            np.testing.assert_array_equal(find_kpatch(kpts,kcentre,0.3,lat_vecs),patch)
+
+if __name__ == '__main__':
+    unittest.main()
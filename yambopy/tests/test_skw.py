@@ -0,0 +1,95 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of the yambopy project
+#
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from yambopy.tools.skw import SkwInterpolator, SkwModel, get_skw_model
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.kpoints import generate_kpoint_grid
+
+refs_path = os.path.join(os.path.dirname(__file__),'..','data','refs')
+
+def symmetric_bands(kpts,ops,rvecs):
+    """ bands made of star functions of the lattice vectors rvecs (one band per vector) """
+    return np.array([np.mean(np.cos(2*np.pi*np.einsum('sij,kj,i->ks',ops,kpts,r)),axis=1) for r in rvecs]).T[None]
+
+class TestSkw(unittest.TestCase):
+
+    def setUp(self):
+        lat = YamboLatticeDB.from_db_file(os.path.join(refs_path,'bse','SAVE','ns.db1'),Expand=False)
+        self.symrel = np.array([sym for sym,trev in zip(lat.sym_rec_red,lat.time_rev_list) if not trev])
+        self.ops = np.transpose(self.symrel,(0,2,1)) # the star functions are invariant under k -> S^T k
+        self.cell = (lat.lat,lat.red_atomic_positions,lat.atomic_numbers)
+        self.time_rev = lat.time_rev
+        _, kpts, _ = generate_kpoint_grid(6,6,6,(self.ops,self.time_rev,np.zeros(len(self.ops),dtype=bool)))
+        self.kpts = np.array(kpts)
+        self.rvecs = [[1,0,0],[1,1,0]]
+
+    def test_fit(self):
+        """ the fit reproduces bands made of star functions, and its star functions match the definition """
+        eigens = symmetric_bands(self.kpts,self.ops,self.rvecs)
+        skw = SkwInterpolator(5,self.kpts,eigens,0,0,self.cell,self.symrel,self.time_rev,verbose=0)
+        self.assertLess(skw.mae,1e-6)
+
+        kpt = self.kpts[3]
+        skr = np.mean([np.exp(2j*np.pi*np.dot(skw.rpts,omat.T@kpt)) for omat in skw.ptg_symrel],axis=0)
+        np.testing.assert_allclose(skw.skr[3],skr,atol=1e-12)
+
+        knew = np.random.default_rng(0).random((20,3))
+        np.testing.assert_allclose(skw.interp_kpts(knew).eigens,symmetric_bands(knew,self.ops,self.rvecs),atol=1e-2)
+        np.testing.assert_allclose(skw.interp_kpts(self.kpts).eigens,eigens,atol=1e-8)
+
+    def test_derivatives(self):
+        """ chunked energies, gradients and hessians match eval_sk and finite differences """
+        eigens = symmetric_bands(self.kpts,self.ops,self.rvecs)
+        skw = SkwInterpolator(5,self.kpts,eigens,0,0,self.cell,self.symrel,self.time_rev,verbose=0)
+        knew = np.random.default_rng(1).random((10,3))
+        res = skw.interp_kpts(knew,dk1=True,dk2=True,chunk=3)
+
+        der1, der2 = np.empty((skw.nband,3)), np.empty((skw.nband,3,3))
+        for ik,kpt in enumerate(knew):
+            np.testing.assert_allclose(skw.eval_sk(0,kpt,der1=der1,der2=der2),res.eigens[0,ik],atol=1e-12)
+            np.testing.assert_allclose(der1,res.dedk[0,ik],atol=1e-12)
+            np.testing.assert_allclose(der2,res.dedk2[0,ik],atol=1e-12)
+        np.testing.assert_allclose(res.dedk2,np.swapaxes(res.dedk2,-1,-2),atol=1e-12)
+
+        # derivatives are given wrt 2pi k (reduced coordinates)
+        h = 1e-5
+        for ii,step in enumerate(h*np.eye(3)):
+            plus, minus = skw.interp_kpts(knew+step,dk1=True), skw.interp_kpts(knew-step,dk1=True)
+            np.testing.assert_allclose((plus.eigens-minus.eigens)/(4*np.pi*h),res.dedk[...,ii],atol=1e-6)
+            np.testing.assert_allclose((plus.dedk-minus.dedk)/(4*np.pi*h),res.dedk2[...,ii],atol=1e-6)
+
+    def test_model(self):
+        """ one cached and serialisable model fits several quantities as the separate interpolators """
+        eigens = symmetric_bands(self.kpts,self.ops,self.rvecs)
+        weights = symmetric_bands(self.kpts,self.ops,[[2,1,0]])**2
+        knew = np.random.default_rng(2).random((15,3))
+        ref_eigens = SkwInterpolator(5,self.kpts,eigens,0,0,self.cell,self.symrel,self.time_rev,verbose=0).interp_kpts(knew).eigens
+        ref_weights = SkwInterpolator(5,self.kpts,weights,0,0,self.cell,self.symrel,self.time_rev,verbose=0).interp_kpts(knew).eigens
+
+        tmp_path = tempfile.mkdtemp()
+        try:
+            model = get_skw_model(5,self.kpts,self.cell,self.symrel,self.time_rev,cache_dir=tmp_path,verbose=0)
+            self.assertIs(get_skw_model(5,self.kpts,self.cell,self.symrel,self.time_rev,verbose=0),model)
+            self.assertIsNot(get_skw_model(6,self.kpts,self.cell,self.symrel,self.time_rev,verbose=0),model)
+            new_eigens, new_weights = model.interpolate(knew,eigens,weights)
+            np.testing.assert_allclose(new_eigens,ref_eigens,atol=1e-10)
+            np.testing.assert_allclose(new_weights,ref_weights,atol=1e-10)
+
+            stored = SkwModel.from_file(os.path.join(tmp_path,model.key+'.skw.npz'),verbose=0)
+            self.assertEqual(stored.key,model.key)
+            np.testing.assert_array_equal(stored.rpts,model.rpts)
+            np.testing.assert_allclose(stored.fit(eigens).interp_kpts(knew).eigens,ref_eigens,atol=1e-10)
+        finally:
+            shutil.rmtree(tmp_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+#
+# Authors: MN
+#
+import os
+import hashlib
+import tempfile
+import numpy as np
+import h5py
+
+## version of the cache layout. Bump it to invalidate all the existing entries.
+DMAT_CACHE_VERSION = 1
+
+## hashes of ns.db1 files, keyed by (path, size, mtime) to avoid re-reading them
+_db1_hashes = {}
+
+def file_hash(fname, blocksize=1 << 20):
+    """ sha256 of the content of a file (memoized on path, size and modification time) """
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    memo_key = (fname, stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _db1_hashes:
+        sha = hashlib.sha256()
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                sha.update(block)
+        _db1_hashes[memo_key] = sha.hexdigest()
+    return _db1_hashes[memo_key]
+
+def _hash_array(sha, arr, decimals=8):
+    """ add a float array to a hash, rounded so that -0.0 and round-off noise do not change the key """
+    arr = np.round(np.asarray(arr, dtype=np.float64), decimals) + 0.0
+    sha.update(str(arr.shape).encode())
+    sha.update(np.ascontiguousarray(arr).tobytes())
+
+def dmat_cache_key(ns_db1, bands_range, symm_mat, frac_vec, time_rev, dtype=None):
+    """
+    Content-addressed key of a set of representation matrices.
+
+    :: ns_db1 -> path of the ns.db1 file of the SAVE (its content is hashed)
+    :: bands_range -> [min_bnd, max_bnd) bands used to build the Dmats
+    :: symm_mat, frac_vec, time_rev -> symmetries passed to YamboWFDB.Dmat
+    :: dtype -> (optional) dtype of the Dmats
+    """
+    sha = hashlib.sha256()
+    sha.update(b'Dmat-v%d' % DMAT_CACHE_VERSION)
+    sha.update(file_hash(ns_db1).encode())
+    sha.update(np.asarray(bands_range, dtype=np.int64).tobytes())
+    _hash_array(sha, symm_mat)
+    _hash_array(sha, frac_vec)
+    sha.update(b'trev%d' % int(bool(time_rev)))
+    if dtype is not None: sha.update(np.dtype(dtype).str.encode())
+    return sha.hexdigest()
+
+def cache_root():
+    """ $YAMBOPY_CACHE_DIR, or ~/.cache/yambopy """
+    return os.environ.get('YAMBOPY_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'yambopy'))
+
+def default_cache_dir():
+    """ $YAMBOPY_CACHE_DIR/dmats, or ~/.cache/yambopy/dmats """
+    return os.path.join(cache_root(), 'dmats')
+
+class DmatCache:
+    """
+    Persistent, content-addressed cache of representation matrices (Dmats).
+
+    Each entry is a compressed and chunked hdf5 file named after the key
+    returned by dmat_cache_key, i.e. a hash of ns.db1, the band range, the
+    symmetry matrices, the fractional translations and time reversal.
+    A cache built for a different SAVE, band range or symmetry set can
+    therefore never be returned.
+
+    Entries are evicted in least-recently-used order (the modification time
+    of a file is updated at each hit) when the total size exceeds max_size.
+
+    Example usage:
+
+        cache = DmatCache('dmat_cache', max_size=2*1024**3)
+        Dmats = wfdb.Dmat(cache=cache)    ## computed and stored
+        Dmats = wfdb.Dmat(cache=cache)    ## read from dmat_cache/
+        cache.clear()
+
+    Attributes:
+        cache_dir (str): Folder containing the entries. Default: default_cache_dir().
+        max_size (int): Maximum total size in bytes of the entries. None means no limit.
+        compression (str): hdf5 compression filter. Default 'gzip'.
+        compression_opts (int): Compression level. Default 4.
+    """
+    suffix = '.dmat.h5'
+
+    def __init__(self, cache_dir=None, max_size=None, compression='gzip', compression_opts=4):
+        if cache_dir is None: cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.compression = compression
+        self.compression_opts = compression_opts
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        """ File of the entry key """
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(key))
+
+    def load(self, key):
+        """ Return the Dmats stored for key (and mark them as recently used) or None """
+        fname = self.path(key)
+        try:
+            with h5py.File(fname, 'r') as f:
+                dmat = f['Dmat'][...]
+        except (OSError, KeyError):
+            return None
+        try: os.utime(fname)
+        except OSError: pass
+        return dmat
+
+    def save(self, key, dmat, **metadata):
+        """
+        Store dmat (nsym, nk, nspin, nbands, nbands) for key. Additional metadata
+        (e.g. the symmetries) are stored as attributes/datasets for inspection.
+        The file is written to a temporary name and then moved, so concurrent
+        readers never see a partial entry.
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            with h5py.File(tmp_name, 'w') as f:
+                chunks = None
+                if dmat.ndim > 2 and dmat.size:
+                    ## one chunk = one symmetry and a block of k-points (~1 MB)
+                    nk_chunk = max(1, min(dmat.shape[1], (1 << 20) // (dmat[0, 0].nbytes or 1)))
+                    chunks = (1, nk_chunk) + dmat.shape[2:]
+                f.create_dataset('Dmat', data=dmat, chunks=chunks, shuffle=True,
+                                 compression=self.compression, compression_opts=self.compression_opts)
+                f.attrs['version'] = DMAT_CACHE_VERSION
+                for name, value in metadata.items():
+                    value = np.asarray(value)
+                    if value.ndim == 0: f.attrs[name] = value
+                    else: f.create_dataset(name, data=value)
+            os.replace(tmp_name, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_name): os.remove(tmp_name)
+            raise
+        self.evict()
+
+    def entries(self):
+        """ List of (key, size in bytes, last access time) sorted from the least recently used """
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(self.suffix): continue
+            try: stat = os.stat(os.path.join(self.cache_dir, fname))
+            except OSError: continue
+            entries.append((fname[:-len(self.suffix)], stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """ Total size in bytes of the entries """
+        return sum(entry[1] for entry in self.entries())
+
+    def evict(self, max_size=None):
+        """ Remove the least recently used entries until the total size is <= max_size (default self.max_size) """
+        if max_size is None: max_size = self.max_size
+        if max_size is None: return
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        for key, size, atime in entries:
+            if total <= max_size: break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key):
+        """ Remove the entry key (if present) """
+        try: os.remove(self.path(key))
+        except FileNotFoundError: pass
+
+    def clear(self):
+        """ Remove all the entries """
+        for key, size, atime in self.entries(): self.remove(key)
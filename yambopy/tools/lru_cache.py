@@ -0,0 +1,81 @@
+#
+# Authors: MN
+#
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Small bounded least-recently-used cache.
+
+    Used to keep a limited number of large objects (e.g. wavefunctions
+    at a given k-point) in memory while the rest is read on demand.
+
+    Example usage:
+
+        cache = LRUCache(maxsize=4)
+        wfc = cache.get(ik)
+        if wfc is None:
+            wfc = read_wfc(ik)
+            cache.put(ik, wfc)
+
+    Attributes:
+        maxsize (int): Maximum number of stored entries. maxsize <= 0 disables the cache.
+        max_bytes (int): Maximum total size (nbytes) of the stored arrays. None: no limit.
+        nbytes (int): Total size of the stored arrays.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+    """
+    def __init__(self, maxsize=16, max_bytes=None):
+        self.maxsize = int(maxsize)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """ Return the value stored for key (marking it as recently used) or default """
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Store value for key, evicting the least recently used entries if needed.
+        A value larger than max_bytes is not stored.
+        """
+        if self.maxsize <= 0: return
+        size = getattr(value, 'nbytes', 0)
+        if self.max_bytes is not None and size > self.max_bytes: return
+        if key in self._data: self.nbytes -= getattr(self._data[key], 'nbytes', 0)
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self.nbytes += size
+        while len(self._data) > self.maxsize or \
+              (self.max_bytes is not None and self.nbytes > self.max_bytes):
+            self.nbytes -= getattr(self._data.popitem(last=False)[1], 'nbytes', 0)
+
+    @property
+    def hit_rate(self):
+        """ Fraction of successful lookups (0 if there were none) """
+        nlookups = self.hits + self.misses
+        return self.hits/nlookups if nlookups else 0.
+
+    def stats(self):
+        """ Dictionary with the number of hits, misses, the hit rate, the number of entries and their size """
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate,
+                    entries=len(self._data), maxsize=self.maxsize, nbytes=self.nbytes)
+
+    def clear(self):
+        """ Remove all the entries (statistics are kept) """
+        self._data.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
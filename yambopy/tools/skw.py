@@ -20,7 +20,11 @@ For the theoretical background see :cite:`Euwema1969,Koelling1986,Pickett1988,Ma
 """
 #This class is imported from the abipy package: https://github.com/abinit/abipy
 
-import itertools
+import os
+import hashlib
+import tempfile
+import warnings
+import zipfile
 import numpy as np
 import scipy
 import time
@@ -28,63 +32,289 @@ from collections import deque
 from monty.termcolor import cprint
 from monty.collections import dict2namedtuple
 from yambopy.tools.citations import citation
+from yambopy.tools.lru_cache import LRUCache
 
-class SkwInterpolator():
+## version of the layout of the files written by SkwModel.save
+SKW_MODEL_CACHE_VERSION = 1
+
+class SkwStarFunctions():
     """
-    This object implements the Shankland-Koelling-Wood Fourier interpolation scheme.
-    It can be used to interpolate functions in k-space with the periodicity of the
-    reciprocal lattice and satisfying F(k) = F(Sk) for each rotation S
-    belonging to the point group of the crystal. For readability reason,
-    the names of the variables are chosen assuming we are interpolating electronic eigenvalues
-    but the same object can be used to interpolate other quantities. Just set the first dimension to 1.
+    Star functions of the SKW interpolation scheme, shared by SkwModel and SkwInterpolator.
+    Subclasses define rmet, ptg_symrel, ptg_nsym, rpts, nr and verbose.
+    """
+
+    def get_stark(self, kpt) -> np.ndarray:
+        """
+        Return the star function for k-point `kpt`.
+
+        Args:
+            kpt: K-point in reduced coordinates.
+
+        Return:
+            complex array of shape [self.nr]
+        """
+        return self.get_stark_kpts(np.reshape(kpt, (1, 3)))[0]
+
+    def _star_operations(self):
+        """
+        Return the S R vectors [nops, 3, nr] entering the star functions and a flag
+        telling whether the point group contains the inversion. In this case the operations
+        come in pairs (S, -S) and only one operation per pair is returned.
+        """
+        srpts = np.matmul(self.ptg_symrel, self.rpts.T)
+        minus = np.all(self.ptg_symrel[:, None] == -self.ptg_symrel[None, :], axis=(2, 3))
+        has_inversion = np.all(np.any(minus, axis=1))
+        if has_inversion:
+            srpts = srpts[np.argmax(minus, axis=1) > np.arange(self.ptg_nsym)]
+        return srpts, has_inversion
+
+    def get_stark_derivs(self, kpts, dk1=False, dk2=False):
+        """
+        Return the star functions for a block of k-points and, optionally,
+        their 1st and 2nd order derivatives wrt k.
+
+        With phi = 2pi k.(S R):
+            S_R(k)           =  1/nsym sum_S exp(i phi)
+            dS_R/dk_i        =  i/nsym sum_S exp(i phi) (S R)_i
+            d2S_R/dk_i dk_j  = -1/nsym sum_S exp(i phi) (S R)_i (S R)_j
+        (derivatives are given in the same units as get_stark_dk1).
+
+        All the arrays are built at once, so the block should be small enough
+        to fit in memory (see interp_kpts for a chunked driver).
+
+        Args:
+            kpts: K-points in reduced coordinates [nk, 3].
+            dk1 (bool): True if the 1st order derivatives are wanted.
+            dk2 (bool): True if the 2nd order derivatives are wanted.
+
+        Return:
+            skr[nk, nr], skr_dk1[nk, 3, nr], skr_dk2[nk, 3, 3, nr] (complex)
+            The derivatives are set to None if not computed.
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        nk = len(kpts)
+        srpts, has_inversion = self._star_operations()
+
+        # With the inversion, the pairs (S, -S) give real star functions,
+        # gradients and Hessians: the imaginary parts are not accumulated.
+        skr_re = np.zeros((nk, self.nr))
+        dk1_re = np.zeros((nk, 3, self.nr)) if dk1 else None
+        dk2_re = np.zeros((nk, 3, 3, self.nr)) if dk2 else None
+        if not has_inversion:
+            skr_im = np.zeros_like(skr_re)
+            dk1_im = np.zeros_like(dk1_re) if dk1 else None
+            dk2_im = np.zeros_like(dk2_re) if dk2 else None
+
+        for sr in srpts:
+            phase = np.matmul(kpts, 2.0 * np.pi * sr)
+            cos, sin = np.cos(phase), np.sin(phase)
+            skr_re += cos
+            if not has_inversion: skr_im += sin
+            if dk1:
+                dk1_re -= sin[:, None, :] * sr
+                if not has_inversion: dk1_im += cos[:, None, :] * sr
+            if dk2:
+                srsr = sr[:, None, :] * sr[None, :, :]
+                dk2_re -= cos[:, None, None, :] * srsr
+                if not has_inversion: dk2_im -= sin[:, None, None, :] * srsr
+
+        def _finalize(re, im):
+            if re is None: return None
+            out = np.empty(re.shape, dtype=complex)
+            out.real = re
+            out.imag = 0.0 if has_inversion else im
+            return out / len(srpts)
+
+        if has_inversion: skr_im = dk1_im = dk2_im = None
+        return _finalize(skr_re, skr_im), _finalize(dk1_re, dk1_im), _finalize(dk2_re, dk2_im)
+
+    def get_stark_kpts(self, kpts, chunk=512) -> np.ndarray:
+        """
+        Return the star functions for several k-points at once.
+
+        S_R(k) = 1/nsym sum_S exp(i 2pi k.(S R)), computed as one [nk, 3] x [3, nr]
+        product per point-group operation.
+
+        Args:
+            kpts: K-points in reduced coordinates [nk, 3].
+            chunk: Number of k-points processed at once (limits the size of the temporaries).
+
+        Return:
+            complex array of shape [nk, self.nr]
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        skr = np.empty((len(kpts), self.nr), dtype=complex)
+        for k0 in range(0, len(kpts), chunk):
+            skr[k0:k0+chunk] = self.get_stark_derivs(kpts[k0:k0+chunk])[0]
+
+        return skr
+
+    def get_stark_dk1(self, kpt) -> np.ndarray:
+        """
+        Compute the 1st-order derivative of the star function wrt k
+
+        Args:
+            kpt: K-point in reduced coordinates.
+
+        Return:
+            complex array [3, self.nr]  with the derivative of the
+            star function wrt k in reduced coordinates.
+        """
+        return self.get_stark_derivs(np.reshape(kpt, (1, 3)), dk1=True)[1][0]
+
+    def get_stark_dk2(self, kpt) -> np.ndarray:
+        """
+        Compute the 2nd-order derivatives of the star function wrt k.
+
+        Args:
+            kpt: K-point in reduced coordinates.
+
+        Return:
+            Complex numpy array of shape [3, 3, self.nr] with the 2nd-order derivatives
+            of the star function wrt k in reduced coordinates.
+        """
+        return self.get_stark_derivs(np.reshape(kpt, (1, 3)), dk2=True)[2][0]
+
+    #def find_stationary_points(self, kmesh, bstart=None, bstop=None, is_shift=None)
+    #    k = self.get_sampling(kmesh, is_shift)
+    #    if bstart is None: bstart = self.nelect // 2 - 1
+    #    if bstop is None: bstop = self.nelect // 2
+    #    nb = bstop - bstart + 1
+    #    results = []
+    #    for ik_ibz, kpt in enumerate(k.ibz):
+    #        vk_b = self.eval_dk1(kpt, bstart, bstop)
+    #        bands = []
+    #        for ib, v in enumerate(vk_b):
+    #            if v < atol: bands.append(ib + bstart)
+    #        if bands:
+    #            #results.append()
+    #            for band in bands:
+    #                d2k_b = self.eval_dk2(kpt, band)
+
+    #    return results
+
+    def _find_rstar_gen(self, nrwant, rmax) -> tuple:
+        """
+        Find all lattice points generating the stars inside the supercell defined by `rmax`
+
+        Args:
+            nrwant: Number of star-functions required.
+            rmax: numpy array with the maximum number of cells along the 3 reduced directions.
+
+        Returns:
+            tuple: (rpts, r2vals, ok)
+        """
+        msize = (2 * rmax + 1).prod()
+        if self.verbose: print("rmax", rmax, "msize:", msize)
+
+        start = time.time()
+        # All the points of the supercell (same order as a nested loop over x, y, z) and their norm.
+        rtmp = np.stack(np.meshgrid(*[np.arange(-r, r + 1) for r in rmax], indexing='ij'), axis=-1).reshape(-1, 3)
+        r2tmp = np.einsum('ri,ij,rj->r', rtmp, self.rmet, rtmp)
+
+        if self.verbose: print("gen points", time.time() - start)
+
+        start = time.time()
+        # Sort r2tmp and rtmp
+        iperm = np.argsort(r2tmp)
+        r2tmp = r2tmp[iperm]
+        rtmp = rtmp[iperm]
+
+        # Find shells: a new shell starts when |R|^2 changes (relative tolerance 1e-8).
+        new_shell = np.zeros(msize, dtype=bool)
+        new_shell[1:] = np.abs(r2tmp[1:] - r2tmp[:-1]) > r2tmp[1:] * 1e-8
+        r2sh = np.cumsum(new_shell)   # Correspondence between R and shell index.
+        shlim = np.concatenate(([0], np.flatnonzero(new_shell), [msize]))  # For each shell, the index of the initial R-point.
+        nsh = len(shlim) - 1
+        if self.verbose:
+            print("nshells", nsh)
+            print("shells", time.time() - start)
+
+        # Find R-points generating the stars: the first point of each orbit of the point group
+        # in each shell. The orbit of R is labelled by the smallest index of its images S R.
+        start = time.time()
+        rbig = int(np.abs(self.ptg_symrel).sum(axis=2).max()) * int(rmax.max())
+        nbox = 2 * rbig + 1
+        orbit = np.empty(msize, dtype=np.int64)
+        for r0 in range(0, msize, 8192):
+            srpts = np.matmul(rtmp[r0:r0+8192], np.transpose(self.ptg_symrel, (0, 2, 1))) + rbig
+            orbit[r0:r0+8192] = np.min((srpts[..., 0] * nbox + srpts[..., 1]) * nbox + srpts[..., 2], axis=0)
+        _, first = np.unique(r2sh * nbox**3 + orbit, return_index=True)
+        is_gen = np.zeros(msize, dtype=bool)
+        is_gen[first] = True
+
+        # The generators of a shell are stored in a set (same order of the stars as the sequential search)
+        rgen = deque()
+        gen_sh = r2sh[is_gen]
+        gen_pts = rtmp[is_gen]
+        gen_lim = np.searchsorted(gen_sh, np.arange(nsh + 1))
+        for ish in range(nsh):
+            ss, ee = gen_lim[ish], gen_lim[ish + 1]
+            if ss + 1 == ee:
+                rgen.append(gen_pts[ss])
+                continue
+            rgen.extend(set(map(tuple, gen_pts[ss:ee])))
+        if self.verbose: print("stars", time.time() - start)
+
+        start = time.time()
+        rgen = np.array(rgen, dtype=int)
+        nstars = len(rgen)
+
+        # Store rpts and compute ||R||**2.
+        ok = nstars >= nrwant
+        nr = min(nstars, nrwant)
+        rpts = rgen[:nr].copy()
+        r2vals = np.einsum('ri,ij,rj->r', rpts, self.rmet, rpts)
+
+        if self.verbose:
+            print("r2max ", rpts[nr-1])
+            print("end ", time.time() - start)
+            if self.verbose > 10:
+                print("nstars:", nstars)
+                for r, r2 in zip(rpts, r2vals):
+                    print(r, r2)
+
+        return rpts, r2vals, ok
+
+class SkwModel(SkwStarFunctions):
+    """
+    The part of the SKW interpolation that depends only on the lattice, the symmetries,
+    the ab-initio k-points and lpratio: the R-stars, the star functions at the k-points
+    and the LU factorisation of the H(k,k') matrix (eq. 10 of PRB 38 2721).
+
+    Any number of band-like quantities (energies, weights, spin projections, ...)
+    given on the same k-points can then be fitted with one triangular solve each,
+    or all together in one call.
+
+    Example usage:
+
+        model = get_skw_model(lpratio, kpts, cell, symrel, has_timrev)
+        energies, weights = model.interpolate(kpath, eigens, weights)
+        skw = model.fit(eigens)    ## SkwInterpolator
+        model.save('skw_model.npz')
+        model = SkwModel.from_file('skw_model.npz')
     """
 
     @citation("SKW interpolation from AbiPy: X. Gonze et al., Comput. Phys. Commun. 248, 107042 (2020)")
-    def __init__(self, lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev,
-                 filter_params=None, verbose=1):
+    def __init__(self, lpratio, kpts, cell, symrel, has_timrev, verbose=1):
         """
         Args:
-            lpratio: Ratio between the number of star-functions and the number of ab-initio k-points.
-                5-10 should be OK in many systems, larger values may be required for accurate derivatives.
-            kpts: numpy array with the [nkpt, 3] ab-initio k-points in reduced coordinates.
-            eigens: numpy array with the ab-initio energies. shape [nsppol, nkpt, nband].
-            fermie: Fermi energy in eV.
-            nelect: Number of electrons in the unit cell
-            cell: (lattice, positions, numbers)
-                lattice: numpy array with direct lattice vectors along the rows.
-                positions: atomic positions in reduced coordinates.
-                numbers: Atomic number for each atom in positions.
-            symrel: [nsym, 3, 3] numpy array with the (ferromagnetic) symmetry operations of the direct lattice
-                in reduced coordinates. anti-ferromagnetic symmetries (if any) should be removed by the caller.
-            has_timrev: True is time-reversal can be used.
-            filter_params: List with parameters used to filter high-frequency components (Eq 9 of PhysRevB.61.1639)
-                First item gives rcut, second item sigma. Ignored if None.
-            verbose: Verbosity level.
+            lpratio, kpts, cell, symrel, has_timrev, verbose: see SkwInterpolator.
         """
         self.verbose = verbose
         self.cell = cell
-        lattice = self.cell[0]
-        self.original_fermie = fermie
-        self.interpolated_fermie = self.original_fermie
-        self.nelect = nelect
         self.has_timrev = has_timrev
-
-        # iscomplexobj is used to handle lifetimes.
-        eigens = np.atleast_3d(eigens)
-        self.iscomplexobj = np.iscomplexobj(eigens)
-        self.nsppol, self.nkpt, self.nband = eigens.shape
-
-        if len(kpts) != self.nkpt:
-            raise ValueError("Second dimension of eigens should be %d but got array of shape: %s" %
-                (len(kpts), eigens.shape))
+        self.kpts = np.array(np.reshape(kpts, (-1, 3)), dtype=float)
+        self.nkpt = len(self.kpts)
         if self.nkpt == 1:
             raise ValueError("Interpolation algorithm requires nkpt > 1")
 
-        rprimd = np.asarray(lattice).T
+        rprimd = np.asarray(cell[0]).T
         self.rmet = np.matmul(rprimd.T, rprimd)
 
         # Find point group operations.
         symrel = np.reshape(symrel, (-1, 3, 3))
+        self.key = skw_model_key(lpratio, self.kpts, cell[0], symrel, has_timrev)
         self.ptg_symrel, self.ptg_symrec, has_inversion = extract_point_group(symrel, has_timrev)
         self.ptg_nsym = len(self.ptg_symrel)
         if self.verbose:
@@ -101,7 +331,7 @@ class SkwInterpolator():
         #rmax = int((1.0 + (lpratio * self.nkpt) / 2.0) ** (1/3.)) * np.ones(3, dtype=int)
 
         while True:
-            self.rpts, r2vals, ok = self._find_rstar_gen(nrwant, rmax)
+            self.rpts, self.r2vals, ok = self._find_rstar_gen(nrwant, rmax)
             self.nr = len(self.rpts)
             if ok:
                 break
@@ -112,63 +342,257 @@ class SkwInterpolator():
 
         print("Using:", self.nr, "star-functions. nstars/nk:", self.nr / self.nkpt)
 
-        # Compute (inverse) roughness function.
-        c1, c2 = 0.25, 0.25
-        r2min = r2vals[1]
-        inv_rhor = 1.0 / ((1.0 - c1 * r2vals / r2min) ** 2 + c2 * (r2vals / r2min) ** 3)
-
         # Construct star functions for the ab-initio k-points.
-        nsppol, nband, nkpt, nr = self.nsppol, self.nband, self.nkpt, self.nr
-        self.skr = np.empty((nkpt, nr), dtype=complex)
-        for ik, kpt in enumerate(kpts):
-            self.skr[ik] = self.get_stark(kpt)
-
-        # Build H(k,k') matrix (Hermitian)
-        hmat = np.empty((nkpt-1, nkpt-1), dtype=complex)
-        for jk in range(nkpt-1):
-            v_jkr = self.skr[jk, 1:] - self.skr[nkpt-1, 1:]
-            #for ik in range(jk + 1):
-            for ik in range(nkpt-1):
-                v_ikr = inv_rhor[1:] * (self.skr[ik, 1:] - self.skr[nkpt-1, 1:])
-                hmat[ik, jk] = np.vdot(v_jkr, v_ikr)
-                if ik == jk: hmat[ik, jk] = hmat[ik, jk].real
+        self.skr = self.get_stark_kpts(self.kpts)
 
-        # Solving system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)..."
-        de_kbs = np.empty((nkpt-1, nband, nsppol), dtype=complex)
-        for spin in range(nsppol):
-            for ib in range(nband):
-                de_kbs[:, ib, spin] = eigens[spin, 0:nkpt-1, ib] - eigens[spin, nkpt-1, ib]
+        # Build H(k,k') matrix (Hermitian): H = (S diag(1/rho)) S^H
+        # with S[k,R] = skr[k,R] - skr[nkpt-1,R] for R != 0.
+        nkpt = self.nkpt
+        dskr = self.skr[:nkpt-1, 1:] - self.skr[nkpt-1, 1:]
+        hmat = np.matmul(dskr * self.inv_rhor[1:], dskr.conj().T)
+        hmat[np.diag_indices(nkpt-1)] = hmat.diagonal().real
 
-        # Solve all bands and spins at once
         # FIXME: Portability problem with scipy 0.19 in which linalg.solve wraps the expert drivers
         # http://scipy.github.io/devdocs/release.0.19.0.html#foreign-function-interface-improvements
         if scipy.__version__ == "0.19.0":
-            import warnings
             warnings.warn("linalg.solve in scipy 0.19.0 gives weird results. Use at your own risk!!!")
 
-        try:
-            lmb_kbs = scipy.linalg.solve(hmat, np.reshape(de_kbs, (-1, nband * nsppol)))
-            #lmb_kbs = scipy.linalg.solve(hmat, np.reshape(de_kbs, (-1, nband * nsppol)),
-                    #sym_pos=True, lower=False, overwrite_a=True, overwrite_b=True, check_finite=False)
-                    #sym_pos=False, lower=False, overwrite_a=False, overwrite_b=False, check_finite=True)
-
-        except scipy.linalg.LinAlgError as exc:
+        # LU factorisation, reused for all the right-hand sides.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", scipy.linalg.LinAlgWarning)
+            self.hmat_lu, self.hmat_piv = scipy.linalg.lu_factor(hmat)
+        if not np.all(self.hmat_lu.diagonal()):
             print("Cannot solve system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)")
             print("This usually happens when there are symmetrical k-points passed to the interpolator.")
-            raise exc
+            raise scipy.linalg.LinAlgError("Singular matrix")
+
+    @property
+    def inv_rhor(self):
+        """ Inverse roughness function 1/rho(R) """
+        c1, c2 = 0.25, 0.25
+        r2min = self.r2vals[1]
+        return 1.0 / ((1.0 - c1 * self.r2vals / r2min) ** 2 + c2 * (self.r2vals / r2min) ** 3)
+
+    def get_coefs(self, eigens) -> np.ndarray:
+        """
+        Coefficients of the star functions fitting eigens[nsppol, nkpt, nband]
+        (all spins and bands solved at once).
+
+        Return:
+            complex array of shape [nsppol, nband, self.nr]
+        """
+        eigens = np.atleast_3d(eigens)
+        nsppol, nkpt, nband = eigens.shape
+        if nkpt != self.nkpt:
+            raise ValueError("Second dimension of eigens should be %d but got array of shape: %s" %
+                (self.nkpt, eigens.shape))
+
+        # Solving system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)..."
+        de_kbs = np.transpose(eigens[:, :nkpt-1, :] - eigens[:, nkpt-1:, :], (1, 2, 0)).astype(complex)
+        lmb_kbs = scipy.linalg.lu_solve((self.hmat_lu, self.hmat_piv), np.reshape(de_kbs, (nkpt-1, -1)))
+
+        # Compute coefficients: coefs[R] = 1/rho[R] S^H lambda, coefs[0] from the last k-point.
+        dskr = self.skr[:nkpt-1, 1:] - self.skr[nkpt-1, 1:]
+        coefs = np.empty((nsppol, nband, self.nr), dtype=complex)
+        coefs[:, :, 1:] = np.transpose(np.matmul(dskr.conj().T, lmb_kbs).reshape(self.nr-1, nband, nsppol), (2, 1, 0)) * self.inv_rhor[1:]
+        coefs[:, :, 0] = eigens[:, nkpt-1, :] - np.matmul(coefs[:, :, 1:], self.skr[nkpt-1, 1:])
+        return coefs
+
+    def fit(self, eigens, fermie=0, nelect=0, filter_params=None, verbose=None):
+        """
+        Return the SkwInterpolator of eigens[nsppol, nkpt, nband] built on this model.
+        """
+        if verbose is None: verbose = self.verbose
+        return SkwInterpolator(self.lpratio, self.kpts, eigens, fermie, nelect, self.cell, self.ptg_symrel,
+                               self.has_timrev, filter_params=filter_params, verbose=verbose, model=self)
 
-        lmb_kbs = np.reshape(lmb_kbs, (-1, nband, nsppol))
+    def interpolate(self, kfrac_coords, *quantities, fermie=0, nelect=0, filter_params=None):
+        """
+        Fit and interpolate several quantities [nsppol, nkpt, nband_i] on the k-points kfrac_coords.
+        The quantities are stacked along the band axis, so that they are solved and
+        evaluated together.
 
-        # Compute coefficients.
-        self.coefs = np.empty((nsppol, nband, nr), dtype=complex)
-        for spin in range(nsppol):
-            for ib in range(nband):
-                for ir in range(1, nr):
-                    self.coefs[spin, ib, ir] = inv_rhor[ir] \
-                        * np.vdot(self.skr[:nkpt-1, ir] - self.skr[nkpt-1, ir], lmb_kbs[:nkpt-1, ib, spin])
+        Return:
+            list with the interpolated quantities [nsppol, len(kfrac_coords), nband_i]
+        """
+        quantities = [np.atleast_3d(quantity) for quantity in quantities]
+        if len(set(quantity.shape[0] for quantity in quantities)) != 1:
+            raise ValueError("All the quantities must have the same number of spins")
+        skw = self.fit(np.concatenate(quantities, axis=2), fermie, nelect, filter_params)
+        eigens = skw.interp_kpts(kfrac_coords).eigens
+        bounds = np.cumsum([quantity.shape[2] for quantity in quantities])[:-1]
+        return [values if np.iscomplexobj(quantity) else values.real
+                for values, quantity in zip(np.split(eigens, bounds, axis=2), quantities)]
+
+    def save(self, filename):
+        """
+        Write the model to filename (npz). The file is written to a temporary name
+        and then moved, so concurrent readers never see a partial file.
+        """
+        lattice, positions, numbers = self.cell
+        data = dict(version    = SKW_MODEL_CACHE_VERSION,
+                    key        = self.key,
+                    lpratio    = self.lpratio,
+                    kpts       = self.kpts,
+                    lattice    = np.asarray(lattice),
+                    positions  = np.asarray(positions),
+                    numbers    = np.asarray(numbers),
+                    has_timrev = bool(self.has_timrev),
+                    ptg_symrel = self.ptg_symrel,
+                    ptg_symrec = self.ptg_symrec,
+                    rpts       = self.rpts,
+                    r2vals     = self.r2vals,
+                    skr        = self.skr,
+                    hmat_lu    = self.hmat_lu,
+                    hmat_piv   = self.hmat_piv)
+        dirname = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_name = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f: np.savez(f, **data)
+            os.replace(tmp_name, filename)
+        except BaseException:
+            if os.path.exists(tmp_name): os.remove(tmp_name)
+            raise
+
+    @classmethod
+    def from_file(cls, filename, verbose=1):
+        """
+        Read a model written by save. Returns None if the file does not exist,
+        is not readable or is from another version. The caller should compare
+        model.key with skw_model_key of the expected arguments.
+        """
+        try:
+            with np.load(filename) as data: data = dict(data)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+        if int(data.get('version', -1)) != SKW_MODEL_CACHE_VERSION: return None
+
+        model = cls.__new__(cls)
+        model.verbose = verbose
+        model.key = str(data['key'])
+        model.cell = (data['lattice'], data['positions'], data['numbers'])
+        model.has_timrev = bool(data['has_timrev'])
+        model.lpratio = int(data['lpratio'])
+        model.kpts = data['kpts']
+        model.nkpt = len(model.kpts)
+        rprimd = np.asarray(data['lattice']).T
+        model.rmet = np.matmul(rprimd.T, rprimd)
+        model.ptg_symrel = data['ptg_symrel']
+        model.ptg_symrec = data['ptg_symrec']
+        model.ptg_nsym = len(model.ptg_symrel)
+        for name in ['rpts', 'r2vals', 'skr', 'hmat_lu', 'hmat_piv']:
+            setattr(model, name, data[name])
+        model.nr = len(model.rpts)
+        return model
+
+
+def skw_model_key(lpratio, kpts, lattice, symrel, has_timrev, decimals=8):
+    """ sha256 of the arguments defining a SkwModel (float arrays are rounded to decimals) """
+    sha = hashlib.sha256()
+    sha.update(b'SkwModel-v%d-lpratio%d-trev%d' % (SKW_MODEL_CACHE_VERSION, int(lpratio), int(bool(has_timrev))))
+    for arr in [kpts, lattice, symrel]:
+        arr = np.round(np.asarray(arr, dtype=np.float64), decimals) + 0.0
+        sha.update(str(arr.shape).encode())
+        sha.update(np.ascontiguousarray(arr).tobytes())
+    return sha.hexdigest()
+
+## SkwModels built in this session, keyed by skw_model_key
+_skw_models = LRUCache(maxsize=8)
+
+def get_skw_model(lpratio, kpts, cell, symrel, has_timrev, cache_dir=None, verbose=1):
+    """
+    Return the SkwModel for (lattice, symmetries, k-points, lpratio), reusing the one
+    built earlier in this session if available.
 
-                self.coefs[spin, ib, 0] = eigens[spin, nkpt-1, ib] \
-                    - np.dot(self.coefs[spin, ib, 1:nr], self.skr[nkpt-1, 1:nr])
+    :: cache_dir -> (optional) folder where the models are also stored as <key>.skw.npz
+                    and looked up, to reuse them across sessions
+    """
+    key = skw_model_key(lpratio, np.reshape(kpts, (-1, 3)), cell[0], np.reshape(symrel, (-1, 3, 3)), has_timrev)
+    model = _skw_models.get(key)
+    if model is not None: return model
+
+    filename = None if cache_dir is None else os.path.join(cache_dir, key + '.skw.npz')
+    if filename is not None: model = SkwModel.from_file(filename, verbose=verbose)
+    if model is None or model.key != key:
+        model = SkwModel(lpratio, kpts, cell, symrel, has_timrev, verbose=verbose)
+        if filename is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                model.save(filename)
+            except OSError:
+                pass
+    _skw_models.put(key, model)
+    return model
+
+
+class SkwInterpolator(SkwStarFunctions):
+    """
+    This object implements the Shankland-Koelling-Wood Fourier interpolation scheme.
+    It can be used to interpolate functions in k-space with the periodicity of the
+    reciprocal lattice and satisfying F(k) = F(Sk) for each rotation S
+    belonging to the point group of the crystal. For readability reason,
+    the names of the variables are chosen assuming we are interpolating electronic eigenvalues
+    but the same object can be used to interpolate other quantities. Just set the first dimension to 1.
+    """
+
+    @citation("SKW interpolation from AbiPy: X. Gonze et al., Comput. Phys. Commun. 248, 107042 (2020)")
+    def __init__(self, lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev,
+                 filter_params=None, verbose=1, model=None):
+        """
+        Args:
+            lpratio: Ratio between the number of star-functions and the number of ab-initio k-points.
+                5-10 should be OK in many systems, larger values may be required for accurate derivatives.
+            kpts: numpy array with the [nkpt, 3] ab-initio k-points in reduced coordinates.
+            eigens: numpy array with the ab-initio energies. shape [nsppol, nkpt, nband].
+            fermie: Fermi energy in eV.
+            nelect: Number of electrons in the unit cell
+            cell: (lattice, positions, numbers)
+                lattice: numpy array with direct lattice vectors along the rows.
+                positions: atomic positions in reduced coordinates.
+                numbers: Atomic number for each atom in positions.
+            symrel: [nsym, 3, 3] numpy array with the (ferromagnetic) symmetry operations of the direct lattice
+                in reduced coordinates. anti-ferromagnetic symmetries (if any) should be removed by the caller.
+            has_timrev: True is time-reversal can be used.
+            filter_params: List with parameters used to filter high-frequency components (Eq 9 of PhysRevB.61.1639)
+                First item gives rcut, second item sigma. Ignored if None.
+            verbose: Verbosity level.
+            model: SkwModel built for the same lattice, symmetries, kpts and lpratio (see get_skw_model).
+                If given, only the right-hand side is solved. Built here if None.
+        """
+        self.verbose = verbose
+        self.cell = cell
+        self.original_fermie = fermie
+        self.interpolated_fermie = self.original_fermie
+        self.nelect = nelect
+        self.has_timrev = has_timrev
+
+        # iscomplexobj is used to handle lifetimes.
+        eigens = np.atleast_3d(eigens)
+        self.iscomplexobj = np.iscomplexobj(eigens)
+        self.nsppol, self.nkpt, self.nband = eigens.shape
+
+        if len(kpts) != self.nkpt:
+            raise ValueError("Second dimension of eigens should be %d but got array of shape: %s" %
+                (len(kpts), eigens.shape))
+        if self.nkpt == 1:
+            raise ValueError("Interpolation algorithm requires nkpt > 1")
+
+        # Stars, star functions and factorised H(k,k') matrix (shared by all the quantities on these k-points).
+        if model is None:
+            model = SkwModel(lpratio, kpts, cell, symrel, has_timrev, verbose=verbose)
+        elif model.nkpt != self.nkpt:
+            raise ValueError("The model was built for %d k-points but got %d" % (model.nkpt, self.nkpt))
+        self.model = model
+        self.rmet = model.rmet
+        self.ptg_symrel, self.ptg_symrec, self.ptg_nsym = model.ptg_symrel, model.ptg_symrec, model.ptg_nsym
+        self.lpratio = model.lpratio
+        self.rpts, self.nr = model.rpts, model.nr
+        self.skr = model.skr
+        r2vals = model.r2vals
+
+        # Coefficients of the star functions (all bands and spins solved at once)
+        nsppol, nband, nkpt, nr = self.nsppol, self.nband, self.nkpt, self.nr
+        self.coefs = model.get_coefs(eigens)
 
         # Filter high-frequency.
         self.rcut, self.rsigma = None, None
@@ -178,8 +602,7 @@ class SkwInterpolator():
             if self.verbose:
                 print("Applying filter (Eq 9 of PhysRevB.61.1639) with rcut:", self.rcut, ", rsigma", self.rsigma)
             from scipy.special import erfc
-            for ir in range(1, nr):
-                self.coefs[:, :, ir] *= 0.5 * erfc((np.sqrt(r2vals[ir]) - self.rcut) / self.rsigma)
+            self.coefs[:, :, 1:] *= 0.5 * erfc((np.sqrt(r2vals[1:]) - self.rcut) / self.rsigma)
 
         # Prepare workspace arrays for star functions.
         self.cached_kpt = np.ones(3) * np.inf
@@ -187,16 +610,16 @@ class SkwInterpolator():
         self.cached_kpt_dk2 = np.ones(3) * np.inf
 
         # Compare ab-initio data with interpolated results.
-        mae = 0.0
-        for spin in range(nsppol):
-            for ik, kpt in enumerate(kpts):
-                skw_eb = self.eval_sk(spin, kpt)
-                mae += np.abs(eigens[spin, ik] - skw_eb).sum()
-                if self.verbose >= 10:
-                    # print interpolated eigenvales
+        skw_ekb = np.matmul(self.skr, np.transpose(self.coefs, (0, 2, 1)))
+        if not self.iscomplexobj: skw_ekb = skw_ekb.real
+        mae = np.abs(eigens - skw_ekb).sum()
+        if self.verbose >= 10:
+            # print interpolated eigenvales
+            for spin in range(nsppol):
+                for ik in range(nkpt):
                     for band in range(self.nband):
                         e0 = eigens[spin, ik, band]
-                        eskw = skw_eb[band]
+                        eskw = skw_ekb[spin, ik, band]
                         print("spin", spin, "band", band, "ikpt", ik, "e0", e0, "eskw", eskw, "diff", e0 - eskw)
 
         mae *= 1e3 / (nsppol * nkpt * nband)
@@ -229,15 +652,19 @@ class SkwInterpolator():
 
         return "\n".join(lines)
 
-    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False):
+    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False, chunk=None):
         """
         Interpolate energies on an arbitrary set of k-points. Optionally, compute
         gradients and Hessian matrices.
 
+        The star functions (and their derivatives) are built for a block of k-points
+        at once and contracted with the coefficients as matrix-matrix products.
+
         Args:
             kfrac_coords: K-points in reduced coordinates.
             dk1 (bool): True if gradient is wanted.
             dk2 (bool): True to compute 2nd order derivatives.
+            chunk: Number of k-points per block. Default: blocks of about 64 MB of star functions.
 
         Return:
             namedtuple with:
@@ -251,17 +678,31 @@ class SkwInterpolator():
 
         kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
         new_nkpt = len(kfrac_coords)
-        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband))
-
-        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3))
-        dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3))
-
-        der1, der2 = None, None
-        for spin in range(self.nsppol):
-            for ik, newk in enumerate(kfrac_coords):
-                if dk1: der1 = dedk[spin, ik]
-                if dk2: der2 = dedk2[spin, ik]
-                new_eigens[spin, ik] = self.eval_sk(spin, newk, der1=der1, der2=der2)
+        dtype = complex if self.iscomplexobj else float
+        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband), dtype=dtype)
+
+        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3), dtype=dtype)
+        dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3), dtype=dtype)
+
+        if chunk is None:
+            ncomp = 1 + 3 * bool(dk1) + 9 * bool(dk2)
+            chunk = max(1, (1 << 22) // (ncomp * self.nr))
+
+        for k0 in range(0, new_nkpt, chunk):
+            kslice = slice(k0, k0 + chunk)
+            skr, skr_dk1, skr_dk2 = self.get_stark_derivs(kfrac_coords[kslice], dk1=dk1, dk2=dk2)
+            nk = len(skr)
+            for spin in range(self.nsppol):
+                # [NK, NR] x [NR, NB]
+                coefs_t = self.coefs[spin].T
+                value = np.matmul(skr, coefs_t)
+                new_eigens[spin, kslice] = value if self.iscomplexobj else value.real
+                if dk1:
+                    value = np.matmul(skr_dk1.reshape(nk * 3, self.nr), coefs_t).reshape(nk, 3, self.nband)
+                    dedk[spin, kslice] = np.moveaxis(value if self.iscomplexobj else value.real, 1, 2)
+                if dk2:
+                    value = np.matmul(skr_dk2.reshape(nk * 9, self.nr), coefs_t).reshape(nk, 3, 3, self.nband)
+                    dedk2[spin, kslice] = np.moveaxis(value if self.iscomplexobj else value.real, 3, 1)
 
         if self.verbose:
             print("Interpolation completed in %.3f (s)" % (time.time() - start))
@@ -303,25 +744,21 @@ class SkwInterpolator():
         Return:
             oeigs[nband]
         """
+        skr, skr_dk1, skr_dk2 = self.get_stark_derivs(np.reshape(kpt, (1, 3)),
+                                                      dk1=der1 is not None, dk2=der2 is not None)
         # [NB, NR] x [NR]
-        oeigs = np.matmul(self.coefs[spin], self.get_stark(kpt))
+        oeigs = np.matmul(self.coefs[spin], skr[0])
         if not self.iscomplexobj: oeigs = oeigs.real
 
         if der1 is not None:
-            skr_dk1 = self.get_stark_dk1(kpt)
-            for ii in range(3):
-                value = np.matmul(self.coefs[spin, :, :], skr_dk1[ii])
-                if not self.iscomplexobj: value = value.real
-                der1[:, ii] = value
+            # [NB, NR] x [NR, 3]
+            value = np.matmul(self.coefs[spin], skr_dk1[0].T)
+            der1[:] = value if self.iscomplexobj else value.real
 
         if der2 is not None:
-            skr_dk2 = self.get_stark_dk2(kpt)
-            for jj in range(3):
-                for ii in range(jj + 1):
-                    value = np.matmul(self.coefs[spin, :, :], skr_dk2[ii,jj])
-                    if not self.iscomplexobj: value = value.real
-                    der2[:, ii, jj] = value
-                    if ii != jj: der2[jj, ii] = der2[ii, jj]
+            # [NB, NR] x [NR, 3, 3]
+            value = np.matmul(self.coefs[spin], skr_dk2[0].reshape(9, self.nr).T).reshape(self.nband, 3, 3)
+            der2[:] = value if self.iscomplexobj else value.real
 
         return oeigs
 
@@ -370,208 +807,6 @@ class SkwInterpolator():
 
     #    return oeig, der1, der2
 
-    def get_stark(self, kpt) -> np.ndarray:
-        """
-        Return the star function for k-point `kpt`.
-
-        Args:
-            kpt: K-point in reduced coordinates.
-
-        Return:
-            complex array of shape [self.nr]
-        """
-        two_pi = 2.0 * np.pi
-        skr = np.zeros(self.nr, dtype=complex)
-        _np_exp = np.exp
-        for omat in self.ptg_symrel:
-            sk = two_pi * np.matmul(omat.T, kpt)
-            skr += _np_exp(1.j * np.matmul(self.rpts, sk))
-        skr /= self.ptg_nsym
-
-        return skr
-
-    def get_stark_dk1(self, kpt) -> np.ndarray:
-        """
-        Compute the 1st-order derivative of the star function wrt k
-
-        Args:
-            kpt: K-point in reduced coordinates.
-
-        Return:
-            complex array [3, self.nr]  with the derivative of the
-            star function wrt k in reduced coordinates.
-        """
-        srk_dk1 = np.zeros((3, self.nr), dtype=complex)
-        two_pi = 2.0 * np.pi
-        rpts_t = self.rpts.T
-
-        for omat in self.ptg_symrel:
-            sk = two_pi * np.matmul(omat.T, kpt)
-            exp_skr = np.exp(1.j * np.matmul(self.rpts, sk))
-            for ir, rr in enumerate(self.rpts):
-                srk_dk1[:, ir] += exp_skr[ir] * np.matmul(omat, rr)
-            #for ir, or in enumerate(np.matmul(omat, rpts_t).T):
-            #    srk_dk1[:, ir] += exp_skr[ir] * or
-
-        srk_dk1 *= 1.j / self.ptg_nsym
-        return srk_dk1
-
-    def get_stark_dk2(self, kpt) -> np.ndarray:
-        """
-        Compute the 2nd-order derivatives of the star function wrt k.
-
-        Args:
-            kpt: K-point in reduced coordinates.
-
-        Return:
-            Complex numpy array of shape [3, 3, self.nr] with the 2nd-order derivatives
-            of the star function wrt k in reduced coordinates.
-        """
-        srk_dk2 = np.zeros((3, 3, self.nr), dtype=complex)
-        raise NotImplementedError()
-        #work = zero
-        #do isym=1,self.ptg_nsym
-        #   sk = two_pi * matmul(transpose(self%ptg_symrel(:,:,isym)), kpt)
-        #   do ir=1,self%nr
-        #     sr = matmul(self%ptg_symrel(:,:,isym), self%rpts(:,ir))
-        #     eiskr = exp(j_dpc * dot_product(sk, self%rpts(:,ir)))
-        #     do jj=1,3
-        #        do ii=1,jj
-        #            work(ii,jj,ir) = work(ii,jj,ir) + eiskr * sr(ii) * sr(jj)
-
-        #work = - work / self.ptg_nsym
-
-        #do jj=1,3
-        #   do ii=1,jj
-        #       srk_dk2(:, ii, jj) = work(ii, jj, :)
-        #       if (ii /= jj) srk_dk2(:,jj,ii) = work(:,ii,jj)
-
-        return srk_dk2
-
-    #def find_stationary_points(self, kmesh, bstart=None, bstop=None, is_shift=None)
-    #    k = self.get_sampling(kmesh, is_shift)
-    #    if bstart is None: bstart = self.nelect // 2 - 1
-    #    if bstop is None: bstop = self.nelect // 2
-    #    nb = bstop - bstart + 1
-    #    results = []
-    #    for ik_ibz, kpt in enumerate(k.ibz):
-    #        vk_b = self.eval_dk1(kpt, bstart, bstop)
-    #        bands = []
-    #        for ib, v in enumerate(vk_b):
-    #            if v < atol: bands.append(ib + bstart)
-    #        if bands:
-    #            #results.append()
-    #            for band in bands:
-    #                d2k_b = self.eval_dk2(kpt, band)
-
-    #    return results
-
-    def _find_rstar_gen(self, nrwant, rmax) -> tuple:
-        """
-        Find all lattice points generating the stars inside the supercell defined by `rmax`
-
-        Args:
-            nrwant: Number of star-functions required.
-            rmax: numpy array with the maximum number of cells along the 3 reduced directions.
-
-        Returns:
-            tuple: (rpts, r2vals, ok)
-        """
-        msize = (2 * rmax + 1).prod()
-        rtmp = np.empty((msize, 3), dtype=int)
-        r2tmp = np.empty(msize)
-        if self.verbose: print("rmax", rmax, "msize:", msize)
-
-        start = time.time()
-        for cnt, l in enumerate(itertools.product(range(-rmax[0], rmax[0] + 1),
-                                                  range(-rmax[1], rmax[1] + 1),
-                                                  range(-rmax[2], rmax[2] + 1))):
-            rtmp[cnt] = l
-            r2tmp[cnt] = np.dot(l, np.matmul(self.rmet, l))
-
-        if self.verbose: print("gen points", time.time() - start)
-
-        start = time.time()
-        # Sort r2tmp and rtmp
-        iperm = np.argsort(r2tmp)
-        r2tmp = r2tmp[iperm]
-        rtmp = rtmp[iperm]
-        #return rtmp, r2tmp, True
-
-        # Find shells
-        r2sh = np.empty(msize, dtype=int)    # Correspondence between R and shell index.
-        shlim = np.empty(msize, dtype=int)   # For each shell, the index of the initial G-vector.
-        nsh = 1
-        r2sh[0] = 0
-        shlim[0] = 0
-        r2_prev = 0.0
-        for ir in range(1, msize):
-            if abs(r2tmp[ir] - r2_prev) > r2tmp[ir] * 1e-8:
-                r2_prev = r2tmp[ir]
-                shlim[nsh] = ir
-                nsh += 1
-            r2sh[ir] = nsh
-        shlim[nsh] = msize
-        if self.verbose:
-            print("nshells", nsh)
-            print("shells", time.time() - start)
-
-        # Find R-points generating the stars.
-        # This is the most CPU critical part. I think it's difficult to do better than this without cython
-        start = time.time()
-        rgen = deque()
-
-        for ish in range(nsh):
-            ss, ee = shlim[ish], shlim[ish + 1]
-            if ss + 1 == ee:
-                rgen.append(rtmp[ss])
-                continue
-
-            if True:
-                # This is faster
-                rs = set([tuple(rtmp[ss])])
-                for ir in range(ss + 1, ee):
-                    rvec = rtmp[ir]
-                    if all(tuple(np.matmul(rot, rvec)) not in rs for rot in self.ptg_symrel):
-                        rs.add(tuple(rvec))
-            else:
-                rs = deque([rtmp[ss]])
-                for ir in range(ss + 1, ee):
-                    for rot in self.ptg_symrel:
-                        rot_r = np.matmul(rot, rtmp[ir])
-                        if any(np.all(rot_r == x) for x in rs): break
-                    else:
-                        # We have new R-point.
-                        #print("Adding new point")
-                        rs.append(rtmp[ir])
-
-            #print(len(rs), rs)
-            rgen.extend(rs)
-        #print(rgen)
-        if self.verbose: print("stars", time.time() - start)
-
-        start = time.time()
-        rgen = np.array(rgen, dtype=int)
-        nstars = len(rgen)
-
-        # Store rpts and compute ||R||**2.
-        ok = nstars >= nrwant
-        nr = min(nstars, nrwant)
-        rpts = rgen[:nr].copy()
-        r2vals = np.empty(nr)
-        for ir in range(nr):
-            r2vals[ir] = np.dot(rpts[ir], np.matmul(self.rmet, rpts[ir]))
-
-        if self.verbose:
-            print("r2max ", rpts[nr-1])
-            print("end ", time.time() - start)
-            if self.verbose > 10:
-                print("nstars:", nstars)
-                for r, r2 in zip(rpts, r2vals):
-                    print(r, r2)
-
-        return rpts, r2vals, ok
-
 
 def extract_point_group(symrel, has_timrev) -> tuple:
     """